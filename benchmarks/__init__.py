@@ -0,0 +1,18 @@
+"""Offline benchmarks for haystackfs.
+
+bot_secrets.py asserts its config exists at import time, and Query reaches it
+through python.exceptions. Benchmarks never talk to Discord, so fill in dummy
+values for anything the environment doesn't already provide.
+"""
+import os
+
+for _name in (
+    "ERROR_CHANNEL_ID",
+    "SEARCH_METRICS_CHANNEL_ID",
+    "EXPORT_METRICS_CHANNEL_ID",
+    "DELETE_METRICS_CHANNEL_ID",
+    "SERVER_COUNT_CHANNEL_ID",
+):
+    os.environ.setdefault(_name, "1")
+os.environ.setdefault("DB_NAME", "production")
+os.environ.setdefault("DISCORD_TOKEN", "x")
@@ -0,0 +1,148 @@
+"""In-process fakes for driving the pagination callbacks without Discord.
+
+`handle_next_click` and `handle_back_click` read the clicking user, defer
+the interaction, edit the results message and send ephemeral followups. The
+fakes here record those calls and keep the message's embed and components
+the way Discord echoes them back, so `_rerender` sees realistic state.
+`stub_fsearch` stands in for the search a Next click runs for a page that
+isn't stored yet: it sleeps for a configurable latency and returns a page
+of synthetic files, with a cursor until `pages` pages have been served.
+"""
+import asyncio
+import json
+from types import SimpleNamespace
+from typing import List, Optional
+
+import discord
+
+from python.cluster import ShardStats
+from python.models.query import Query
+from python.search.admission import AdmissionController
+from python.search.search_models import SearchResult, SearchResults
+from python.views.file_view import build_page_payload
+
+
+class FakeResultsMessage:
+    """A results message: its embeds and component rows, as last edited."""
+
+    def __init__(self, message_id: int, payload: dict):
+        self.id = message_id
+        self.embeds = [discord.Embed.from_dict(payload["embed"])]
+        self.components = [_Row(row) for row in payload["components"]]
+        self.content = None
+        self.edits = 0
+
+    async def edit(self, *, content=None, embed=None, view=...):
+        self.edits += 1
+        if content is not None:
+            self.content = content
+        if embed is not None:
+            self.embeds = [embed]
+        if view is None:
+            self.components = []
+        elif view is not ...:
+            self.components = [_Row(row) for row in view.to_components()]
+        return self
+
+
+class _Row:
+    def __init__(self, data: dict):
+        self.data = data
+
+    def to_dict(self) -> dict:
+        return self.data
+
+
+class _Response:
+    def __init__(self):
+        self.deferred = False
+        self.sent: List[str] = []
+
+    async def defer(self):
+        self.deferred = True
+
+    async def send_message(self, content: str, ephemeral: bool = False):
+        self.sent.append(content)
+
+    def is_done(self) -> bool:
+        return self.deferred or bool(self.sent)
+
+
+class _Followup:
+    def __init__(self):
+        self.sent: List[str] = []
+
+    async def send(self, content: str = None, ephemeral: bool = False, **kwargs):
+        self.sent.append(content)
+
+
+# Admission limits that never hold a click back, unless a test passes its own controller.
+_UNLIMITED = 1 << 30
+
+
+class FakeClickClient:
+    """The bot, as seen by the callbacks: a store, a searcher, admission control and a user to sign embeds."""
+
+    def __init__(self, pagination_store, search_client=None, admission: Optional[AdmissionController] = None):
+        self.pagination_store = pagination_store
+        self.search_client = search_client
+        self.admission = admission or AdmissionController(*(_UNLIMITED,) * 6)
+        self.shard_stats = ShardStats()
+        self.user = SimpleNamespace(name="haystack", display_avatar=SimpleNamespace(url="https://example.invalid/a.png"))
+
+
+class FakeClickInteraction:
+    """A click on a results message by `user_id`."""
+
+    def __init__(self, client: FakeClickClient, message: FakeResultsMessage, user_id: int):
+        self.client = client
+        self.message = message
+        self.user = SimpleNamespace(id=user_id)
+        self.guild = None
+        self.channel_id = 1
+        self.response = _Response()
+        self.followup = _Followup()
+
+
+def synthetic_page(page: int, files: int = 25) -> SearchResults:
+    """A page of `files` results whose ids don't collide with other pages'."""
+    base = page * 1000
+    return SearchResults(files=[
+        SearchResult(
+            objectId=base + i, author_id=1, channel_id=1, message_id=base + i, guild_id=1,
+            filename=f"page{page}_file{i}.png", content_type="image/png", created_at=0, content="",
+        )
+        for i in range(files)
+    ])
+
+
+def stub_fsearch(latency: float = 0.0, pages: Optional[int] = None):
+    """An `fsearch` replacement serving synthetic pages; the last page has no cursor."""
+    async def fsearch(interaction, search_client, query, on_progress=None) -> SearchResults:
+        await asyncio.sleep(latency)
+        cursor = next(iter(query.channel_date_map.values()), 0) if query.channel_date_map else 0
+        page = cursor + 1
+        results = synthetic_page(page)
+        if pages is None or page < pages:
+            results.channel_date_map = {1: page}
+        return results
+    return fsearch
+
+
+async def seed_row(store, client: FakeClickClient, message_id: int, user_id: int = 1):
+    """Store page 1 of a search and return its row_id and results message, as `/search` would."""
+    row_id = store.new_row_id()
+    results = synthetic_page(1)
+    results.channel_date_map = {1: 1}
+    payload = build_page_payload(results, row_id=row_id, page=1, name=client.user.name,
+                                 avatar_url=client.user.display_avatar.url)
+    page = results.to_dict()
+    page["render"] = payload
+    query = Query()
+    query.channel_date_map = results.channel_date_map
+    await store.create(
+        row_id=row_id, user_id=user_id, channel_id=1, guild_id=None, query_json=query.to_json(),
+        pages_json=json.dumps({"1": page}), last_page=-1, add_refs=[f.message_id for f in results.files],
+    )
+    await store.attach_message(row_id, message_id)
+    return row_id, FakeResultsMessage(message_id, payload)
@@ -0,0 +1,196 @@
+"""Stress test for the crawler and `/delete` over real discord.py HTTP, against `MockDiscord`.
+
+Serves a synthetic guild (or a recorded fixture) from a local mock of
+Discord's REST API, logs a client in to it, and runs `--searches` concurrent
+`DiscordSearcher.search` calls over every readable channel, each with a cold
+local index unless `--shared` is given. Then runs `--deletes` concurrent
+`/delete` commands, each locating the files in a random channel and
+deleting their messages through the cog. Requests go through discord.py's
+rate limiter and retries, so the mock's limits, latency and errors shape the
+results. Searches keep the bot's budget unless `--deadline` or
+`--max-requests` is given.
+
+Reports search latency and how many searches came back partial, requests per
+route, 429s (per route and global), injected errors and messages deleted.
+
+Usage:
+    python -m benchmarks.crawl_bench --searches 20 --messages 2000 --latency 0.05
+    python -m benchmarks.crawl_bench --route-limit 5 --advertised-limit 50   # per-route 429s
+    python -m benchmarks.crawl_bench --global-limit 20 --error-rate 0.02 --deletes 10
+    python -m benchmarks.crawl_bench --fixture fixtures/guild_123.json.gz --out crawl.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import random
+import time
+from dataclasses import asdict
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from python.cogs.haystack_cog import Haystackfs
+from python.models.query import Query
+from python.search.discord_searcher import DiscordSearcher
+
+from .fixtures import load_fixture
+from .mock_discord import DELETE_ROUTE, HISTORY_ROUTE, MockDiscord
+from .search_bench import summarize_latencies
+from .synthetic import FakeInteraction, GuildSpec, build_guild
+
+
+def make_searcher(deadline: Optional[float], max_requests: Optional[int]) -> DiscordSearcher:
+    searcher = DiscordSearcher()
+    if deadline is not None:
+        searcher.deadline_seconds = deadline
+    if max_requests is not None:
+        searcher.max_requests = max_requests
+    return searcher
+
+
+async def run(server: MockDiscord, searches: int, deletes: int, shared: bool, filename: Optional[str],
+              deadline: Optional[float], max_requests: Optional[int], seed: int) -> dict:
+    rng = random.Random(seed)
+    async with server.client() as bot:
+        channels = bot.readable_channels()
+        shared_searcher = make_searcher(deadline, max_requests) if shared else None
+        latencies: List[float] = []
+        partial = 0
+        files = 0
+
+        async def search():
+            nonlocal partial, files
+            searcher = shared_searcher or make_searcher(deadline, max_requests)
+            start = time.perf_counter()
+            found = await searcher.search(onii_chans=channels, query=Query(filename=filename), readable=True)
+            latencies.append(time.perf_counter() - start)
+            partial += found.partial
+            files += len(found.files)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(search() for _ in range(searches)))
+        search_seconds = time.perf_counter() - start
+        search_stats = dict(server.stats)
+
+        cog = Haystackfs(bot, make_searcher(deadline, max_requests))
+        delete_latencies: List[float] = []
+        deleted = 0
+
+        async def delete():
+            nonlocal deleted
+            channel = rng.choice(channels)
+            interaction = FakeInteraction(None, channel, server.guild.me)
+            start = time.perf_counter()
+            located = await cog.locate(interaction=interaction, query=Query(filename=filename))
+            deleted += len(await cog.delete_files(located.files or []))
+            delete_latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(delete() for _ in range(deletes)))
+    return {
+        "searches": searches,
+        "search_seconds": search_seconds,
+        "search_latency_ms": summarize_latencies(latencies),
+        "partial_searches": partial,
+        "files_per_search": files / searches if searches else 0.0,
+        "history_requests_per_search": search_stats.get(HISTORY_ROUTE, 0) / searches if searches else 0.0,
+        "deletes": deletes,
+        "delete_latency_ms": summarize_latencies(delete_latencies),
+        "files_deleted": deleted,
+        "server": dict(server.stats),
+    }
+
+
+def print_report(report: dict) -> None:
+    r = report["results"]
+    s = r["server"]
+    if r["searches"]:
+        lat = r["search_latency_ms"]
+        print(f"{r['searches']} searches in {r['search_seconds']:.2f}s: p50 {lat['p50']:.0f}ms, "
+              f"p99 {lat['p99']:.0f}ms, {r['partial_searches']} partial, "
+              f"{r['files_per_search']:.1f} files and {r['history_requests_per_search']:.1f} history requests each")
+    if r["deletes"]:
+        lat = r["delete_latency_ms"]
+        print(f"{r['deletes']} deletes: p50 {lat['p50']:.0f}ms, p99 {lat['p99']:.0f}ms, "
+              f"{r['files_deleted']} files deleted ({s.get(DELETE_ROUTE, 0)} messages)")
+    print(f"{s.get('requests', 0)} requests, {s.get('429_route', 0)} route 429s, "
+          f"{s.get('429_global', 0)} global 429s, {s.get('errors', 0)} injected errors")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--channels", type=int, default=GuildSpec.text_channels)
+    parser.add_argument("--forums", type=int, default=GuildSpec.forum_channels)
+    parser.add_argument("--threads", type=int, default=GuildSpec.threads_per_forum, help="threads per forum")
+    parser.add_argument("--messages", type=int, default=GuildSpec.messages_per_channel, help="messages per channel")
+    parser.add_argument("--attachment-ratio", type=float, default=GuildSpec.attachment_ratio)
+    parser.add_argument("--fixture", help="serve a recorded guild fixture instead of a synthetic guild")
+    parser.add_argument("--searches", type=int, default=10, help="concurrent searches")
+    parser.add_argument("--shared", action="store_true", help="run every search on one searcher and local index")
+    parser.add_argument("--filename", help="search for this filename; one nothing matches crawls everything")
+    parser.add_argument("--deadline", type=float, help="seconds a search may take, instead of the bot's budget")
+    parser.add_argument("--max-requests", type=int, help="history requests a search may make")
+    parser.add_argument("--deletes", type=int, default=0, help="concurrent /delete commands after the searches")
+    parser.add_argument("--route-limit", type=int, default=50, help="requests per route and channel per window")
+    parser.add_argument("--route-window", type=float, default=1.0, help="seconds per route window")
+    parser.add_argument("--advertised-limit", type=int, help="route limit to report in headers, if higher")
+    parser.add_argument("--global-limit", type=int, default=50, help="requests per second across routes, 0 for none")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many more seconds per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail with a 5xx")
+    parser.add_argument("--seed", type=int, default=GuildSpec.seed)
+    parser.add_argument("--verbose", action="store_true", help="show discord.py's rate limit warnings")
+    parser.add_argument("--out", help="write the JSON report here")
+    return parser
+
+
+async def _main(args, spec: GuildSpec) -> dict:
+    guild = load_fixture(args.fixture) if args.fixture else build_guild(spec)
+    server = MockDiscord(
+        guild,
+        route_limit=args.route_limit,
+        route_window=args.route_window,
+        advertised_limit=args.advertised_limit,
+        global_limit=args.global_limit or None,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    async with server:
+        return await run(server, args.searches, args.deletes, args.shared, args.filename,
+                         args.deadline, args.max_requests, args.seed)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if not args.verbose:
+        logging.getLogger("discord.http").setLevel(logging.ERROR)
+    spec = GuildSpec(
+        text_channels=args.channels,
+        forum_channels=args.forums,
+        threads_per_forum=args.threads,
+        messages_per_channel=args.messages,
+        attachment_ratio=args.attachment_ratio,
+        seed=args.seed,
+    )
+    results = asyncio.run(_main(args, spec))
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "spec": None if args.fixture else asdict(spec),
+            **{k: v for k, v in vars(args).items() if k not in ("out", "verbose")},
+        },
+        "results": results,
+    }
+    print_report(report)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
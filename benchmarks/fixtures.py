@@ -0,0 +1,112 @@
+"""Record live `history()` pages and replay them offline.
+
+`python.search.recording.RecordingSearcher` is a drop-in `DiscordSearcher`
+that captures the messages it pages through, stripped down to the fields
+`SearchResult.from_discord_attachment` reads, as a gzip'd JSON fixture per
+guild. `load_fixture` turns a fixture back into a `FakeGuild` of
+`ReplayChannel`s that serve the same pages deterministically, either with the
+recorded inter-page delays or with none.
+
+Fixture layout (version 1):
+    {
+        "version": 1,
+        "guild": {"id": ..., "name": ...},
+        "channels": [
+            {
+                "id": ..., "name": ..., "parent_id": ... or null, "readable": true,
+                "page_delays": [seconds, ...],
+                "messages": [[id, author_id, content, [[attachment_id, filename, content_type], ...]], ...]
+            }
+        ]
+    }
+Messages are stored newest-first and only messages with attachments keep
+their content, since the searcher never reads anything else.
+"""
+import asyncio
+import gzip
+import json
+from typing import Dict, List
+
+from python.search.recording import FIXTURE_VERSION, HistoryRecorder, RecordingSearcher  # noqa: F401
+
+from .synthetic import (
+    FakeAttachment,
+    FakeForumChannel,
+    FakeGuild,
+    FakeMessage,
+    FakeTextChannel,
+    FakeThread,
+    FakeUser,
+)
+
+
+class ReplayChannel(FakeTextChannel):
+    """Serves recorded messages through the same `history()` semantics as the fakes.
+
+    With `timing="recorded"`, page `n` sleeps for the `n`-th recorded delay
+    (cycling if the replay reads further than the recording did); with
+    `timing="none"` pages are served back to back.
+    """
+
+    def __init__(self, *args, page_delays: List[float] = None, timing: str = "none", **kwargs):
+        super().__init__(*args, **kwargs)
+        self.page_delays = page_delays or []
+        self.timing = timing
+        self._page_index = 0
+
+    async def _fetch_page(self, page):
+        if self.timing == "recorded" and self.page_delays:
+            delay = self.page_delays[self._page_index % len(self.page_delays)]
+            self._page_index += 1
+            self.requests += 1
+            await asyncio.sleep(delay)
+            return page
+        return await super()._fetch_page(page)
+
+    def reset_counters(self) -> None:
+        super().reset_counters()
+        self._page_index = 0
+
+
+class ReplayThread(ReplayChannel, FakeThread):
+    pass
+
+
+def load_fixture(path: str, *, timing: str = "none") -> FakeGuild:
+    """Rebuild a `FakeGuild` from a fixture written by `HistoryRecorder.save`."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        payload = json.load(f)
+    if payload.get("version") != FIXTURE_VERSION:
+        raise ValueError(f"Unsupported fixture version {payload.get('version')!r} in {path}")
+
+    guild_info = payload["guild"]
+    guild = FakeGuild(guild_info["id"] or 0, guild_info["name"])
+    authors: Dict[int, FakeUser] = {}
+    forums: Dict[int, FakeForumChannel] = {}
+
+    for data in payload["channels"]:
+        common = dict(readable=data["readable"], page_delays=data["page_delays"], timing=timing)
+        if data["parent_id"] is not None:
+            forum = forums.get(data["parent_id"])
+            if forum is None:
+                forum = FakeForumChannel(data["parent_id"], data.get("parent_name") or str(data["parent_id"]), guild)
+                forums[forum.id] = forum
+                guild.forums.append(forum)
+            channel = ReplayThread(data["id"], data["name"], guild, forum, **common)
+            forum.threads.append(channel)
+        else:
+            channel = ReplayChannel(data["id"], data["name"], guild, **common)
+            guild.text_channels.append(channel)
+
+        for message_id, author_id, content, attachments in data["messages"]:
+            author = authors.setdefault(author_id, FakeUser(author_id))
+            channel.messages.append(FakeMessage(
+                message_id,
+                channel,
+                author,
+                content,
+                [FakeAttachment(a_id, filename, content_type, channel.id) for a_id, filename, content_type in attachments],
+            ))
+
+    guild.members = list(authors.values())
+    return guild
@@ -0,0 +1,378 @@
+"""A local stand-in for Discord's REST API, for stress-testing the crawler offline.
+
+`MockDiscord` is an aiohttp server that serves a `FakeGuild` (synthetic, or
+loaded from a fixture) through the endpoints the bot uses to read and delete
+history: channel message history, fetching and deleting one message, and
+the two calls `Client.login` makes. It enforces rate limits the way Discord
+does, and can be made slow and flaky:
+
+- every route has a bucket per channel, `route_limit` requests per
+  `route_window` seconds (`limits` overrides that per route), answered with
+  `X-RateLimit-Limit`, `-Remaining`, `-Reset`, `-Reset-After` and `-Bucket`
+  headers. `advertised_limit` makes the headers claim more than is enforced,
+  like Discord's sub-ratelimits, so a client that trusts them gets 429s;
+- `global_limit` requests per `global_window` seconds across all routes, over
+  which requests get a global 429;
+- each request waits `latency` seconds plus up to `jitter` more, and fails
+  with one of `error_statuses` with probability `error_rate`.
+
+`pointed_at(server)` points discord.py at the server by swapping
+`discord.http.Route.BASE`, which every route's URL is built from, and
+`server.client()` logs a `MockBot` in through it. `MockBot` looks up the
+guild's channels as `MockChannel`s, partial messageables that know whether
+the bot may read them, so `DiscordSearcher.search` and the `/delete` cog
+code run over real discord.py HTTP, rate limiting and retries included.
+Route.BASE is global, so only one server can be pointed at per process.
+"""
+import asyncio
+import contextlib
+import hashlib
+import json
+import math
+import random
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import discord
+from aiohttp import web
+from discord.http import Route
+
+from python.cluster import ShardStats
+from python.search.admission import AdmissionController
+
+from .synthetic import PAGE_SIZE, FakeGuild, FakeMessage, FakeTextChannel, FakeThread
+
+
+API_PREFIX = "/api/v10"
+MOCK_TOKEN = "mock-token"
+
+HISTORY_ROUTE = "GET /channels/{channel_id}/messages"
+MESSAGE_ROUTE = "GET /channels/{channel_id}/messages/{message_id}"
+DELETE_ROUTE = "DELETE /channels/{channel_id}/messages/{message_id}"
+
+UNKNOWN_CHANNEL = 10003
+UNKNOWN_MESSAGE = 10008
+MISSING_ACCESS = 50001
+
+
+class _Bucket:
+    __slots__ = ("remaining", "reset_at")
+
+    def __init__(self):
+        self.remaining = 0
+        self.reset_at = 0.0
+
+    def take(self, limit: int, window: float, now: float) -> Optional[float]:
+        """Spend a request; returns seconds until the window resets if none are left."""
+        if now >= self.reset_at:
+            self.remaining = limit
+            self.reset_at = now + window
+        if self.remaining <= 0:
+            return self.reset_at - now
+        self.remaining -= 1
+        return None
+
+
+def _json(body, status: int = 200, headers: Optional[Dict[str, str]] = None) -> web.Response:
+    # discord.py only decodes a body whose content type is exactly this, without a charset.
+    return web.Response(body=json.dumps(body).encode(), status=status,
+                        headers={**(headers or {}), "Content-Type": "application/json"})
+
+
+def _error(status: int, message: str, code: int) -> web.Response:
+    return _json({"message": message, "code": code}, status=status)
+
+
+def user_payload(user_id: int, name: str, bot: bool = False) -> dict:
+    return {"id": str(user_id), "username": name, "discriminator": "0", "global_name": None,
+            "avatar": None, "bot": bot}
+
+
+def message_payload(message: FakeMessage) -> dict:
+    """The JSON Discord returns for a message, with the fields discord.py requires."""
+    return {
+        "id": str(message.id),
+        "channel_id": str(message.channel.id),
+        "type": 0,
+        "author": user_payload(message.author.id, message.author.name),
+        "content": message.content,
+        "timestamp": message.created_at.isoformat(),
+        "edited_timestamp": None,
+        "tts": False,
+        "mention_everyone": False,
+        "mentions": [],
+        "mention_roles": [],
+        "attachments": [
+            {"id": str(a.id), "filename": a.filename, "content_type": a.content_type, "size": 0,
+             "url": a.url, "proxy_url": a.url}
+            for a in message.attachments
+        ],
+        "embeds": [],
+        "pinned": False,
+    }
+
+
+class MockDiscord:
+
+    def __init__(
+        self,
+        guild: FakeGuild,
+        *,
+        route_limit: int = 50,
+        route_window: float = 1.0,
+        limits: Optional[Dict[str, Tuple[int, float]]] = None,
+        advertised_limit: Optional[int] = None,
+        global_limit: Optional[int] = 50,
+        global_window: float = 1.0,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_statuses: Iterable[int] = (500, 502),
+        seed: int = 0,
+    ):
+        """
+        Create a MockDiscord serving `guild`.
+
+        Args:
+            guild: The channels and messages to serve
+            route_limit: Requests per bucket (route and channel) per window
+            route_window: Seconds until a bucket resets
+            limits: `(limit, window)` per route, e.g. `{DELETE_ROUTE: (5, 5.0)}`
+            advertised_limit: The bucket limit to report in headers, if not `route_limit`
+            global_limit: Requests per global window across routes; None for no global limit
+            global_window: Seconds until the global limit resets
+            latency: Seconds every request takes
+            jitter: Up to this many more seconds, at random
+            error_rate: Probability that a request fails with a server error
+            error_statuses: Statuses to fail with
+            seed: RNG seed for jitter and errors
+        """
+        self.guild = guild
+        self.channels: Dict[int, FakeTextChannel] = {c.id: c for c in guild.searchable_channels}
+        self.route_limit = route_limit
+        self.route_window = route_window
+        self.limits = limits or {}
+        self.advertised_limit = advertised_limit
+        self.global_limit = global_limit
+        self.global_window = global_window
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.rng = random.Random(seed)
+        self.stats: Counter = Counter()
+        self._buckets: Dict[Tuple[str, str], _Bucket] = {}
+        self._global = _Bucket()
+        self._runner: Optional[web.AppRunner] = None
+        self.base_url: Optional[str] = None
+
+        app = web.Application(middlewares=[self._middleware])
+        app.router.add_get(API_PREFIX + "/users/@me", self._me)
+        app.router.add_get(API_PREFIX + "/oauth2/applications/@me", self._application)
+        app.router.add_get(API_PREFIX + "/channels/{channel_id}", self._channel)
+        app.router.add_get(API_PREFIX + "/channels/{channel_id}/messages", self._history)
+        app.router.add_get(API_PREFIX + "/channels/{channel_id}/messages/{message_id}", self._message)
+        app.router.add_delete(API_PREFIX + "/channels/{channel_id}/messages/{message_id}", self._delete)
+        self.app = app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Listen on `host:port` (any free port by default) and return the API base URL."""
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        self.base_url = f"http://{host}:{port}{API_PREFIX}"
+        return self.base_url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self) -> "MockDiscord":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.stop()
+
+    @contextlib.asynccontextmanager
+    async def client(self):
+        """Yield a `MockBot` logged in to this server; discord.py is pointed here until it exits."""
+        with pointed_at(self):
+            bot = MockBot(self.guild)
+            try:
+                await bot.login(MOCK_TOKEN)
+                yield bot
+            finally:
+                await bot.close()
+
+    def _limit_for(self, route: str) -> Tuple[int, float]:
+        return self.limits.get(route, (self.route_limit, self.route_window))
+
+    def _rate_limited(self, retry_after: float, is_global: bool, headers: Dict[str, str]) -> web.Response:
+        self.stats["429_global" if is_global else "429_route"] += 1
+        headers = {**headers, "Retry-After": str(math.ceil(retry_after)),
+                   "X-RateLimit-Scope": "global" if is_global else "user"}
+        if is_global:
+            headers["X-RateLimit-Global"] = "true"
+        body = {"message": "You are being rate limited.", "retry_after": round(retry_after, 3),
+                "global": is_global, "code": 0}
+        return _json(body, status=429, headers=headers)
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler) -> web.StreamResponse:
+        response = await self._limited(request, handler)
+        # discord.py treats a 429 without Via as a Cloudflare ban.
+        response.headers["Via"] = "1.1 google"
+        return response
+
+    async def _limited(self, request: web.Request, handler) -> web.StreamResponse:
+        self.stats["requests"] += 1
+        if request.headers.get("Authorization") != f"Bot {MOCK_TOKEN}":
+            return _error(401, "401: Unauthorized", 0)
+        delay = self.latency + (self.rng.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+
+        now = time.monotonic()
+        if self.global_limit is not None:
+            retry_after = self._global.take(self.global_limit, self.global_window, now)
+            if retry_after is not None:
+                return self._rate_limited(retry_after, True, {})
+
+        resource = request.match_info.route.resource
+        template = resource.canonical[len(API_PREFIX):] if resource is not None else request.path
+        route = f"{request.method} {template}"
+        limit, window = self._limit_for(route)
+        bucket_hash = hashlib.sha1(route.encode()).hexdigest()[:16]
+        bucket = self._buckets.setdefault((route, request.match_info.get("channel_id", "")), _Bucket())
+        retry_after = bucket.take(limit, window, now)
+        reset_after = bucket.reset_at - now
+        headers = {
+            "X-RateLimit-Limit": str(self.advertised_limit or limit),
+            "X-RateLimit-Remaining": str(max(bucket.remaining + (self.advertised_limit or limit) - limit, 0)),
+            "X-RateLimit-Reset": f"{time.time() + reset_after:.3f}",
+            "X-RateLimit-Reset-After": f"{reset_after:.3f}",
+            "X-RateLimit-Bucket": bucket_hash,
+        }
+        if retry_after is not None:
+            return self._rate_limited(retry_after, False, headers)
+
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.stats["errors"] += 1
+            response = _error(self.rng.choice(self.error_statuses), "Internal Server Error", 0)
+        else:
+            self.stats[route] += 1
+            response = await handler(request)
+        response.headers.update(headers)
+        return response
+
+    async def _me(self, request: web.Request) -> web.Response:
+        return _json(user_payload(self.guild.me.id, self.guild.me.name, bot=True))
+
+    async def _application(self, request: web.Request) -> web.Response:
+        return _json({
+            "id": str(self.guild.me.id), "name": self.guild.me.name, "description": "", "icon": None,
+            "bot_public": False, "bot_require_code_grant": False, "verify_key": "",
+            "owner": user_payload(self.guild.id, "owner"), "flags": 0,
+        })
+
+    async def _channel(self, request: web.Request) -> web.Response:
+        channel = self.channels.get(int(request.match_info["channel_id"]))
+        if channel is None:
+            return _error(404, "Unknown Channel", UNKNOWN_CHANNEL)
+        return _json({
+            "id": str(channel.id), "name": channel.name, "guild_id": str(self.guild.id),
+            "type": 11 if isinstance(channel, FakeThread) else 0,
+            "parent_id": str(channel.parent_id) if isinstance(channel, FakeThread) else None,
+        })
+
+    async def _history(self, request: web.Request) -> web.Response:
+        """Up to `limit` messages newest first: below `before`, or the oldest above `after`."""
+        channel = self.channels.get(int(request.match_info["channel_id"]))
+        if channel is None:
+            return _error(404, "Unknown Channel", UNKNOWN_CHANNEL)
+        if not channel.readable:
+            return _error(403, "Missing Access", MISSING_ACCESS)
+        limit = max(1, min(int(request.query.get("limit", 50)), PAGE_SIZE))
+        before = request.query.get("before")
+        after = request.query.get("after")
+        channel.requests += 1
+        if before is not None:
+            page = [m for m in channel.messages if m.id < int(before)][:limit]
+        elif after is not None:
+            page = [m for m in channel.messages if m.id > int(after)][-limit:]
+        else:
+            page = channel.messages[:limit]
+        channel.messages_served += len(page)
+        return _json([message_payload(m) for m in page])
+
+    def _find(self, request: web.Request):
+        channel = self.channels.get(int(request.match_info["channel_id"]))
+        if channel is None:
+            return None, _error(404, "Unknown Channel", UNKNOWN_CHANNEL)
+        if not channel.readable:
+            return None, _error(403, "Missing Access", MISSING_ACCESS)
+        message_id = int(request.match_info["message_id"])
+        for message in channel.messages:
+            if message.id == message_id:
+                return message, None
+        return None, _error(404, "Unknown Message", UNKNOWN_MESSAGE)
+
+    async def _message(self, request: web.Request) -> web.Response:
+        message, error = self._find(request)
+        if error is not None:
+            return error
+        return _json(message_payload(message))
+
+    async def _delete(self, request: web.Request) -> web.Response:
+        message, error = self._find(request)
+        if error is not None:
+            return error
+        message.channel.messages.remove(message)
+        self.stats["deleted"] += 1
+        return web.Response(status=204)
+
+
+@contextlib.contextmanager
+def pointed_at(server: MockDiscord):
+    """Send discord.py's REST requests to `server` instead of Discord."""
+    original = Route.BASE
+    Route.BASE = server.base_url
+    try:
+        yield
+    finally:
+        Route.BASE = original
+
+
+class MockChannel(discord.PartialMessageable):
+    """A partial messageable that knows whether the bot can read it, as the catalog would."""
+
+    def __init__(self, state, channel: FakeTextChannel, guild_id: int):
+        super().__init__(state=state, id=channel.id, guild_id=guild_id)
+        self.name = channel.name
+        self.readable = channel.readable
+
+    def permissions_for(self, obj=None, /) -> discord.Permissions:
+        return discord.Permissions(read_message_history=self.readable)
+
+
+class MockBot(discord.Client):
+    """A client with what the `Haystackfs` cog reads off the bot, whose channels come from the mock's guild."""
+
+    def __init__(self, guild: FakeGuild):
+        super().__init__(intents=discord.Intents.none())
+        self.mock_channels: Dict[int, MockChannel] = {
+            c.id: MockChannel(self._connection, c, guild.id) for c in guild.searchable_channels
+        }
+        self.admission = AdmissionController()
+        self.shard_stats = ShardStats()
+
+    def get_channel(self, id: int, /) -> Optional[MockChannel]:
+        return self.mock_channels.get(id)
+
+    def readable_channels(self) -> List[MockChannel]:
+        return [c for c in self.mock_channels.values() if c.readable]
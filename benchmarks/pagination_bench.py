@@ -0,0 +1,194 @@
+"""Concurrency benchmark for `PaginationStore` and the Next/Back callbacks.
+
+Seeds `--rows` search results, then runs `--sessions` concurrent users, each
+clicking `--clicks` times on a random row through `handle_next_click` and
+`handle_back_click` with fake interactions (see `clicks.py`). Next clicks on
+pages that aren't stored yet run a stub search that sleeps `--search-latency`
+and returns 25 files, until a search has `--pages` pages. Fewer rows than
+sessions means users contend for rows.
+
+Reports per-click latency, time spent waiting for row locks and for the
+database, how much the database files grew and how many row locks the store
+holds at the end.
+
+Usage:
+    python -m benchmarks.pagination_bench --sessions 200 --rows 500 --clicks 20
+    python -m benchmarks.pagination_bench --sessions 200 --rows 20 --next-ratio 0.9   # hot rows
+    python -m benchmarks.pagination_bench --shards 4 --out clicks.json
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import python.views.pagination_callbacks as pagination_callbacks
+from python.persistence.pagination_store import PaginationStore
+from python.persistence.sharded_pagination_store import ShardedPaginationStore
+from python.views.pagination_callbacks import handle_back_click, handle_next_click
+
+from .clicks import FakeClickClient, FakeClickInteraction, seed_row, stub_fsearch
+from .search_bench import summarize_latencies
+
+
+STORE_METHODS = ("load", "update", "delete", "create", "attach_message")
+
+
+class _TimedLock:
+    def __init__(self, lock: asyncio.Lock, waits: List[float]):
+        self.lock = lock
+        self.waits = waits
+
+    async def __aenter__(self):
+        start = time.perf_counter()
+        await self.lock.acquire()
+        self.waits.append(time.perf_counter() - start)
+
+    async def __aexit__(self, *exc):
+        self.lock.release()
+
+
+class TimedStore:
+    """Delegates to a store, timing its calls and how long row locks take to acquire."""
+
+    def __init__(self, store):
+        self.store = store
+        self.calls: Dict[str, List[float]] = defaultdict(list)
+        self.lock_waits: List[float] = []
+
+    async def lock_for(self, row_id: str):
+        return _TimedLock(await self.store.lock_for(row_id), self.lock_waits)
+
+    def __getattr__(self, name):
+        attr = getattr(self.store, name)
+        if name not in STORE_METHODS:
+            return attr
+
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await attr(*args, **kwargs)
+            finally:
+                self.calls[name].append(time.perf_counter() - start)
+        return timed
+
+
+def db_bytes(directory: str) -> int:
+    return sum(os.path.getsize(p) for p in glob.glob(os.path.join(directory, "*.sqlite3*")))
+
+
+def lock_registry_size(store) -> int:
+    return sum(len(shard._locks) for shard in getattr(store, "shards", [store]))
+
+
+async def run(
+    sessions: int, rows: int, clicks: int, next_ratio: float, pages: int, search_latency: float,
+    shards: int, seed: int,
+) -> dict:
+    rng = random.Random(seed)
+    pagination_callbacks.fsearch = stub_fsearch(search_latency, pages)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "pagination.sqlite3")
+        raw = PaginationStore(path) if shards == 1 else ShardedPaginationStore(path, shards)
+        await raw.init()
+        store = TimedStore(raw)
+        client = FakeClickClient(store)
+        try:
+            seeded = [await seed_row(raw, client, message_id=n) for n in range(rows)]
+            size_before = db_bytes(tmp)
+            latencies: Dict[str, List[float]] = {"next": [], "back": []}
+            depths: List[int] = []
+
+            async def session():
+                row_id, message = seeded[rng.randrange(rows)]
+                for _ in range(clicks):
+                    kind = "next" if rng.random() < next_ratio else "back"
+                    handler = handle_next_click if kind == "next" else handle_back_click
+                    start = time.perf_counter()
+                    await handler(FakeClickInteraction(client, message, user_id=1), row_id)
+                    latencies[kind].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(session() for _ in range(sessions)))
+            elapsed = time.perf_counter() - start
+            for row_id, _ in seeded:
+                row = await raw.load(row_id)
+                if row is not None:
+                    depths.append(len(json.loads(row["pages_json"])))
+            size_after = db_bytes(tmp)
+            registry = lock_registry_size(raw)
+        finally:
+            await raw.close()
+    total = sum(len(v) for v in latencies.values())
+    return {
+        "clicks": total,
+        "clicks_per_s": total / elapsed,
+        "latency_ms": {kind: summarize_latencies(v) for kind, v in latencies.items() if v},
+        "lock_wait_ms": summarize_latencies(store.lock_waits),
+        "store_ms": {name: summarize_latencies(v) for name, v in sorted(store.calls.items())},
+        "db_bytes": {"before": size_before, "after": size_after, "growth": size_after - size_before},
+        "stored_pages": {"mean": sum(depths) / len(depths) if depths else 0.0, "max": max(depths, default=0)},
+        "lock_registry_size": registry,
+    }
+
+
+def print_report(report: dict) -> None:
+    r = report["results"]
+    print(f"{r['clicks']} clicks in {r['clicks'] / r['clicks_per_s']:.2f}s ({r['clicks_per_s']:.0f}/s)")
+    print(f"{'':<20}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    rows = [(f"click {kind}", s) for kind, s in r["latency_ms"].items()]
+    rows.append(("row lock wait", r["lock_wait_ms"]))
+    rows += [(f"store.{name}", s) for name, s in r["store_ms"].items()]
+    for label, s in rows:
+        print(f"{label:<20}{s['p50']:>10.2f}{s['p99']:>10.2f}{s['max']:>10.2f}")
+    growth = r["db_bytes"]
+    print(f"database {growth['before'] / 1024:.0f} KiB -> {growth['after'] / 1024:.0f} KiB, "
+          f"{r['stored_pages']['mean']:.1f} pages per search (max {r['stored_pages']['max']}), "
+          f"{r['lock_registry_size']} row locks held")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=100, help="users clicking at once")
+    parser.add_argument("--rows", type=int, default=200, help="searches to click through")
+    parser.add_argument("--clicks", type=int, default=20, help="clicks per session")
+    parser.add_argument("--next-ratio", type=float, default=0.7, help="fraction of clicks that are Next")
+    parser.add_argument("--pages", type=int, default=10, help="pages a search has before it runs out")
+    parser.add_argument("--search-latency", type=float, default=0.05, help="seconds a Next click's search takes")
+    parser.add_argument("--shards", type=int, default=1, help="pagination database files")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write the JSON report here")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    results = asyncio.run(run(
+        args.sessions, args.rows, args.clicks, args.next_ratio, args.pages, args.search_latency,
+        args.shards, args.seed,
+    ))
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            **{k: v for k, v in vars(args).items() if k != "out"},
+        },
+        "results": results,
+    }
+    print_report(report)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,300 @@
+"""Offline benchmark for `DiscordSearcher.search` and `fsearch`.
+
+Builds a synthetic guild in process, runs a matrix of query shapes against it
+and writes latency percentiles, throughput and memory figures to JSON.
+
+Usage:
+    python -m benchmarks.search_bench --messages 2000 --latency 0.05 --out bench.json
+    python -m benchmarks.search_bench --baseline bench.json   # flag regressions
+    python -m benchmarks.search_bench --fixture fixtures/guild_123.json.gz --timing recorded
+    python -m benchmarks.search_bench --long-content 0.5 --shape content   # event-loop lag under load
+"""
+import argparse
+import asyncio
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+from dataclasses import asdict
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+
+from thefuzz import fuzz
+
+from python.bot_commands import fsearch
+from python.models.query import Query
+from python.search.discord_searcher import DiscordSearcher
+from python.search.local_index import LocalIndex
+
+from .fixtures import load_fixture
+from .synthetic import FakeGuild, FakeInteraction, GuildSpec, build_guild
+
+
+REGRESSION_TOLERANCE = 0.10
+LAG_PROBE_INTERVAL = 0.005
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile; `samples` need not be sorted."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+
+def summarize_latencies(samples: List[float]) -> Dict[str, float]:
+    """Summarize per-run latencies (seconds) as milliseconds."""
+    return {
+        "p50": percentile(samples, 50) * 1000,
+        "p90": percentile(samples, 90) * 1000,
+        "p99": percentile(samples, 99) * 1000,
+        "mean": statistics.fmean(samples) * 1000 if samples else 0.0,
+        "max": max(samples, default=0.0) * 1000,
+    }
+
+
+def query_shapes(guild: FakeGuild, days: int) -> Dict[str, Callable[[], Query]]:
+    """The query matrix. Each entry builds a fresh Query so runs don't share state."""
+    today = datetime.now(timezone.utc).date()
+    after = (today - timedelta(days=max(days // 4, 1))).isoformat()
+    before = (today - timedelta(days=max(days // 8, 1))).isoformat()
+    author = guild.members[0] if guild.members else None
+    return {
+        "all": lambda: Query(),
+        "filename": lambda: Query(filename="report"),
+        "content": lambda: Query(content="homework notes"),
+        # Matches nothing, so every message's text is scored.
+        "content_miss": lambda: Query(content="quarterly budget spreadsheet"),
+        "filetype": lambda: Query(filetype="image"),
+        "custom_filetype": lambda: Query(custom_filetype="pdf"),
+        "author": lambda: Query(author=author),
+        "date_range": lambda: Query(after=after, before=before),
+        "filename+date_range": lambda: Query(filename="screenshot", after=after, before=before),
+    }
+
+
+def _channel_counters(guild: FakeGuild):
+    channels = guild.searchable_channels
+    return (
+        sum(c.messages_served for c in channels),
+        sum(c.requests for c in channels),
+    )
+
+
+def _reset_counters(guild: FakeGuild) -> None:
+    for channel in guild.searchable_channels:
+        channel.reset_counters()
+
+
+async def _probe_loop_lag(samples: List[float]) -> None:
+    """Record how late each short sleep wakes up, i.e. how long the loop was blocked."""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(LAG_PROBE_INTERVAL)
+        samples.append(max(0.0, time.perf_counter() - start - LAG_PROBE_INTERVAL))
+
+
+async def run_shape(guild: FakeGuild, target: str, make_query: Callable[[], Query], iterations: int,
+                    warm_cache: bool = False, offload_chars: Optional[int] = None,
+                    overscan: Optional[int] = None, deadline: Optional[float] = None,
+                    max_requests: Optional[int] = None) -> dict:
+    """Run one query shape `iterations` times against `search` or `fsearch`.
+
+    `fsearch` consults the searcher's result cache and both targets consult
+    its local index; unless `warm_cache` is set both are cleared before every
+    run so each run measures a full crawl. With `warm_cache`, the index treats
+    the gateway as connected, so covered channel heads need no crawl.
+    `offload_chars` overrides the searcher's fuzzy-scoring offload threshold
+    and `overscan` its ranking over-scan (at most 25 turns ranking off).
+    Searches are unbounded unless `deadline` or `max_requests` is set.
+    """
+    searcher = DiscordSearcher() if overscan is None else DiscordSearcher(overscan=overscan)
+    searcher.deadline_seconds = deadline
+    searcher.max_messages = None
+    searcher.max_requests = max_requests
+    if warm_cache:
+        searcher.local_index.connected()
+    if offload_chars is not None:
+        searcher.scorer.offload_chars = offload_chars
+    lag = []
+    interaction = FakeInteraction(guild, guild.text_channels[0], guild.members[0])
+    latencies = []
+    results = []
+    relevance = []
+    partial = 0
+    _reset_counters(guild)
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    probe = asyncio.create_task(_probe_loop_lag(lag))
+    for _ in range(iterations):
+        query = make_query()
+        if not warm_cache:
+            searcher.result_cache.clear()
+            searcher.local_index = LocalIndex()
+        start = time.perf_counter()
+        if target == "search":
+            found = await searcher.search(
+                onii_chans=guild.searchable_channels, bot_user=guild.me, query=query
+            )
+        else:
+            found = await fsearch(interaction=interaction, search_client=searcher, query=query)
+        latencies.append(time.perf_counter() - start)
+        results.append(len(found.files or []))
+        partial += found.partial
+        needle, field = (query.filename, "filename") if query.filename else (query.content, "content")
+        if needle and found.files:
+            relevance.append(statistics.fmean(fuzz.ratio(needle, getattr(f, field) or "") for f in found.files))
+    probe.cancel()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    searcher.scorer.close()
+
+    messages, requests = _channel_counters(guild)
+    elapsed = sum(latencies)
+    return {
+        "target": target,
+        "runs": iterations,
+        "latency_ms": summarize_latencies(latencies),
+        "messages_per_run": messages / iterations,
+        "requests_per_run": requests / iterations,
+        "throughput_msgs_per_s": messages / elapsed if elapsed else 0.0,
+        "queries_per_s": iterations / elapsed if elapsed else 0.0,
+        "results_per_run": statistics.fmean(results) if results else 0.0,
+        "relevance": statistics.fmean(relevance) if relevance else None,
+        "partial_runs": partial,
+        "peak_memory_kb": peak / 1024,
+        "loop_lag_ms": summarize_latencies(lag),
+        "offloaded_batches": searcher.scorer.offloaded_batches,
+    }
+
+
+async def run_matrix(spec: GuildSpec, iterations: int, shapes: Optional[List[str]] = None,
+                     fixture: Optional[str] = None, timing: str = "none", warm_cache: bool = False,
+                     offload_chars: Optional[int] = None, overscan: Optional[int] = None,
+                     deadline: Optional[float] = None, max_requests: Optional[int] = None) -> dict:
+    build_start = time.perf_counter()
+    guild = load_fixture(fixture, timing=timing) if fixture else build_guild(spec)
+    build_seconds = time.perf_counter() - build_start
+
+    matrix = query_shapes(guild, spec.days)
+    results = {}
+    for name, make_query in matrix.items():
+        if shapes and name not in shapes:
+            continue
+        for target in ("search", "fsearch"):
+            results[f"{name}/{target}"] = await run_shape(
+                guild, target, make_query, iterations, warm_cache, offload_chars, overscan, deadline, max_requests
+            )
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "spec": asdict(spec),
+            "fixture": fixture,
+            "timing": timing if fixture else None,
+            "iterations": iterations,
+            "warm_cache": warm_cache,
+            "offload_chars": offload_chars,
+            "overscan": overscan,
+            "deadline": deadline,
+            "max_requests": max_requests,
+            "guild_build_seconds": build_seconds,
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float = REGRESSION_TOLERANCE) -> List[str]:
+    """Return a line per shape whose p50 latency or throughput regressed past `tolerance`."""
+    regressions = []
+    for key, now in current["results"].items():
+        then = baseline.get("results", {}).get(key)
+        if then is None:
+            continue
+        old_p50, new_p50 = then["latency_ms"]["p50"], now["latency_ms"]["p50"]
+        if old_p50 and (new_p50 - old_p50) / old_p50 > tolerance:
+            regressions.append(f"{key}: p50 {old_p50:.1f}ms -> {new_p50:.1f}ms")
+        old_tp, new_tp = then["throughput_msgs_per_s"], now["throughput_msgs_per_s"]
+        if old_tp and (old_tp - new_tp) / old_tp > tolerance:
+            regressions.append(f"{key}: throughput {old_tp:.0f} -> {new_tp:.0f} msgs/s")
+    return regressions
+
+
+def print_report(report: dict) -> None:
+    print(f"{'shape':<32}{'p50 ms':>10}{'p99 ms':>10}{'msgs/s':>12}{'reqs':>8}{'hits':>7}{'peak KiB':>10}"
+          f"{'lag max':>9}{'score':>7}")
+    for key, r in report["results"].items():
+        print(
+            f"{key:<32}{r['latency_ms']['p50']:>10.1f}{r['latency_ms']['p99']:>10.1f}"
+            f"{r['throughput_msgs_per_s']:>12.0f}{r['requests_per_run']:>8.0f}"
+            f"{r['results_per_run']:>7.1f}{r['peak_memory_kb']:>10.0f}{r['loop_lag_ms']['max']:>9.1f}"
+            f"{r['relevance'] if r.get('relevance') is not None else float('nan'):>7.1f}"
+        )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--channels", type=int, default=GuildSpec.text_channels)
+    parser.add_argument("--forums", type=int, default=GuildSpec.forum_channels)
+    parser.add_argument("--threads", type=int, default=GuildSpec.threads_per_forum, help="threads per forum")
+    parser.add_argument("--messages", type=int, default=GuildSpec.messages_per_channel, help="messages per channel")
+    parser.add_argument("--attachment-ratio", type=float, default=GuildSpec.attachment_ratio)
+    parser.add_argument("--long-content", type=float, default=GuildSpec.long_content_ratio,
+                        help="fraction of messages with a few thousand characters of text")
+    parser.add_argument("--offload-chars", type=int,
+                        help="score fuzzy batches above this many characters in a process pool")
+    parser.add_argument("--overscan", type=int,
+                        help="matches a filename/content search ranks before keeping the best 25 (25 turns it off)")
+    parser.add_argument("--deadline", type=float, help="seconds a search may take before returning partial results")
+    parser.add_argument("--max-requests", type=int, help="history requests a search may make")
+    parser.add_argument("--filenames", choices=["zipf", "uniform"], default=GuildSpec.filename_distribution)
+    parser.add_argument("--latency", type=float, default=GuildSpec.latency, help="seconds per history page")
+    parser.add_argument("--seed", type=int, default=GuildSpec.seed)
+    parser.add_argument("--fixture", help="replay a recorded guild fixture instead of a synthetic guild")
+    parser.add_argument("--timing", choices=["none", "recorded"], default="none",
+                        help="with --fixture, replay the recorded inter-page delays or none")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--warm-cache", action="store_true",
+                        help="let repeat runs use the result cache and local index")
+    parser.add_argument("--shape", action="append", dest="shapes", help="only run these query shapes")
+    parser.add_argument("--out", help="write the JSON report here")
+    parser.add_argument("--baseline", help="compare against a previous JSON report")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    spec = GuildSpec(
+        text_channels=args.channels,
+        forum_channels=args.forums,
+        threads_per_forum=args.threads,
+        messages_per_channel=args.messages,
+        attachment_ratio=args.attachment_ratio,
+        filename_distribution=args.filenames,
+        long_content_ratio=args.long_content,
+        latency=args.latency,
+        seed=args.seed,
+    )
+    report = asyncio.run(run_matrix(
+        spec, args.iterations, args.shapes, args.fixture, args.timing, args.warm_cache, args.offload_chars,
+        args.overscan, args.deadline, args.max_requests,
+    ))
+    print_report(report)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.out}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f))
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
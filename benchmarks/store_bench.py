@@ -0,0 +1,152 @@
+"""Write-throughput benchmark for `PaginationStore` against `ShardedPaginationStore`.
+
+Creates rows the size of real search results and then runs a storm of page
+updates against them, the write a Next click makes, from many concurrent
+tasks. The same workload is repeated for each shard count, in a fresh
+temporary directory each time. Shards only help when commits can overlap:
+on several cores, or when each commit waits on the disk, so run it with
+`--dir` on the disk the bot's database lives on.
+
+Usage:
+    python -m benchmarks.store_bench --shards 1 2 4 8 --ops 4000 --concurrency 64
+    python -m benchmarks.store_bench --synchronous FULL --dir /var/lib/haystackfs   # commits bound by fsync
+    python -m benchmarks.store_bench --out store.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from python.persistence.pagination_store import PaginationStore
+from python.persistence.sharded_pagination_store import ShardedPaginationStore
+
+from .search_bench import summarize_latencies
+
+
+def make_store(path: str, shards: int):
+    return PaginationStore(path) if shards == 1 else ShardedPaginationStore(path, shards)
+
+
+def page_blob(rng: random.Random, files: int = 25) -> str:
+    """A stored page about the size of a real one: 25 files plus a rendered payload."""
+    page = {
+        "files": [
+            {"objectId": rng.getrandbits(62), "filename": f"file_{rng.getrandbits(32):x}.png",
+             "channel_id": rng.getrandbits(62), "message_id": rng.getrandbits(62)}
+            for _ in range(files)
+        ],
+        "render": {"embed": {"title": "Found 25 files", "description": "x" * 200}, "components": []},
+    }
+    return json.dumps({"1": page})
+
+
+async def run_shards(
+    shards: int, rows: int, ops: int, concurrency: int, seed: int, synchronous: str, directory: Optional[str]
+) -> dict:
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        store = make_store(os.path.join(tmp, "pagination.sqlite3"), shards)
+        await store.init()
+        for shard in getattr(store, "shards", [store]):
+            await shard._execute(f"PRAGMA synchronous={synchronous};")
+        try:
+            row_ids = []
+            for _ in range(rows):
+                row_ids.append(await store.create(
+                    user_id=1, channel_id=2, guild_id=3, query_json="{}", pages_json=page_blob(rng),
+                    add_refs=[rng.getrandbits(62) for _ in range(25)],
+                ))
+            blobs = [page_blob(rng) for _ in range(32)]
+            latencies: List[float] = []
+            queue = list(range(ops))
+
+            async def clicker():
+                while queue:
+                    n = queue.pop()
+                    row_id = row_ids[n % len(row_ids)]
+                    start = time.perf_counter()
+                    async with await store.lock_for(row_id):
+                        row = await store.load(row_id)
+                        await store.update(
+                            row_id, pages_json=blobs[n % len(blobs)], current_page=row["current_page"] + 1,
+                            last_page=-1, query_json=row["query_json"], add_refs=[n],
+                        )
+                    latencies.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(clicker() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - start
+        finally:
+            await store.close()
+    return {
+        "shards": shards,
+        "writes_per_s": ops / elapsed,
+        "latency_ms": summarize_latencies(latencies),
+        "seconds": elapsed,
+    }
+
+
+async def run_matrix(
+    shard_counts: List[int], rows: int, ops: int, concurrency: int, seed: int,
+    synchronous: str = "NORMAL", directory: Optional[str] = None,
+) -> dict:
+    results: Dict[str, dict] = {}
+    for shards in shard_counts:
+        results[str(shards)] = await run_shards(shards, rows, ops, concurrency, seed, synchronous, directory)
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "rows": rows,
+            "ops": ops,
+            "concurrency": concurrency,
+            "synchronous": synchronous,
+        },
+        "results": results,
+    }
+
+
+def print_report(report: dict) -> None:
+    base = report["results"][next(iter(report["results"]))]["writes_per_s"]
+    print(f"{'shards':>7}{'writes/s':>11}{'scaling':>9}{'p50 ms':>9}{'p99 ms':>9}")
+    for r in report["results"].values():
+        print(f"{r['shards']:>7}{r['writes_per_s']:>11.0f}{r['writes_per_s'] / base:>8.2f}x"
+              f"{r['latency_ms']['p50']:>9.1f}{r['latency_ms']['p99']:>9.1f}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--rows", type=int, default=500, help="rows to create before the click storm")
+    parser.add_argument("--ops", type=int, default=4000, help="page updates to run")
+    parser.add_argument("--concurrency", type=int, default=64, help="concurrent clickers")
+    parser.add_argument("--synchronous", choices=["OFF", "NORMAL", "FULL"], default="NORMAL",
+                        help="SQLite durability; the bot runs NORMAL, FULL fsyncs every commit")
+    parser.add_argument("--dir", help="create the databases under this directory instead of the system temp dir")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write the JSON report here")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    report = asyncio.run(run_matrix(
+        args.shards, args.rows, args.ops, args.concurrency, args.seed, args.synchronous, args.dir
+    ))
+    print_report(report)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,342 @@
+"""In-process synthetic guilds for offline search benchmarks.
+
+The fakes here implement just enough of the discord.py surface that
+`DiscordSearcher` and `fsearch` touch: `history()` paging newest-first in
+batches of 100 (oldest-first when only `after` is given, like discord.py),
+`permissions_for`, and the attachment/message attributes read by
+`SearchResult.from_discord_attachment`. Each history page sleeps for a
+configurable latency to stand in for the REST round-trip.
+"""
+import asyncio
+import random
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from discord.utils import DISCORD_EPOCH, snowflake_time, time_snowflake
+
+
+PAGE_SIZE = 100
+
+FILENAME_STEMS = [
+    "report", "invoice", "IMG", "screenshot", "lecture_notes", "meme", "final_final_v2",
+    "project-proposal", "Untitled", "recording", "backup", "assignment", "слайды", "写真",
+]
+FILENAME_EXTENSIONS = {
+    # extension: (content_type, relative weight)
+    "png": ("image/png", 30),
+    "jpg": ("image/jpeg", 25),
+    "gif": ("image/gif", 8),
+    "mp4": ("video/mp4", 6),
+    "pdf": ("application/pdf", 10),
+    "zip": ("application/zip", 4),
+    "rar": ("application/vnd.rar", 1),
+    "mp3": ("audio/mpeg", 5),
+    "wav": ("audio/x-wav", 2),
+    "txt": ("text/plain; charset=utf-8", 6),
+    "py": ("text/x-python; charset=utf-8", 3),
+}
+CONTENT_WORDS = [
+    "here", "is", "the", "file", "for", "tomorrow", "check", "this", "out", "homework",
+    "draft", "meeting", "notes", "lol", "updated", "version", "please", "review",
+]
+
+
+@dataclass
+class GuildSpec:
+    """Shape of a synthetic guild.
+
+    Args:
+        text_channels: Number of plain text channels
+        forum_channels: Number of forum channels
+        threads_per_forum: Number of threads in each forum
+        archived_threads_per_forum: Number of archived threads in each forum, listed by `archived_threads()`
+        messages_per_channel: Messages in each text channel or thread
+        attachment_ratio: Probability that a message carries attachments
+        max_attachments: Upper bound on attachments per attachment-carrying message
+        authors: Number of distinct uploaders
+        filename_distribution: `"zipf"` skews toward a few popular stems, `"uniform"` doesn't
+        long_filename_ratio: Probability that a filename gets a long random suffix
+        long_content_ratio: Probability that a message's text runs to a few thousand characters
+        unreadable_ratio: Fraction of channels the bot can't read
+        days: Span of message history, ending now
+        latency: Seconds slept per history page
+        seed: RNG seed so runs are reproducible
+    """
+    text_channels: int = 20
+    forum_channels: int = 2
+    threads_per_forum: int = 5
+    archived_threads_per_forum: int = 0
+    messages_per_channel: int = 1000
+    attachment_ratio: float = 0.2
+    max_attachments: int = 3
+    authors: int = 50
+    filename_distribution: str = "zipf"
+    long_filename_ratio: float = 0.1
+    long_content_ratio: float = 0.0
+    unreadable_ratio: float = 0.1
+    days: int = 365
+    latency: float = 0.0
+    seed: int = 0
+
+
+class FakeUser:
+    __slots__ = ("id", "name")
+
+    def __init__(self, user_id: int, name: str = "user"):
+        self.id = user_id
+        self.name = name
+
+
+class FakePermissions:
+    __slots__ = ("read_message_history",)
+
+    def __init__(self, read_message_history: bool):
+        self.read_message_history = read_message_history
+
+
+class FakeAttachment:
+    __slots__ = ("id", "filename", "content_type", "url")
+
+    def __init__(self, attachment_id: int, filename: str, content_type: Optional[str], channel_id: int):
+        self.id = attachment_id
+        self.filename = filename
+        self.content_type = content_type
+        self.url = f"https://cdn.discordapp.com/attachments/{channel_id}/{attachment_id}/{filename}"
+
+
+class FakeMessage:
+    __slots__ = ("id", "channel", "author", "content", "attachments")
+
+    def __init__(self, message_id: int, channel, author: FakeUser, content: str, attachments: List[FakeAttachment]):
+        self.id = message_id
+        self.channel = channel
+        self.author = author
+        self.content = content
+        self.attachments = attachments
+
+    @property
+    def created_at(self) -> datetime:
+        return snowflake_time(self.id)
+
+    @property
+    def guild(self):
+        return self.channel.guild
+
+    @property
+    def jump_url(self) -> str:
+        guild_segment = self.channel.guild.id if self.channel.guild is not None else "@me"
+        return f"https://discord.com/channels/{guild_segment}/{self.channel.id}/{self.id}"
+
+
+def _snowflake_bound(value, *, high: bool) -> Optional[int]:
+    """Turn a `before`/`after` argument into a snowflake the way discord.py does."""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return time_snowflake(value, high=high)
+    return value.id
+
+
+class FakeTextChannel:
+    """A text channel whose `history()` pages through an in-memory message list.
+
+    Messages are kept sorted newest-first, matching the order discord.py yields
+    them by default. `requests` and `messages_served` count simulated REST
+    calls and messages yielded so a benchmark can report throughput.
+    """
+
+    def __init__(self, channel_id: int, name: str, guild, *, readable: bool = True,
+                 latency: float = 0.0, page_size: int = PAGE_SIZE):
+        self.id = channel_id
+        self.name = name
+        self.guild = guild
+        self.readable = readable
+        self.latency = latency
+        self.page_size = page_size
+        self.messages: List[FakeMessage] = []
+        self.requests = 0
+        self.messages_served = 0
+
+    def permissions_for(self, member) -> FakePermissions:
+        return FakePermissions(read_message_history=self.readable)
+
+    async def _fetch_page(self, page: List[FakeMessage]) -> List[FakeMessage]:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        else:
+            await asyncio.sleep(0)
+        return page
+
+    async def history(self, limit: Optional[int] = 100, before=None, after=None, oldest_first: Optional[bool] = None):
+        """Yield messages like `discord.abc.Messageable.history`, one simulated request per page."""
+        before_id = _snowflake_bound(before, high=False)
+        after_id = _snowflake_bound(after, high=True)
+        if oldest_first is None:
+            oldest_first = after is not None
+
+        selected = [
+            m for m in self.messages
+            if (before_id is None or m.id < before_id) and (after_id is None or m.id > after_id)
+        ]
+        if oldest_first:
+            selected.reverse()
+        if limit is not None:
+            selected = selected[:limit]
+
+        for start in range(0, len(selected), self.page_size):
+            page = await self._fetch_page(selected[start:start + self.page_size])
+            for message in page:
+                self.messages_served += 1
+                yield message
+
+    def reset_counters(self) -> None:
+        self.requests = 0
+        self.messages_served = 0
+
+
+class FakeThread(FakeTextChannel):
+    def __init__(self, channel_id: int, name: str, guild, parent, **kwargs):
+        super().__init__(channel_id, name, guild, **kwargs)
+        self.parent = parent
+        self.parent_id = parent.id
+
+
+class FakeForumChannel:
+    def __init__(self, channel_id: int, name: str, guild):
+        self.id = channel_id
+        self.name = name
+        self.guild = guild
+        self.threads: List[FakeThread] = []
+        self.archived: List[FakeThread] = []
+        self.requests = 0
+
+    def permissions_for(self, member) -> FakePermissions:
+        return FakePermissions(read_message_history=True)
+
+    async def archived_threads(self, limit: Optional[int] = 100):
+        """Yield archived threads like `discord.ForumChannel.archived_threads`, one request per 100."""
+        threads = self.archived if limit is None else self.archived[:limit]
+        for start in range(0, max(len(threads), 1), 100):
+            self.requests += 1
+            await asyncio.sleep(0)
+            for thread in threads[start:start + 100]:
+                yield thread
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int, name: str):
+        self.id = guild_id
+        self.name = name
+        self.me = FakeUser(guild_id + 1, name="haystackfs")
+        self.text_channels: List[FakeTextChannel] = []
+        self.forums: List[FakeForumChannel] = []
+        self.members: List[FakeUser] = []
+
+    @property
+    def channels(self) -> list:
+        return [*self.text_channels, *self.forums]
+
+    @property
+    def searchable_channels(self) -> List[FakeTextChannel]:
+        """Every channel and thread that carries history."""
+        return [
+            *self.text_channels,
+            *(thread for forum in self.forums for thread in [*forum.threads, *forum.archived]),
+        ]
+
+    def get_channel(self, channel_id: int):
+        for channel in [*self.channels, *self.searchable_channels]:
+            if channel.id == channel_id:
+                return channel
+        return None
+
+
+class FakeInteraction:
+    """Just the attributes `fsearch` reads off a `discord.Interaction`."""
+
+    def __init__(self, guild: Optional[FakeGuild], channel, user: FakeUser):
+        self.guild = guild
+        self.channel = channel
+        self.channel_id = channel.id
+        self.user = user
+
+
+class _IdFactory:
+    """Hand out strictly increasing snowflakes for a given timestamp."""
+
+    def __init__(self):
+        self.increment = 0
+
+    def at(self, when: datetime) -> int:
+        self.increment = (self.increment + 1) % (1 << 12)
+        ms = int(when.timestamp() * 1000) - DISCORD_EPOCH
+        return (ms << 22) | self.increment
+
+
+def _pick_filename(rng: random.Random, spec: GuildSpec):
+    if spec.filename_distribution == "zipf":
+        weights = [1 / (rank + 1) for rank in range(len(FILENAME_STEMS))]
+        stem = rng.choices(FILENAME_STEMS, weights=weights)[0]
+    else:
+        stem = rng.choice(FILENAME_STEMS)
+    extensions = list(FILENAME_EXTENSIONS)
+    ext = rng.choices(extensions, weights=[FILENAME_EXTENSIONS[e][1] for e in extensions])[0]
+    if rng.random() < spec.long_filename_ratio:
+        stem += "_" + "".join(rng.choices("abcdefghijklmnopqrstuvwxyz0123456789_-", k=rng.randint(40, 120)))
+    elif rng.random() < 0.5:
+        stem += f"_{rng.randint(1, 9999)}"
+    return f"{stem}.{ext}", FILENAME_EXTENSIONS[ext][0]
+
+
+def _fill_channel(channel: FakeTextChannel, rng: random.Random, spec: GuildSpec,
+                  authors: List[FakeUser], ids: _IdFactory, now: datetime) -> None:
+    start = now - timedelta(days=spec.days)
+    step = (now - start) / max(spec.messages_per_channel, 1)
+    messages = []
+    for i in range(spec.messages_per_channel):
+        when = start + step * i
+        message_id = ids.at(when)
+        attachments = []
+        if rng.random() < spec.attachment_ratio:
+            for _ in range(rng.randint(1, spec.max_attachments)):
+                filename, content_type = _pick_filename(rng, spec)
+                attachments.append(FakeAttachment(ids.at(when), filename, content_type, channel.id))
+        words = rng.randint(300, 600) if rng.random() < spec.long_content_ratio else rng.randint(0, 12)
+        content = " ".join(rng.choices(CONTENT_WORDS, k=words))
+        messages.append(FakeMessage(message_id, channel, rng.choice(authors), content, attachments))
+    messages.reverse()
+    channel.messages = messages
+
+
+def build_guild(spec: GuildSpec, *, now: Optional[datetime] = None) -> FakeGuild:
+    """Generate a guild whose channels and forum threads are filled per `spec`."""
+    rng = random.Random(spec.seed)
+    now = now or datetime.now(timezone.utc)
+    ids = _IdFactory()
+
+    guild = FakeGuild(ids.at(now - timedelta(days=spec.days + 1)), f"synthetic-{spec.seed}")
+    authors = [FakeUser(ids.at(now - timedelta(days=spec.days + 1)), f"user{i}") for i in range(spec.authors)]
+    guild.members = authors
+
+    def readable():
+        return rng.random() >= spec.unreadable_ratio
+
+    for i in range(spec.text_channels):
+        channel = FakeTextChannel(ids.at(now), f"channel-{i}", guild, readable=readable(), latency=spec.latency)
+        _fill_channel(channel, rng, spec, authors, ids, now)
+        guild.text_channels.append(channel)
+
+    for i in range(spec.forum_channels):
+        forum = FakeForumChannel(ids.at(now), f"forum-{i}", guild)
+        for j in range(spec.threads_per_forum):
+            thread = FakeThread(ids.at(now), f"thread-{i}-{j}", guild, forum, readable=readable(), latency=spec.latency)
+            _fill_channel(thread, rng, spec, authors, ids, now)
+            forum.threads.append(thread)
+        for j in range(spec.archived_threads_per_forum):
+            thread = FakeThread(ids.at(now), f"archived-{i}-{j}", guild, forum, readable=readable(), latency=spec.latency)
+            _fill_channel(thread, rng, spec, authors, ids, now)
+            forum.archived.append(thread)
+        guild.forums.append(forum)
+    return guild
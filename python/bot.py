@@ -1,54 +1,66 @@
 """Main Bot Controller."""
-import json
+import time
+_PROCESS_STARTED = time.perf_counter()
+
 import os
 from python.bot_secrets import DISCORD_TOKEN, TEST_DISCORD_TOKEN, DB_NAME, GUILD_ID
 import logging
 import discord
 from datetime import datetime
 import asyncio
+import io
 from typing import Literal, Optional
+from discord import app_commands
 from discord.ext import commands
 from discord.ext.commands import Greedy, Context
-from python.messages import RELOAD_DESCRIPTION
+from python.messages import PROFILE_ALREADY_RUNNING, PROFILE_DESCRIPTION, PROFILE_OWNER_ONLY, RELOAD_DESCRIPTION
 from python.cogs.haystack_cog import setup as haystack_setup
 from python.cogs.admin_cog import setup as admin_setup
 from python.cogs.help_cog import setup as help_setup
-from python.persistence.pagination_store import PaginationStore
+from python.cluster import ClusterConfig, ShardStats, health_loop
+from python.diagnostics.loop_watchdog import LoopWatchdog
+from python.diagnostics.memory_report import MemoryMonitor
+from python.diagnostics.sampling_profiler import MAX_SECONDS as MAX_PROFILE_SECONDS, ProfileAlreadyRunning, SamplingProfiler
+from python.persistence.pagination_store import DEFAULT_TTL_SECONDS, PaginationStore
+from python.persistence.sharded_pagination_store import ShardedPaginationStore
+from python.persistence.facet_store import FacetStore
+from python.search.facets import FacetIndexer, reconcile_loop
+from python.search.admission import AdmissionController
 from python.search.discord_searcher import DiscordSearcher
-from python.search.search_models import SearchResults
-from python.views.file_view import FileView
+from python.search.scoring import MAX_WORKERS as MAX_SCORING_WORKERS
 
 
 DB_PATH = os.environ.get(
     "HAYSTACK_DB_PATH",
     "/var/lib/haystackfs/pagination.sqlite3",
 )
-TTL_SECONDS = 24 * 3600
+FACET_DB_PATH = os.environ.get(
+    "HAYSTACK_FACET_DB_PATH",
+    os.path.join(os.path.dirname(DB_PATH), "facets.sqlite3"),
+)
+# When set, searches record the history pages they read as replayable
+# benchmark fixtures (see python/search/recording.py).
+RECORD_DIR = os.environ.get("HAYSTACK_RECORD_DIR")
+# Pagination rows are spread over this many database files, by row_id, so
+# clicks commit in parallel. Changing it orphans rows already written.
+PAGINATION_SHARDS = int(os.environ.get("HAYSTACK_PAGINATION_SHARDS", 1))
+TTL_SECONDS = DEFAULT_TTL_SECONDS
 VACUUM_INTERVAL_SECONDS = 3600
+# Set when launched by `python -m python.cluster`; this process then runs only
+# its slice of the shards, with its own facet database.
+CLUSTER = ClusterConfig.from_env()
+if CLUSTER is not None:
+    DB_PATH, FACET_DB_PATH = CLUSTER.database_paths(DB_PATH, FACET_DB_PATH)
 
 
-# logging
-dlogger = logging.getLogger('discord')
-dlogger.setLevel(logging.ERROR)
-handler = logging.FileHandler(filename='logs/discord.log', encoding='utf-8', mode='w')
-formatter = logging.Formatter('%(asctime)s:%(levelname)s:%(name)s: %(message)s')
-handler.setFormatter(formatter)
-dlogger.addHandler(handler)
-
-# bot init
-TOKEN = DISCORD_TOKEN
-if DB_NAME == "testing" or DB_NAME is None:
-    TOKEN = TEST_DISCORD_TOKEN
-intents = discord.Intents.default()
-intents.message_content = True
-bot = commands.Bot(command_prefix='fs!', intents=intents)
 debug_guild = [] if not GUILD_ID else [discord.Object(id=GUILD_ID)]
 
 
-@bot.tree.command(name="reload", description=RELOAD_DESCRIPTION, guilds=debug_guild)
+@app_commands.command(name="reload", description=RELOAD_DESCRIPTION)
 @commands.is_owner()
 async def reload(interaction: discord.Interaction):
     """Reload cog if the bot owner requests a reload."""
+    bot = interaction.client
     appinfo = await bot.application_info()
     print(f"Reload initiated by {appinfo.owner} at {datetime.now().strftime('%Y-%m-%dT%H:%M:%S')}!")
     await interaction.response.send_message('Reloading!')
@@ -56,8 +68,40 @@ async def reload(interaction: discord.Interaction):
     await bot.reload_extension("cog")
 
 
+@app_commands.command(name="profile", description=PROFILE_DESCRIPTION)
+@app_commands.describe(seconds="How long to sample for", threads="Also sample threads other than the event loop's")
+async def profile(
+    interaction: discord.Interaction,
+    seconds: app_commands.Range[float, 1, MAX_PROFILE_SECONDS] = 10.0,
+    threads: bool = False,
+):
+    """Sample the bot's stacks for a while and send them back as a collapsed-stack file for a flamegraph."""
+    # commands.is_owner() only guards prefix commands, so check here.
+    if not await interaction.client.is_owner(interaction.user):
+        await interaction.response.send_message(PROFILE_OWNER_ONLY, ephemeral=True)
+        return
+    profiler = SamplingProfiler(all_threads=threads)
+    try:
+        profiler.start()
+    except ProfileAlreadyRunning:
+        await interaction.response.send_message(PROFILE_ALREADY_RUNNING, ephemeral=True)
+        return
+    try:
+        await interaction.response.send_message(f"Profiling for {seconds:.0f}s...", ephemeral=True)
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.stop()
+    print(f"[profile] {profiler.report()}")
+    filename = f"profile-{datetime.now().strftime('%Y%m%dT%H%M%S')}.collapsed.txt"
+    await interaction.followup.send(
+        content=f"```\n{profiler.report()[:1900]}\n```",
+        file=discord.File(io.BytesIO(profiler.collapsed().encode()), filename=filename),
+        ephemeral=True,
+    )
+
+
 # umbra's sync command. TYSM!!! <3
-@bot.command()
+@commands.command()
 @commands.guild_only()
 @commands.is_owner()
 async def sync(ctx: Context, guilds: Greedy[discord.Object], spec: Optional[Literal["~", "*", "^"]] = None) -> None:
@@ -89,6 +133,43 @@ async def sync(ctx: Context, guilds: Greedy[discord.Object], spec: Optional[Lite
     await ctx.send(f"Synced the tree to {ret}/{len(guilds)}.")
 
 
+# Everything that opens files or builds the bot lives in functions called from
+# `main()`: the scoring pool's spawned workers re-import this module as
+# `__mp_main__`, and must not truncate the live log or build a second bot.
+def setup_logging(cluster: Optional[ClusterConfig]):
+    dlogger = logging.getLogger('discord')
+    dlogger.setLevel(logging.ERROR)
+    log_file = 'logs/discord.log' if cluster is None else f'logs/discord.cluster{cluster.cluster_id}.log'
+    handler = logging.FileHandler(filename=log_file, encoding='utf-8', mode='w')
+    formatter = logging.Formatter('%(asctime)s:%(levelname)s:%(name)s: %(message)s')
+    handler.setFormatter(formatter)
+    dlogger.addHandler(handler)
+
+
+def bot_token() -> str:
+    if DB_NAME == "testing" or DB_NAME is None:
+        return TEST_DISCORD_TOKEN
+    return DISCORD_TOKEN
+
+
+def build_bot(cluster: Optional[ClusterConfig]) -> commands.Bot:
+    intents = discord.Intents.default()
+    intents.message_content = True
+    if cluster is None:
+        bot = commands.Bot(command_prefix='fs!', intents=intents)
+    else:
+        bot = commands.AutoShardedBot(
+            command_prefix='fs!', intents=intents, shard_ids=cluster.shard_ids, shard_count=cluster.shard_count
+        )
+    bot.cluster = cluster
+    bot.shard_stats = ShardStats()
+    bot.admission = AdmissionController()
+    bot.tree.add_command(reload, guilds=debug_guild)
+    bot.tree.add_command(profile, guilds=debug_guild)
+    bot.add_command(sync)
+    return bot
+
+
 async def _vacuum_loop(store: PaginationStore):
     while True:
         try:
@@ -100,45 +181,79 @@ async def _vacuum_loop(store: PaginationStore):
         await asyncio.sleep(VACUUM_INTERVAL_SECONDS)
 
 
-async def _rehydrate_views(bot: commands.Bot, store: PaginationStore):
-    """Re-register persistent FileViews for every active row at startup."""
-    rows = await store.iter_active(TTL_SECONDS)
-    rehydrated = 0
-    for row in rows:
-        try:
-            pages = json.loads(row["pages_json"])
-            current_results = SearchResults.from_dict(pages[str(row["current_page"])])
-            view = FileView(
-                current_results,
-                row_id=row["row_id"],
-                current_page=row["current_page"],
-                last_page=row["last_page"],
-            )
-            bot.add_view(view, message_id=row["message_id"])
-            rehydrated += 1
-        except Exception as e:
-            print(f"[pagination] failed to rehydrate row {row['row_id']}: {e!r}")
-    print(f"[pagination] rehydrated {rehydrated} views")
+class _StartupTimer:
+    """Print how long each startup phase took, and the total since process start."""
+
+    def __init__(self, started: float):
+        self.started = started
+        self.last = started
+
+    def mark(self, phase: str):
+        now = time.perf_counter()
+        print(f"[startup] {phase}: {(now - self.last) * 1000:.0f}ms (t+{(now - self.started) * 1000:.0f}ms)")
+        self.last = now
+
+
+async def _report_ready(bot: commands.Bot, timer: _StartupTimer):
+    await bot.wait_until_ready()
+    timer.mark("gateway ready")
 
 
 if __name__ == "__main__":
     async def main():
+        timer = _StartupTimer(_PROCESS_STARTED)
+        timer.mark("imports")
+        setup_logging(CLUSTER)
+        bot = build_bot(CLUSTER)
         async with bot:
+            # 0. Watch for callbacks that block the event loop (see `fs!lag`).
+            bot.watchdog = LoopWatchdog()
+            bot.watchdog.start()
+
             # 1. Construct shared services BEFORE adding cogs.
-            bot.search_client = DiscordSearcher()
-            bot.pagination_store = PaginationStore(DB_PATH)
+            if RECORD_DIR:
+                from python.search.recording import RecordingSearcher
+                bot.search_client = RecordingSearcher(RECORD_DIR)
+            else:
+                bot.search_client = DiscordSearcher()
+            if CLUSTER is not None:
+                bot.search_client.scorer.max_workers = CLUSTER.scoring_workers(MAX_SCORING_WORKERS)
+            if PAGINATION_SHARDS > 1:
+                bot.pagination_store = ShardedPaginationStore(DB_PATH, PAGINATION_SHARDS)
+            else:
+                bot.pagination_store = PaginationStore(DB_PATH)
             await bot.pagination_store.init()
+            timer.mark("pagination store init")
+            bot.facet_indexer = FacetIndexer(FacetStore(FACET_DB_PATH))
+            await bot.facet_indexer.store.init()
+            timer.mark("facet store init")
 
             # 2. Add cogs (haystack cog now takes the shared search_client).
             await bot.add_cog(haystack_setup(bot, bot.search_client))
             await bot.add_cog(admin_setup(bot))
             await bot.add_cog(help_setup(bot))
+            timer.mark("cogs")
 
-            # 3. Rehydrate persistent views from the store.
-            await _rehydrate_views(bot, bot.pagination_store)
+            # 3. Clicks on results messages are routed by custom_id (see
+            #    `ComponentRouter`), so there are no views to rebuild.
+            bot._ready_task = asyncio.create_task(_report_ready(bot, timer))
 
             # 4. Background vacuum.
             bot._vacuum_task = asyncio.create_task(_vacuum_loop(bot.pagination_store))
 
-            await bot.start(TOKEN)
+            # 5. Catch up facet counters on events missed while offline.
+            bot._facets_task = asyncio.create_task(reconcile_loop(bot, bot.facet_indexer, bot.search_client.catalog))
+
+            # 6. Periodic counts and sizes of long-lived caches (see `fs!memory`).
+            bot.memory = MemoryMonitor(bot)
+            bot.memory.start()
+
+            # 7. Per-shard health, when running as one cluster of several.
+            if CLUSTER is not None:
+                bot._health_task = asyncio.create_task(health_loop(bot, CLUSTER, bot.shard_stats))
+
+            try:
+                await bot.start(bot_token())
+            finally:
+                bot.search_client.scorer.close()
     asyncio.run(main())
@@ -3,10 +3,11 @@ from .models.query import Query
 import discord
 from .search.search_models import SearchResults
 from .search.discord_searcher import DiscordSearcher
-from .messages import NO_FILES_FOUND
+from .messages import NO_FILES_FOUND, NO_FILES_FOUND_YET
 
 
-async def fsearch(interaction: discord.Interaction, search_client: DiscordSearcher, query: Query) -> SearchResults:
+async def fsearch(interaction: discord.Interaction, search_client: DiscordSearcher, query: Query,
+                  on_progress=None) -> SearchResults:
     """
     Find docs related to a query in ElasticSearch.
 
@@ -14,23 +15,41 @@ async def fsearch(interaction: discord.Interaction, search_client: DiscordSearch
         interaction: The message's origin
         search_client: The Search client
         query: The query object
+        on_progress: Called with the files found so far while the search runs
 
     Returns:
         A list of dicts of viewable files.
     """
+    scope_id = interaction.guild.id if interaction.guild is not None else interaction.channel.id
+    cache_key = search_client.result_cache.key_for(query, scope_id)
+    generation = search_client.result_cache.generation(scope_id)
+    search_results = search_client.result_cache.get(cache_key) if cache_key else None
+    if search_results is not None:
+        return search_results if search_results.files else SearchResults(message=NO_FILES_FOUND)
+
     bot_user = None
+    readable = False
     onii_chan = [interaction.channel if query.channel is None else query.channel]
     if interaction.guild is not None:
         bot_user = interaction.guild.me
         if not query.channel:
-            forum_threads = [thread for channel in interaction.guild.forums for thread in channel.threads]
-            onii_chan = interaction.guild.text_channels + forum_threads
+            onii_chan = await search_client.catalog.searchable(interaction.guild)
+            readable = True
 
     search_results = await search_client.search(
         onii_chans=onii_chan,
         bot_user=bot_user,
-        query=query
+        query=query,
+        readable=readable,
+        on_progress=on_progress,
     )
+    # A partial search might find more with a warmer local index next time.
+    if cache_key and not search_results.partial:
+        search_client.result_cache.put(cache_key, search_results, generation=generation)
     if not search_results.files:
+        if search_results.partial:
+            return SearchResults(
+                files=[], message=NO_FILES_FOUND_YET, channel_date_map=search_results.channel_date_map, partial=True
+            )
         return SearchResults(message=NO_FILES_FOUND)
     return search_results
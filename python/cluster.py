@@ -0,0 +1,310 @@
+"""Run the bot as several processes, each owning a slice of the shards.
+
+    python -m python.cluster --processes 4            # shard count from Discord
+    python -m python.cluster --processes 4 --shards 16
+
+Each process (a "cluster") runs `python.bot` with an `AutoShardedBot` for its
+shard ids, told through the environment variables below. Discord routes a
+guild's events to shard `(guild_id >> 22) % shard_count` and DMs to shard 0,
+so a guild's searches and gateway events always land in the same cluster.
+That lets every cluster keep its own search cache and facet database (see
+`ClusterConfig.database_paths`). Pagination clicks don't always land with
+their search: results sent to a DM are clicked on shard 0, in cluster 0. So
+every cluster shares one pagination database; its rows are versioned, so
+clusters can't lose each other's clicks.
+
+Every cluster writes a per-shard health snapshot to the state directory; the
+launcher prints them together and restarts clusters that exit.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import signal
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+
+CLUSTER_ID_ENV = "HAYSTACK_CLUSTER_ID"
+SHARD_IDS_ENV = "HAYSTACK_SHARD_IDS"
+SHARD_COUNT_ENV = "HAYSTACK_SHARD_COUNT"
+STATE_DIR_ENV = "HAYSTACK_CLUSTER_STATE_DIR"
+CLUSTER_COUNT_ENV = "HAYSTACK_CLUSTER_COUNT"
+
+DEFAULT_STATE_DIR = "/var/lib/haystackfs/cluster"
+HEALTH_INTERVAL_SECONDS = 60
+RESTART_DELAY_SECONDS = 5
+
+
+@dataclass
+class ClusterConfig:
+    cluster_id: int
+    shard_ids: List[int]
+    shard_count: int
+    state_dir: str = DEFAULT_STATE_DIR
+    cluster_count: int = 1
+
+    @classmethod
+    def from_env(cls) -> Optional["ClusterConfig"]:
+        """The cluster this process was launched as, or None when running standalone."""
+        shard_count = os.environ.get(SHARD_COUNT_ENV)
+        if not shard_count:
+            return None
+        shard_ids = os.environ.get(SHARD_IDS_ENV)
+        return cls(
+            cluster_id=int(os.environ.get(CLUSTER_ID_ENV, 0)),
+            shard_ids=[int(s) for s in shard_ids.split(",")] if shard_ids else list(range(int(shard_count))),
+            shard_count=int(shard_count),
+            state_dir=os.environ.get(STATE_DIR_ENV, DEFAULT_STATE_DIR),
+            cluster_count=int(os.environ.get(CLUSTER_COUNT_ENV, 1)),
+        )
+
+    def to_env(self) -> Dict[str, str]:
+        return {
+            CLUSTER_ID_ENV: str(self.cluster_id),
+            SHARD_IDS_ENV: ",".join(map(str, self.shard_ids)),
+            SHARD_COUNT_ENV: str(self.shard_count),
+            STATE_DIR_ENV: self.state_dir,
+            CLUSTER_COUNT_ENV: str(self.cluster_count),
+        }
+
+    def db_path(self, path: str) -> str:
+        """This cluster's copy of a database file, e.g. `pagination.cluster2.sqlite3`."""
+        root, ext = os.path.splitext(path)
+        return f"{root}.cluster{self.cluster_id}{ext}"
+
+    def database_paths(self, pagination: str, facets: str) -> Tuple[str, str]:
+        """The pagination and facet databases this cluster opens: the shared pagination one, and its own facets."""
+        return pagination, self.db_path(facets)
+
+    def scoring_workers(self, total: Optional[int]) -> int:
+        """This cluster's share of `total` fuzzy-scoring workers (default: one per CPU) on the host."""
+        return max(1, (total or os.cpu_count() or 1) // self.cluster_count)
+
+    @property
+    def state_path(self) -> str:
+        return os.path.join(self.state_dir, f"cluster_{self.cluster_id}.json")
+
+
+def shard_slices(shard_count: int, processes: int) -> List[List[int]]:
+    """Split shard ids 0..shard_count-1 into `processes` contiguous, near-equal slices."""
+    processes = max(1, min(processes, shard_count))
+    size, extra = divmod(shard_count, processes)
+    slices, start = [], 0
+    for i in range(processes):
+        end = start + size + (1 if i < extra else 0)
+        slices.append(list(range(start, end)))
+        start = end
+    return slices
+
+
+@dataclass
+class _ShardCounters:
+    searches: int = 0
+    errors: int = 0
+    search_seconds: float = 0.0
+
+
+@dataclass
+class ShardStats:
+    """Search counters per shard, read and reset by the health loop."""
+    counters: Dict[int, _ShardCounters] = field(default_factory=dict)
+
+    def record(self, shard_id: int, seconds: float, ok: bool = True) -> None:
+        counters = self.counters.setdefault(shard_id, _ShardCounters())
+        counters.searches += 1
+        counters.search_seconds += seconds
+        if not ok:
+            counters.errors += 1
+
+    def take(self) -> Dict[int, _ShardCounters]:
+        taken, self.counters = self.counters, {}
+        return taken
+
+
+def shard_snapshot(bot, stats: ShardStats, interval: float) -> List[dict]:
+    """One health entry per shard this process runs, covering the last `interval` seconds."""
+    counters = stats.take()
+    guilds: Dict[int, int] = {}
+    for guild in bot.guilds:
+        guilds[guild.shard_id] = guilds.get(guild.shard_id, 0) + 1
+    shard_ids = sorted(bot.shards) if getattr(bot, "shards", None) else [0]
+    snapshot = []
+    for shard_id in shard_ids:
+        shard = bot.get_shard(shard_id) if hasattr(bot, "get_shard") else None
+        latency = shard.latency if shard is not None else bot.latency
+        c = counters.get(shard_id, _ShardCounters())
+        snapshot.append({
+            "shard_id": shard_id,
+            "up": not shard.is_closed() if shard is not None else not bot.is_closed(),
+            "latency_ms": round(latency * 1000) if math.isfinite(latency) else None,
+            "guilds": guilds.get(shard_id, 0),
+            "searches_per_min": round(c.searches * 60 / interval, 2),
+            "mean_search_ms": round(c.search_seconds * 1000 / c.searches) if c.searches else None,
+            "errors": c.errors,
+        })
+    return snapshot
+
+
+def _write_state(path: str, state: dict) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def read_states(state_dir: str) -> List[dict]:
+    """Every cluster's last health snapshot."""
+    states = []
+    if not os.path.isdir(state_dir):
+        return states
+    for name in sorted(os.listdir(state_dir)):
+        if not (name.startswith("cluster_") and name.endswith(".json")):
+            continue
+        try:
+            with open(os.path.join(state_dir, name)) as f:
+                states.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return states
+
+
+def total_guilds(bot, config: Optional[ClusterConfig]) -> int:
+    """Guilds across all clusters; this process's own count is live, the rest come from their snapshots."""
+    if config is None:
+        return len(bot.guilds)
+    others = sum(
+        sum(shard["guilds"] for shard in state["shards"])
+        for state in read_states(config.state_dir)
+        if state["cluster_id"] != config.cluster_id
+    )
+    return len(bot.guilds) + others
+
+
+async def health_loop(bot, config: ClusterConfig, stats: ShardStats, interval: float = HEALTH_INTERVAL_SECONDS):
+    """Print and publish per-shard health every `interval` seconds."""
+    await bot.wait_until_ready()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            shards = shard_snapshot(bot, stats, interval)
+            for shard in shards:
+                print(
+                    f"[cluster {config.cluster_id}] shard {shard['shard_id']}: "
+                    f"{'up' if shard['up'] else 'DOWN'}, latency {shard['latency_ms']}ms, "
+                    f"{shard['guilds']} guilds, {shard['searches_per_min']} searches/min, "
+                    f"mean {shard['mean_search_ms']}ms, {shard['errors']} errors"
+                )
+            state = {"cluster_id": config.cluster_id, "pid": os.getpid(), "updated_at": int(time.time()),
+                     "shards": shards}
+            admission = getattr(bot, "admission", None)
+            if admission is not None:
+                state["admission"] = admission.snapshot()
+            memory = getattr(bot, "memory", None)
+            if memory is not None:
+                state["memory"] = memory.snapshot()
+            await asyncio.to_thread(_write_state, config.state_path, state)
+        except Exception as e:
+            print(f"[cluster {config.cluster_id}] health report failed: {e!r}")
+
+
+async def recommended_shard_count(token: str) -> int:
+    from discord.http import HTTPClient
+
+    http = HTTPClient(asyncio.get_running_loop())
+    try:
+        await http.static_login(token)
+        shards, _ = await http.get_bot_gateway()
+        return shards
+    finally:
+        await http.close()
+
+
+class _Supervisor:
+    """Keep one `python.bot` process running per cluster until told to stop."""
+
+    def __init__(self, configs: List[ClusterConfig], restart_delay: float):
+        self.configs = configs
+        self.restart_delay = restart_delay
+        self.procs: Dict[int, asyncio.subprocess.Process] = {}
+        self.stopping = False
+
+    async def run_cluster(self, config: ClusterConfig):
+        env = {**os.environ, **config.to_env()}
+        while not self.stopping:
+            proc = await asyncio.create_subprocess_exec(sys.executable, "-m", "python.bot", env=env)
+            self.procs[config.cluster_id] = proc
+            print(f"[cluster] started cluster {config.cluster_id} (pid {proc.pid}) for shards {config.shard_ids}")
+            code = await proc.wait()
+            if self.stopping:
+                break
+            print(f"[cluster] cluster {config.cluster_id} exited with {code}; restarting in {self.restart_delay}s")
+            await asyncio.sleep(self.restart_delay)
+
+    def stop(self):
+        self.stopping = True
+        for proc in self.procs.values():
+            if proc.returncode is None:
+                proc.terminate()
+
+    async def report(self, interval: float):
+        state_dir = self.configs[0].state_dir
+        while not self.stopping:
+            await asyncio.sleep(interval)
+            states = read_states(state_dir)
+            shards = [shard for state in states for shard in state["shards"]]
+            up = sum(shard["up"] for shard in shards)
+            guilds = sum(shard["guilds"] for shard in shards)
+            rate = sum(shard["searches_per_min"] for shard in shards)
+            print(f"[cluster] {up}/{len(shards)} shards up, {guilds} guilds, {rate:.1f} searches/min")
+
+    async def run(self, interval: float):
+        # Snapshots left by a previous run may name clusters that no longer exist.
+        for state in read_states(self.configs[0].state_dir):
+            os.remove(os.path.join(self.configs[0].state_dir, f"cluster_{state['cluster_id']}.json"))
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stop)
+        reporter = asyncio.create_task(self.report(interval))
+        await asyncio.gather(*(self.run_cluster(config) for config in self.configs))
+        reporter.cancel()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--shards", type=int, help="total shard count (default: Discord's recommendation)")
+    parser.add_argument("--state-dir", default=os.environ.get(STATE_DIR_ENV, DEFAULT_STATE_DIR))
+    parser.add_argument("--restart-delay", type=float, default=RESTART_DELAY_SECONDS)
+    parser.add_argument("--report-interval", type=float, default=HEALTH_INTERVAL_SECONDS)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+
+    async def run():
+        shard_count = args.shards
+        if shard_count is None:
+            from python.bot_secrets import DB_NAME, DISCORD_TOKEN, TEST_DISCORD_TOKEN
+            token = TEST_DISCORD_TOKEN if DB_NAME == "testing" or DB_NAME is None else DISCORD_TOKEN
+            shard_count = await recommended_shard_count(token)
+        slices = shard_slices(shard_count, args.processes)
+        configs = [
+            ClusterConfig(cluster_id=i, shard_ids=shard_ids, shard_count=shard_count, state_dir=args.state_dir,
+                          cluster_count=len(slices))
+            for i, shard_ids in enumerate(slices)
+        ]
+        print(f"[cluster] {shard_count} shards across {len(configs)} processes")
+        await _Supervisor(configs, args.restart_delay).run(args.report_interval)
+
+    asyncio.run(run())
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,6 +1,7 @@
 from discord.ext import commands
 from python.discord_utils import increment_command_count
 from python.bot_secrets import GUILD_ID
+from python.cluster import total_guilds
 
 
 class AdminCog(commands.Cog):
@@ -11,17 +12,47 @@ class AdminCog(commands.Cog):
 
     @commands.Cog.listener()
     async def on_ready(self):
-        await increment_command_count(self.bot, "server_count", len(self.bot.guilds))
+        await increment_command_count(self.bot, "server_count", total_guilds(self.bot, self.bot.cluster))
 
     @commands.Cog.listener()
     async def on_guild_join(self, guild):
         """Log guild joins."""
-        await increment_command_count(self.bot, "server_count", len(self.bot.guilds))
+        await increment_command_count(self.bot, "server_count", total_guilds(self.bot, self.bot.cluster))
+
+    @commands.command(name="lag")
+    @commands.is_owner()
+    async def lag(self, ctx: commands.Context):
+        """Show the event-loop lag histogram and the code that blocked the loop the longest."""
+        report = self.bot.watchdog.report()
+        await ctx.send(f"```\n{report[:1900]}\n```")
+
+    @commands.command(name="queue")
+    @commands.is_owner()
+    async def queue(self, ctx: commands.Context):
+        """Show running and queued searches, wait times and how many searches were shed."""
+        await ctx.send(f"```\n{self.bot.admission.report()[:1900]}\n```")
+
+    @commands.command(name="memory")
+    @commands.is_owner()
+    async def memory(self, ctx: commands.Context, action: str = None):
+        """Show what the bot's caches and registries hold; `trace`, `diff` and `untrace` manage allocation tracing."""
+        monitor = self.bot.memory
+        if action == "trace":
+            monitor.start_tracing()
+            report = "Tracing allocations. Run `fs!memory diff` later to see what grew."
+        elif action == "diff":
+            report = monitor.trace_diff()
+        elif action == "untrace":
+            monitor.stop_tracing()
+            report = "Stopped tracing allocations."
+        else:
+            report = await monitor.report()
+        await ctx.send(f"```\n{report[:1900]}\n```")
 
     @commands.Cog.listener()
     async def on_guild_remove(self, guild):
         """Log guild joins."""
-        await increment_command_count(self.bot, "server_count", len(self.bot.guilds))
+        await increment_command_count(self.bot, "server_count", total_guilds(self.bot, self.bot.cluster))
 
 
 def setup(bot):
@@ -3,6 +3,8 @@ import io
 import json
 import re
 import hashlib
+import time
+from datetime import timedelta
 
 from python.models.query import Query
 from python.bot_secrets import DB_NAME
@@ -12,12 +14,24 @@ from discord.ext import commands
 from python.utils import search_opts, CONTENT_TYPE_CHOICES
 from python.bot_commands import fsearch
 from python.export_template import generate_script
-from python.views.file_view import FileView
-from python.views.file_embed import FileEmbed
-from python.search.search_models import SearchResults
+from python.search.search_models import EPOCH, SearchResults
+from python.search.admission import AdmissionRejected
+from python.exceptions import QueryException
+from python.views.file_view import PayloadView, build_page_payload, render_components
+from python.views.component_router import ComponentRouter
+from python.views.file_dropdown import FileDropDown
+from python.views.page_back_button import PageBackButton
+from python.views.page_next_button import PageNextButton
+from python.views.pagination_callbacks import prune_deleted_messages, remainder_pages
+from python.views.progressive_render import ProgressiveRender
+from python.views.facets_embed import FacetsEmbed
 from python.messages import (
     INSUFFICIENT_BOT_PERMISSIONS,
     EXPORT_COMMAND_DESCRIPTION,
+    FACETS_DESCRIPTION,
+    NO_FACETS_FOUND,
+    SEARCH_QUEUE_FULL,
+    SEARCH_USER_QUEUE_FULL,
     SEARCH_RESULTS_FOUND,
     SEARCHING_MESSAGE,
 )
@@ -33,6 +47,17 @@ class Haystackfs(commands.Cog):
         self.bot = bot
         self.owner = None
         self.search_client = search_client
+        self.component_router = ComponentRouter([PageNextButton, PageBackButton, FileDropDown])
+
+    @commands.Cog.listener()
+    async def on_connect(self):
+        """A new gateway session may have missed events, so locally indexed channel heads are stale."""
+        self.search_client.local_index.connected()
+
+    @commands.Cog.listener()
+    async def on_interaction(self, interaction: discord.Interaction):
+        """Route clicks on results messages, which have no view registered."""
+        await self.component_router.dispatch(interaction)
 
     @commands.Cog.listener()
     async def on_ready(self):
@@ -42,13 +67,14 @@ class Haystackfs(commands.Cog):
         print(f'{self.bot.user} has connected to Discord!')
         print(f'{self.owner} is my owner!')
 
-    async def locate(self, interaction: discord.Interaction, query: Query) -> SearchResults:
+    async def locate(self, interaction: discord.Interaction, query: Query, on_progress=None) -> SearchResults:
         """
         Turn arguments into a search and return the files.
 
         Args:
             interaction: The SlashContext from which the command originated
             query: The user query
+            on_progress: Called with the files found so far while the search runs
 
         Returns a destination that has a .send method, and a list of files.
         """
@@ -57,7 +83,22 @@ class Haystackfs(commands.Cog):
                 return SearchResults(
                     message=INSUFFICIENT_BOT_PERMISSIONS.format(query.channel.name, query.channel.name)
                 )
-        return await fsearch(interaction=interaction, search_client=self.search_client, query=query)
+        shard_id = interaction.guild.shard_id if interaction.guild is not None else 0
+        scope_id = interaction.guild.id if interaction.guild is not None else interaction.channel.id
+        try:
+            async with self.bot.admission.admit(scope_id, interaction.user.id):
+                start = time.perf_counter()
+                ok = False
+                try:
+                    results = await fsearch(
+                        interaction=interaction, search_client=self.search_client, query=query, on_progress=on_progress
+                    )
+                    ok = True
+                    return results
+                finally:
+                    self.bot.shard_stats.record(shard_id, time.perf_counter() - start, ok=ok)
+        except AdmissionRejected as e:
+            return SearchResults(message=SEARCH_USER_QUEUE_FULL if e.reason == "user" else SEARCH_QUEUE_FULL)
 
     @app_commands.command(name="search", description="Search for your files!")
     @app_commands.describe(**search_opts)
@@ -66,8 +107,22 @@ class Haystackfs(commands.Cog):
     async def slash_search(self, interaction: discord.Interaction, query: Query):
         """Responds to `/search`. Tries to display docs that match a query."""
         send_source, edit_source = await self._get_send_and_edit_recipients(interaction=interaction, send=query.dm)
-        search_results = await self.locate(interaction=interaction, query=query)
-        if not search_results.files:
+        # Show files on the "Searching..." message as channels turn them up;
+        # the final render below replaces it.
+        progress = None
+        if edit_source is not None:
+            progress = ProgressiveRender(edit_source, self.bot.user.name, self.bot.user.display_avatar.url)
+        try:
+            search_results = await self.locate(
+                interaction=interaction, query=query, on_progress=progress.update if progress else None
+            )
+        finally:
+            if progress is not None:
+                await progress.close()
+        # A search that stopped early with nothing yet still gets a results
+        # message, so Next can carry on from where it stopped.
+        resumable = search_results.partial and search_results.channel_date_map
+        if not search_results.files and not resumable:
             await interaction.followup.send(content=search_results.message, ephemeral=query.dm)
         else:
             await self.send_files_as_message(
@@ -139,8 +194,25 @@ class Haystackfs(commands.Cog):
         if not search_results.files:
             await interaction.followup.send(content=search_results.message, ephemeral=query.dm)
             return
+        deleted_files = await self.delete_files(search_results.files)
+        if not deleted_files:
+            await interaction.followup.send(content="No files were deleted.", ephemeral=True)
+            return
+        await interaction.followup.send(content=f"Deleted {' '.join(deleted_files)}", ephemeral=True)
+
+    async def delete_files(self, files) -> list[str]:
+        """
+        Delete the messages that carry `files`.
+
+        Args:
+            files: Search results to delete
+
+        Returns:
+            The filenames whose messages were deleted; files the bot can't see or
+            that are already gone are skipped.
+        """
         deleted_files = []
-        for file in search_results.files:
+        for file in files:
             try:
                 onii_chan = self.bot.get_channel(int(file.channel_id))
                 if onii_chan is None:
@@ -150,10 +222,34 @@ class Haystackfs(commands.Cog):
                 deleted_files.append(file.filename)
             except (discord.Forbidden, discord.errors.NotFound):
                 continue
-        if not deleted_files:
-            await interaction.followup.send(content="No files were deleted.", ephemeral=True)
+        return deleted_files
+
+    @app_commands.command(name="facets", description=FACETS_DESCRIPTION)
+    @app_commands.describe(after=search_opts["after"], before=search_opts["before"])
+    @app_commands.guild_only()
+    async def slash_facets(self, interaction: discord.Interaction, after: str = None, before: str = None):
+        """Respond to `/facets`. Count files by category, extension, channel and uploader from stored counters."""
+        await interaction.response.defer()
+        try:
+            window = Query(after=after, before=before)
+        except QueryException as e:
+            await interaction.followup.send(e.message)
             return
-        await interaction.followup.send(content=f"Deleted {' '.join(deleted_files)}", ephemeral=True)
+        first_day = (window.after + timedelta(microseconds=1) - EPOCH).days if window.after else None
+        last_day = (window.before - EPOCH).days if window.before else None
+        facets = await self.bot.facet_indexer.store.counts(interaction.guild.id, first_day, last_day)
+        if not facets["category"]:
+            await interaction.followup.send(content=NO_FACETS_FOUND)
+            return
+        if after and before:
+            label = f"from {after} to {before}"
+        elif after or before:
+            label = f"after {after}" if after else f"before {before}"
+        else:
+            label = "in this server"
+        await interaction.followup.send(embed=FacetsEmbed(
+            facets, label, name=self.bot.user.name, avatar_url=self.bot.user.display_avatar.url
+        ))
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
@@ -168,11 +264,102 @@ class Haystackfs(commands.Cog):
         Args:
             message: A discord.Message that represents the newest message.
         """
+        if message.attachments:
+            self.search_client.result_cache.invalidate_channel(
+                message.guild.id if message.guild else None, message.channel.id
+            )
+            await self.bot.facet_indexer.add(message)
+            self.search_client.local_index.on_message(message)
         if message.author == self.bot.user:
             return
         # Only track files and servers that have files uploaded to them
         await self.bot.process_commands(message)
 
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        """Drop cached results and stored pages that may include the deleted message's files."""
+        if payload.cached_message is not None and not payload.cached_message.attachments:
+            return
+        self.search_client.result_cache.invalidate_channel(payload.guild_id, payload.channel_id)
+        await prune_deleted_messages(self.bot, [payload.message_id])
+        await self.bot.facet_indexer.remove([payload.message_id])
+        self.search_client.local_index.forget_messages(payload.channel_id, [payload.message_id])
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent):
+        """Drop cached results and stored pages that may include any of the deleted messages' files."""
+        if payload.cached_messages and len(payload.cached_messages) == len(payload.message_ids) \
+                and not any(m.attachments for m in payload.cached_messages):
+            return
+        self.search_client.result_cache.invalidate_channel(payload.guild_id, payload.channel_id)
+        await prune_deleted_messages(self.bot, payload.message_ids)
+        await self.bot.facet_indexer.remove(list(payload.message_ids))
+        self.search_client.local_index.forget_messages(payload.channel_id, payload.message_ids)
+
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        """Edits can change message content or remove attachments, both of which searches match on."""
+        if "content" not in payload.data and "attachments" not in payload.data:
+            return
+        self.search_client.result_cache.invalidate_channel(payload.guild_id, payload.channel_id)
+        await self.bot.facet_indexer.edit(payload)
+        self.search_client.local_index.apply_edit(payload.channel_id, payload.message_id, payload.data)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(self, before, after):
+        """Permission changes decide which channels a search can read."""
+        if before.overwrites != after.overwrites or before.category_id != after.category_id:
+            self.search_client.result_cache.invalidate_scope(after.guild.id)
+            self.search_client.catalog.channel_updated(after)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_create(self, channel):
+        self.search_client.result_cache.invalidate_scope(channel.guild.id)
+        self.search_client.catalog.channel_created(channel)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel):
+        self.search_client.result_cache.invalidate_scope(channel.guild.id)
+        self.search_client.catalog.channel_deleted(channel)
+        await self.bot.facet_indexer.store.forget_channel(channel.id)
+        self.search_client.local_index.forget_channel(channel.id)
+
+    @commands.Cog.listener()
+    async def on_thread_create(self, thread: discord.Thread):
+        self.search_client.catalog.thread_updated(thread)
+
+    @commands.Cog.listener()
+    async def on_thread_update(self, before: discord.Thread, after: discord.Thread):
+        self.search_client.catalog.thread_updated(after)
+
+    @commands.Cog.listener()
+    async def on_raw_thread_delete(self, payload: discord.RawThreadDeleteEvent):
+        self.search_client.result_cache.invalidate_scope(payload.guild_id)
+        self.search_client.catalog.thread_deleted(payload.guild_id, payload.thread_id)
+        self.search_client.local_index.forget_channel(payload.thread_id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before: discord.Role, after: discord.Role):
+        if before.permissions != after.permissions:
+            self.search_client.result_cache.invalidate_scope(after.guild.id)
+            self.search_client.catalog.permissions_changed(after.guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role):
+        self.search_client.result_cache.invalidate_scope(role.guild.id)
+        self.search_client.catalog.permissions_changed(role.guild.id)
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        """The bot's own roles decide which channels it can read."""
+        if after.id == self.bot.user.id and before.roles != after.roles:
+            self.search_client.result_cache.invalidate_scope(after.guild.id)
+            self.search_client.catalog.permissions_changed(after.guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        self.search_client.catalog.forget_guild(guild.id)
+
     @staticmethod
     async def _get_send_and_edit_recipients(interaction, send):
         send_source = interaction.followup
@@ -194,12 +381,15 @@ class Haystackfs(commands.Cog):
     ):
         """Send paginated `/search` results and persist their pagination state.
 
+        A partial search that found nothing yet is sent as an empty page with
+        Next, so the user can carry on from its cursor.
+
         Steps:
-            1. Stash the cursor and serialize the query/initial page.
-            2. INSERT a row in the pagination store to reserve a row_id.
-            3. Build the FileView with that row_id baked into custom_ids.
+            1. Stash the cursor and serialize the query.
+            2. Mint a row_id and render page 1 with it baked into custom_ids.
+            3. INSERT the row with the rendered page.
             4. Send the message.
-            5. Attach the message_id to the row and register the view persistently.
+            5. Attach the message_id to the row.
         """
         name = self.bot.user.name
         avatar_url = self.bot.user.display_avatar.url
@@ -207,34 +397,40 @@ class Haystackfs(commands.Cog):
         # 1. Serialize state.
         query.channel_date_map = search_results.channel_date_map
         query_json = query.to_json()
-        pages_json = json.dumps({"1": search_results.to_dict()})
 
-        # If there's no cursor, this is the only page that will ever exist —
-        # mark the row as such so neither nav button renders. Otherwise -1 is
-        # the "more pages may exist" sentinel and the Next button shows.
-        initial_last_page = 1 if not search_results.channel_date_map else -1
+        # A ranked search's remainder fills the pages after the first.
+        more = remainder_pages(search_results, self.search_client.search_result_limit, 1)
 
-        # 2. Reserve a row_id BEFORE building the view so custom_ids are stable.
-        row_id = await self.bot.pagination_store.create(
+        # If there's no cursor, the stored pages are the only ones that will
+        # ever exist — mark the row as such so Next doesn't render past them.
+        # Otherwise -1 is the "more pages may exist" sentinel and Next shows.
+        initial_last_page = 1 + len(more) if not search_results.channel_date_map else -1
+
+        # 2. Render page 1 once; the payload is stored with the page and reused
+        #    whenever the user comes back to it.
+        row_id = self.bot.pagination_store.new_row_id()
+        payload = build_page_payload(search_results, row_id=row_id, page=1, name=name, avatar_url=avatar_url)
+        page = search_results.to_dict()
+        page["render"] = payload
+
+        # 3. Persist the row BEFORE sending so clicks always find it.
+        await self.bot.pagination_store.create(
+            row_id=row_id,
             user_id=interaction.user.id,
             channel_id=interaction.channel_id,
             guild_id=interaction.guild.id if interaction.guild else None,
             query_json=query_json,
-            pages_json=pages_json,
+            pages_json=json.dumps({"1": page, **more}),
             last_page=initial_last_page,
+            add_refs=[f.message_id for f in (search_results.files or []) + (search_results.remainder or [])],
         )
 
-        # 3. Build view with row_id and the resolved nav-button shape.
-        view = FileView(
-            search_results,
-            row_id=row_id,
-            current_page=1,
-            last_page=initial_last_page,
-        )
-        embed = FileEmbed(search_results, name=name, avatar_url=avatar_url)
-        body = interaction.user.mention + SEARCH_RESULTS_FOUND.format(
-            search_results.files[0].filename
-        )[:100]
+        if search_results.files:
+            body = interaction.user.mention + SEARCH_RESULTS_FOUND.format(
+                search_results.files[0].filename
+            )[:100]
+        else:
+            body = interaction.user.mention + " " + search_results.message
 
         # 4. Send.
         sent_message = await send_or_edit(
@@ -242,16 +438,15 @@ class Haystackfs(commands.Cog):
             edit_source=edit_source,
             send=send,
             content=body,
-            embed=embed,
-            view=view,
+            embed=discord.Embed.from_dict(payload["embed"]),
+            view=PayloadView(render_components(payload, row_id=row_id, current_page=1, last_page=initial_last_page)),
         )
 
-        # 5. Attach message_id and register the view persistently. If something
-        #    goes wrong here, the row exists with message_id IS NULL and the
-        #    vacuum task will sweep it.
+        # 5. Attach message_id. Clicks are routed by custom_id, so there's no
+        #    view to register. If something goes wrong here, the row exists
+        #    with message_id IS NULL and the vacuum task will sweep it.
         if sent_message is not None and getattr(sent_message, "id", None) is not None:
             await self.bot.pagination_store.attach_message(row_id, sent_message.id)
-            self.bot.add_view(view, message_id=sent_message.id)
 
 
 def setup(bot, search_client):
@@ -0,0 +1,164 @@
+"""Measure event-loop lag and attribute long stalls to the code that caused them.
+
+A heartbeat task sleeps for `interval` over and over and records how late it
+wakes up. A helper thread watches the heartbeat; once it has been overdue for
+more than `threshold`, the loop thread is stuck in a callback, so the thread
+grabs the loop thread's current stack. When the heartbeat finally runs, the
+stall's full length is known and is charged to the frame the stack was in.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+
+THRESHOLD_SECONDS = int(os.environ.get("HAYSTACK_LAG_THRESHOLD_MS", 250)) / 1000
+INTERVAL_SECONDS = 0.05
+REPORT_INTERVAL_SECONDS = 3600
+# Upper bounds of the lag histogram buckets, in milliseconds.
+BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 3000)
+
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_THIS_FILE = os.path.abspath(__file__)
+
+
+@dataclass
+class Offender:
+    """A frame that was on top of the loop thread's stack during long stalls."""
+    where: str
+    stalls: int = 0
+    total_ms: float = 0.0
+    worst_ms: float = 0.0
+    stack: str = ""
+
+
+def _blame(stack: traceback.StackSummary) -> traceback.FrameSummary:
+    """The innermost frame in this repo's code, falling back to the innermost frame."""
+    for frame in reversed(stack):
+        path = os.path.abspath(frame.filename)
+        if path.startswith(_REPO_ROOT) and path != _THIS_FILE:
+            return frame
+    return stack[-1]
+
+
+class LoopWatchdog:
+
+    def __init__(
+        self,
+        threshold: float = THRESHOLD_SECONDS,
+        interval: float = INTERVAL_SECONDS,
+        report_interval: Optional[float] = REPORT_INTERVAL_SECONDS,
+    ):
+        """
+        Create a LoopWatchdog.
+
+        Args:
+            threshold: Lag, in seconds, past which a stall's stack is captured and logged
+            interval: How long the heartbeat sleeps between beats
+            report_interval: How often to print `report()`, or None to never print it
+        """
+        self.threshold = threshold
+        self.interval = interval
+        self.report_interval = report_interval
+        self.histogram: List[int] = [0] * (len(BUCKETS_MS) + 1)
+        self.offenders: Dict[str, Offender] = {}
+        self.worst_ms = 0.0
+        self.beats = 0
+        self._beat: Optional[float] = None
+        # (beat it was captured for, stack), set by the watcher thread
+        self._capture: Optional[Tuple[float, traceback.StackSummary]] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self) -> None:
+        """Start watching the running event loop."""
+        self._loop_thread_id = threading.get_ident()
+        self._stopped.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _heartbeat(self):
+        last_report = time.perf_counter()
+        while True:
+            beat = time.perf_counter()
+            self._beat = beat
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            self._record(beat, max(0.0, now - beat - self.interval))
+            if self.report_interval is not None and now - last_report >= self.report_interval:
+                print(f"[watchdog] {self.report()}")
+                last_report = now
+
+    def _watch(self):
+        poll = min(self.interval, self.threshold) / 2
+        while not self._stopped.wait(poll):
+            beat = self._beat
+            if beat is None or time.perf_counter() - beat < self.interval + self.threshold:
+                continue
+            capture = self._capture
+            if capture is not None and capture[0] == beat:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is not None:
+                self._capture = (beat, traceback.extract_stack(frame))
+
+    def _record(self, beat: float, lag: float) -> None:
+        lag_ms = lag * 1000
+        self.beats += 1
+        self.worst_ms = max(self.worst_ms, lag_ms)
+        self.histogram[self._bucket(lag_ms)] += 1
+        if lag < self.threshold:
+            return
+        capture = self._capture
+        if capture is None or capture[0] != beat:
+            print(f"[watchdog] event loop blocked for {lag_ms:.0f}ms (no stack captured)")
+            return
+        stack = capture[1]
+        frame = _blame(stack)
+        where = f"{os.path.relpath(frame.filename, _REPO_ROOT)}:{frame.lineno} in {frame.name}"
+        offender = self.offenders.get(where)
+        if offender is None:
+            offender = self.offenders[where] = Offender(where, stack="".join(stack.format()[-8:]))
+        offender.stalls += 1
+        offender.total_ms += lag_ms
+        offender.worst_ms = max(offender.worst_ms, lag_ms)
+        print(f"[watchdog] event loop blocked for {lag_ms:.0f}ms at {where}\n{offender.stack}", end="")
+
+    @staticmethod
+    def _bucket(lag_ms: float) -> int:
+        for i, bound in enumerate(BUCKETS_MS):
+            if lag_ms <= bound:
+                return i
+        return len(BUCKETS_MS)
+
+    def worst_offenders(self, n: int = 5) -> List[Offender]:
+        return sorted(self.offenders.values(), key=lambda o: o.total_ms, reverse=True)[:n]
+
+    def report(self, offenders: int = 5) -> str:
+        """A plain-text lag histogram and the frames that blocked the loop the longest."""
+        lines = [f"{self.beats} beats, worst lag {self.worst_ms:.0f}ms, threshold {self.threshold * 1000:.0f}ms"]
+        lower = 0
+        for i, count in enumerate(self.histogram):
+            label = f"{lower}-{BUCKETS_MS[i]}ms" if i < len(BUCKETS_MS) else f">{lower}ms"
+            lines.append(f"{label:>13} {count:>8}")
+            if i < len(BUCKETS_MS):
+                lower = BUCKETS_MS[i]
+        worst = self.worst_offenders(offenders)
+        if worst:
+            lines.append("worst offenders (total / worst / stalls):")
+            for o in worst:
+                lines.append(f"  {o.total_ms:.0f}ms / {o.worst_ms:.0f}ms / {o.stalls}  {o.where}")
+        return "\n".join(lines)
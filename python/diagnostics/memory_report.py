@@ -0,0 +1,296 @@
+"""Count what the bot's long-lived structures hold, and how many bytes that takes.
+
+Every `interval` a `MemoryMonitor` measures each structure in `STRUCTURES`:
+how many entries it has and roughly how many bytes they take. It prints a
+`[memory]` line, and keeps the figures in `gauges` for the cluster health
+state. Structures over their budget in `HAYSTACK_MEMORY_BUDGETS_MB` (e.g.
+`local_index=200,message_cache=50`) are flagged and logged; nothing is
+evicted.
+
+Bytes are an estimate: the deep size of up to `SAMPLE_ITEMS` evenly spaced
+entries, scaled to the entry count, plus the container itself. Containers
+inside an entry are sampled the same way, so a structure of containers (such
+as the local index's channels, each holding thousands of messages) costs a
+bounded walk however large it grows. The entries are picked on the event loop
+and sized in a thread. The deep size stops at objects shared with the rest of
+the bot (guilds, channels, users, the client and its state), so a cached
+message counts its content and attachments but not the guild it was posted in.
+
+For leaks in code rather than in these structures, `start_tracing()` takes
+a tracemalloc snapshot and `trace_diff()` shows which lines allocated the
+most since. Tracing slows every allocation, so it's off until asked for.
+"""
+import asyncio
+import itertools
+import os
+import sys
+import tracemalloc
+import types
+from collections import deque
+from collections.abc import Mapping
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import discord
+from discord.state import ConnectionState
+
+
+INTERVAL_SECONDS = int(os.environ.get("HAYSTACK_MEMORY_INTERVAL_SECONDS", 600))
+SAMPLE_ITEMS = 64
+MAX_DEPTH = 8
+TRACE_FRAMES = 10
+
+_OPAQUE = (
+    type, types.ModuleType, types.FunctionType, types.MethodType, types.BuiltinFunctionType, types.CodeType,
+    types.FrameType, asyncio.AbstractEventLoop, discord.Client, ConnectionState, discord.Guild,
+    discord.abc.GuildChannel, discord.Thread, discord.DMChannel, discord.User, discord.ClientUser, discord.Member,
+)
+_ATOMS = (str, bytes, int, float, bool, type(None))
+
+
+def _parse_budgets(spec: str) -> Dict[str, int]:
+    """`"local_index=200,message_cache=50"` -> bytes per structure."""
+    budgets = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, megabytes = part.partition("=")
+        budgets[name.strip()] = int(float(megabytes) * 1024 * 1024)
+    return budgets
+
+
+BUDGETS = _parse_budgets(os.environ.get("HAYSTACK_MEMORY_BUDGETS_MB", ""))
+
+
+def _sampled(entries: list) -> Tuple[list, float]:
+    """Up to `SAMPLE_ITEMS` evenly spaced entries, and how much to scale their size by."""
+    if len(entries) <= SAMPLE_ITEMS:
+        return entries, 1.0
+    sample = entries[::len(entries) // SAMPLE_ITEMS]
+    return sample, len(entries) / len(sample)
+
+
+def deep_sizeof(obj, seen: Optional[set] = None, depth: int = 0) -> int:
+    """Bytes held by `obj` and what it references, not counting shared bot objects or anything in `seen`.
+
+    The entries of large containers are sampled, so this is an estimate for them.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen or depth > MAX_DEPTH or isinstance(obj, _OPAQUE):
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj, 0)
+    if isinstance(obj, _ATOMS):
+        return size
+    if isinstance(obj, dict):
+        pairs, scale = _sampled(list(obj.items()))
+        size += round(scale * sum(deep_sizeof(k, seen, depth + 1) + deep_sizeof(v, seen, depth + 1) for k, v in pairs))
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        items, scale = _sampled(list(obj))
+        size += round(scale * sum(deep_sizeof(item, seen, depth + 1) for item in items))
+    if hasattr(obj, "__dict__"):
+        size += deep_sizeof(vars(obj), seen, depth + 1)
+    for cls in type(obj).__mro__:
+        for slot in cls.__dict__.get("__slots__", ()):
+            if slot not in ("__dict__", "__weakref__"):
+                size += deep_sizeof(getattr(obj, slot, None), seen, depth + 1)
+    return size
+
+
+def sample_entries(container) -> list:
+    """Up to about `SAMPLE_ITEMS` evenly spaced entries of a container; (key, value) pairs for a mapping."""
+    step = max(1, len(container) // SAMPLE_ITEMS)
+    entries = container.items() if isinstance(container, Mapping) else container
+    return list(itertools.islice(entries, 0, None, step))
+
+
+def size_sample(container_bytes: int, count: int, sample: list, mapping: bool) -> int:
+    """The container's own size plus the mean deep size of the sampled entries, times the entry count."""
+    if not sample:
+        return container_bytes
+    seen = set()
+    if mapping:
+        sizes = [deep_sizeof(key, seen) + deep_sizeof(value, seen) for key, value in sample]
+    else:
+        sizes = [deep_sizeof(entry, seen) for entry in sample]
+    return container_bytes + round(sum(sizes) / len(sizes) * count)
+
+
+def estimate_bytes(container) -> int:
+    """The container's own size plus the mean deep size of a sample of its entries, times their count."""
+    sample = sample_entries(container)
+    return size_sample(sys.getsizeof(container, 0), len(container), sample, isinstance(container, Mapping))
+
+
+def _view_items(bot) -> list:
+    store = bot._connection._view_store
+    return [item for items in store._views.values() for item in items.values()]
+
+
+def _pagination_locks(bot) -> dict:
+    store = bot.pagination_store
+    return {row_id: lock for shard in getattr(store, "shards", [store]) for row_id, lock in shard._locks.items()}
+
+
+def _result_cache(bot):
+    return bot.search_client.result_cache._entries
+
+
+# name -> how to find it on the bot. Each returns a sized container.
+STRUCTURES: Dict[str, Callable] = {
+    "view_store": _view_items,
+    "message_cache": lambda bot: bot._connection._messages,
+    "user_cache": lambda bot: bot._connection._users,
+    "pagination_locks": _pagination_locks,
+    "banned_file_ids": lambda bot: bot.search_client.banned_file_ids,
+    "result_cache": _result_cache,
+    "local_index": lambda bot: bot.search_client.local_index.channels,
+    "channel_catalog": lambda bot: bot.search_client.catalog.guilds,
+}
+
+
+@dataclass
+class Gauge:
+    name: str
+    objects: int
+    bytes: int
+    budget: Optional[int] = None
+
+    @property
+    def over_budget(self) -> bool:
+        return self.budget is not None and self.bytes > self.budget
+
+
+def rss_bytes() -> Optional[int]:
+    """The process's resident set size, where /proc has it."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class MemoryMonitor:
+
+    def __init__(self, bot, interval: Optional[float] = INTERVAL_SECONDS, budgets: Optional[Dict[str, int]] = None):
+        """
+        Create a MemoryMonitor.
+
+        Args:
+            bot: The bot whose structures to measure; ones it doesn't have are skipped
+            interval: Seconds between measurements, or None to only measure when asked
+            budgets: Bytes each structure may take before it's flagged
+        """
+        self.bot = bot
+        self.interval = interval
+        self.budgets = BUDGETS if budgets is None else budgets
+        self.gauges: List[Gauge] = []
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        # Whether tracemalloc was started here, and so should be stopped here
+        self._tracing = False
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self.interval is not None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.stop_tracing()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.measure()
+                print(f"[memory] {self.summary()}")
+                for gauge in self.gauges:
+                    if gauge.over_budget:
+                        print(f"[memory] {gauge.name} is over budget: "
+                              f"{gauge.bytes / 2**20:.1f} MiB > {gauge.budget / 2**20:.1f} MiB")
+            except Exception as e:
+                print(f"[memory] measuring failed: {e!r}")
+
+    async def measure(self) -> List[Gauge]:
+        """Measure every structure the bot has, and keep the figures in `gauges`.
+
+        Entries are sampled on the loop, where nothing changes under the
+        sampling; sizing them, the slow part, runs in a thread.
+        """
+        samples = []
+        for name, find in STRUCTURES.items():
+            try:
+                container = find(self.bot)
+            except AttributeError:
+                continue
+            if container is None:
+                continue
+            mapping = isinstance(container, Mapping)
+            samples.append((name, len(container), sys.getsizeof(container, 0), sample_entries(container), mapping))
+        self.gauges = await asyncio.to_thread(self._size, samples)
+        return self.gauges
+
+    def _size(self, samples: list) -> List[Gauge]:
+        return [
+            Gauge(name, count, size_sample(own, count, sample, mapping), self.budgets.get(name))
+            for name, count, own, sample, mapping in samples
+        ]
+
+    def snapshot(self) -> dict:
+        """The last measurement, for the cluster health state."""
+        return {
+            "rss_bytes": rss_bytes(),
+            "structures": {g.name: {k: v for k, v in asdict(g).items() if k != "name"} for g in self.gauges},
+        }
+
+    def summary(self) -> str:
+        rss = rss_bytes()
+        parts = [f"rss {rss / 2**20:.0f} MiB"] if rss is not None else []
+        parts += [f"{g.name} {g.objects} ({g.bytes / 2**20:.1f} MiB)" for g in self.gauges]
+        return ", ".join(parts)
+
+    async def report(self) -> str:
+        """A plain-text table of the structures, measured now."""
+        await self.measure()
+        rss = rss_bytes()
+        lines = [f"rss {rss / 2**20:.1f} MiB" if rss is not None else "rss unknown"]
+        lines.append(f"{'structure':<18}{'objects':>10}{'MiB':>10}{'budget':>10}")
+        for g in self.gauges:
+            budget = f"{g.budget / 2**20:.0f}" if g.budget is not None else "-"
+            flag = "  OVER" if g.over_budget else ""
+            lines.append(f"{g.name:<18}{g.objects:>10}{g.bytes / 2**20:>10.2f}{budget:>10}{flag}")
+        if self._baseline is not None:
+            lines.append("tracing allocations; `diff` shows what grew")
+        return "\n".join(lines)
+
+    def start_tracing(self) -> None:
+        """Start tracemalloc, if needed, and take the snapshot later diffs are against."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACE_FRAMES)
+            self._tracing = True
+        self._baseline = tracemalloc.take_snapshot()
+
+    def stop_tracing(self) -> None:
+        self._baseline = None
+        if self._tracing:
+            self._tracing = False
+            tracemalloc.stop()
+
+    def trace_diff(self, top: int = 10) -> str:
+        """The lines that allocated the most since `start_tracing`, with the net growth of each."""
+        if self._baseline is None:
+            return "Not tracing; start tracing first."
+        filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ]
+        snapshot = tracemalloc.take_snapshot().filter_traces(filters)
+        stats = snapshot.compare_to(self._baseline.filter_traces(filters), "lineno")
+        total = sum(s.size_diff for s in stats)
+        lines = [f"{total / 2**20:+.2f} MiB since tracing started"]
+        for stat in stats[:top]:
+            frame = stat.traceback[0]
+            lines.append(f"{stat.size_diff / 1024:+10.1f} KiB {stat.count_diff:+8} blocks  "
+                         f"{os.path.basename(frame.filename)}:{frame.lineno}")
+        return "\n".join(lines)
@@ -0,0 +1,176 @@
+"""Sample the event loop's stacks for a while and write them out as collapsed stacks.
+
+A helper thread wakes every `interval`, grabs the loop thread's current
+stack and counts it, rooted at the asyncio task that was running: the task's
+name if it was given one, otherwise its coroutine's. A sample with no task
+running is the loop itself: `<idle>` while it waits in `select`, `<loop>`
+while it runs plain callbacks. With `all_threads`, other threads (such as
+`asyncio.to_thread` workers and database threads) are sampled too, rooted at
+`thread:<name>`.
+
+Each sample holds the GIL while it walks the stack, which takes time away
+from the loop, so the thread sleeps long enough between samples that
+sampling uses at most `max_overhead` of the wall clock, however deep the
+stacks are.
+
+`collapsed()` is in the format `flamegraph.pl`, speedscope and inferno read:
+one line per distinct stack, root first, frames joined by `;`, then a count.
+Only one profile can run at a time per process.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+
+INTERVAL_SECONDS = int(os.environ.get("HAYSTACK_PROFILE_INTERVAL_MS", 5)) / 1000
+MAX_OVERHEAD = float(os.environ.get("HAYSTACK_PROFILE_MAX_OVERHEAD", 0.02))
+MAX_SECONDS = 120
+
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_running = threading.Lock()
+
+
+class ProfileAlreadyRunning(Exception):
+    """Raised by `SamplingProfiler.start` while another profile is running."""
+
+
+def _task_label(task: asyncio.Task) -> str:
+    name = task.get_name()
+    if name.startswith("Task-"):
+        coro = task.get_coro()
+        name = getattr(coro, "__qualname__", None) or type(coro).__name__
+    return f"task:{name}"
+
+
+class SamplingProfiler:
+
+    def __init__(self, interval: float = INTERVAL_SECONDS, max_overhead: float = MAX_OVERHEAD,
+                 all_threads: bool = False):
+        """
+        Create a SamplingProfiler.
+
+        Args:
+            interval: Seconds between samples, when sampling is cheap enough
+            max_overhead: Fraction of wall-clock time sampling may take
+            all_threads: Sample every thread, not just the event loop's
+        """
+        self.interval = interval
+        self.max_overhead = max_overhead
+        self.all_threads = all_threads
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.sampling_seconds = 0.0
+        self.elapsed = 0.0
+        self._labels: Dict[object, str] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    @property
+    def overhead(self) -> float:
+        """Fraction of the profile's wall-clock time spent taking samples."""
+        return self.sampling_seconds / self.elapsed if self.elapsed else 0.0
+
+    def start(self) -> None:
+        """Start sampling the running event loop.
+
+        Raises:
+            ProfileAlreadyRunning: If another profile hasn't been stopped yet
+        """
+        if not _running.acquire(blocking=False):
+            raise ProfileAlreadyRunning()
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._sample_loop, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop sampling. The thread finishes its current sample first, which takes well under `interval`."""
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+        _running.release()
+
+    async def run(self, seconds: float) -> "SamplingProfiler":
+        """Sample for `seconds`, capped at `MAX_SECONDS`, and return self."""
+        self.start()
+        try:
+            await asyncio.sleep(min(seconds, MAX_SECONDS))
+        finally:
+            self.stop()
+        return self
+
+    def _sample_loop(self):
+        own_id = threading.get_ident()
+        names = {}
+        start = time.perf_counter()
+        delay = self.interval
+        while not self._stopped.wait(delay):
+            began = time.perf_counter()
+            frames = sys._current_frames()
+            loop_frame = frames.get(self._loop_thread_id)
+            if loop_frame is not None:
+                self.stacks[self._collapse(loop_frame, self._loop_root(loop_frame))] += 1
+            if self.all_threads:
+                if len(names) != threading.active_count():
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                for thread_id, frame in frames.items():
+                    if thread_id not in (own_id, self._loop_thread_id):
+                        self.stacks[self._collapse(frame, f"thread:{names.get(thread_id, thread_id)}")] += 1
+            self.samples += 1
+            cost = time.perf_counter() - began
+            self.sampling_seconds += cost
+            delay = max(self.interval, cost / self.max_overhead - cost)
+        self.elapsed = time.perf_counter() - start
+
+    def _loop_root(self, frame) -> str:
+        task = asyncio.current_task(self._loop)
+        if task is not None:
+            return _task_label(task)
+        return "<idle>" if frame.f_code.co_name in ("select", "poll", "control") else "<loop>"
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            path = code.co_filename
+            if path.startswith(_REPO_ROOT):
+                path = os.path.relpath(path, _REPO_ROOT)
+            else:
+                path = os.path.basename(path)
+            label = self._labels[code] = f"{code.co_name} ({path}:{code.co_firstlineno})".replace(";", ",")
+        return label
+
+    def _collapse(self, frame, root: str) -> str:
+        labels = []
+        while frame is not None:
+            labels.append(self._label(frame.f_code))
+            frame = frame.f_back
+        labels.append(root)
+        return ";".join(reversed(labels))
+
+    def collapsed(self) -> str:
+        """Every distinct stack and how many samples it had, one per line."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def report(self, roots: int = 10) -> str:
+        """Samples taken, the sampling cost, and the tasks and threads the samples fell in."""
+        lines = [
+            f"{self.samples} samples over {self.elapsed:.1f}s "
+            f"(every {self.elapsed / self.samples * 1000 if self.samples else 0:.1f}ms), "
+            f"overhead {self.overhead:.1%} (cap {self.max_overhead:.0%})"
+        ]
+        by_root: Counter = Counter()
+        for stack, count in self.stacks.items():
+            by_root[stack.split(";", 1)[0]] += count
+        total = sum(by_root.values())
+        for root, count in by_root.most_common(roots):
+            lines.append(f"{count / total:>7.1%} {count:>7}  {root}")
+        return "\n".join(lines)
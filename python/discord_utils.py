@@ -11,6 +11,9 @@ async def increment_command_count(bot: Bot, command_type: str, value: int = None
     match_string = r'(?P<desc>[a-zA-Z_ ]*): ?(?P<count>[0-9]*)?'
     channel_id = METRICS_CHANNEL_MAP[DB_NAME][command_type]
     channel = bot.get_channel(channel_id)
+    if channel is None:
+        # In cluster mode the metrics channel's guild may be on another cluster.
+        return
     channel_name = channel.name
     match = re.search(match_string, channel_name)
     desc, count = match.groups()
@@ -1,5 +1,4 @@
 from typing import List, Dict
-from dataclasses import asdict
 from .search.search_models import SearchResult
 
 template_top = """#!/usr/bin/env python3.6
@@ -70,7 +69,7 @@ for f in files:
 
 def generate_script(export_name: str, files: List[SearchResult], channels: Dict) -> str:
     """Generate the contents of a script file."""
-    dict_strs = list(map(lambda d: str(asdict(d)) + ',', files))
+    dict_strs = list(map(lambda d: str(dict(d.to_dict(), url=d.url)) + ',', files))
     template_middle = 'files = [\n'
     template_middle += '\n'.join(dict_strs)
     template_middle += ']\n'
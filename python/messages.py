@@ -3,9 +3,22 @@ EXPORT_COMMAND_DESCRIPTION = "Get a Python export script to download the files r
 NO_FILES_FOUND = ("I couldn't find any files related to your query. I may not have the `read_message_history` "
                   "permission for some channels.")
 RELOAD_DESCRIPTION = "Reloads the cog file. Use this to deploy changes to the bot"
+PROFILE_DESCRIPTION = "Profile the bot for a few seconds and get a flamegraph-ready file of where the time went"
+PROFILE_OWNER_ONLY = "Only the bot owner can profile the bot."
+PROFILE_ALREADY_RUNNING = "A profile is already running. Try again once it's finished."
 SEARCH_RESULTS_FOUND = "Found {}"
 MALFORMED_DATE_STRING = ("I couldn't understand the date you passed: {}. "
                          "I can understand most year-month-day hour-minute-second formats.")
 ERROR_LOG_MESSAGE = "Command: {}, Query: {}, Exception:\n{}, Value:\n{}"
 ERROR_SUPPORT_MESSAGE = "An error has occurred and the bot developer will be looking into the error soon."
 SEARCHING_MESSAGE = "Searching... I'll edit this message when I've found results!"
+FACETS_DESCRIPTION = "Count the files in this server by type, extension, channel and uploader."
+NO_FACETS_FOUND = "I haven't counted any files in this server for that time range yet."
+SEARCH_QUEUE_FULL = "I'm handling a lot of searches right now. Please try again in a minute!"
+SEARCH_USER_QUEUE_FULL = "You already have searches waiting. Please try again once they've finished!"
+NO_FILES_FOUND_YET = ("I stopped searching before finding any files, since this server has a lot of history. "
+                      "Try narrowing your search with a channel, an author or a date range.")
+PARTIAL_RESULTS = "I stopped searching early. Press Next to keep looking."
+STILL_SEARCHING = "Still searching... these are the best files I've found so far."
+FILES_DELETED_KEEP_LOOKING = "Every file found so far was deleted. Press Next to keep looking."
+NOTHING_MORE_YET = "I didn't find more files in the next stretch of history. Press Next to keep looking."
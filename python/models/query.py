@@ -1,9 +1,30 @@
 import json
 from dataclasses import dataclass
 import discord
-from dateutil import parser
 from datetime import datetime, timedelta
-from dateutil.parser import ParserError
+from typing import Dict, Optional
+
+
+DISCORD_EPOCH_MS = 1420070400000
+
+
+def cursor_map(raw: Optional[dict]) -> Optional[Dict[int, int]]:
+    """Normalize a stored `channel_date_map` to {channel id: snowflake}.
+
+    JSON turns the channel ids into strings. Cursors stored before they were
+    snowflakes are datetimes or ISO strings; those resume from the start of
+    their millisecond.
+    """
+    if not raw:
+        return raw
+    cursors = {}
+    for channel_id, cursor in raw.items():
+        if isinstance(cursor, str):
+            cursor = datetime.fromisoformat(cursor)
+        if isinstance(cursor, datetime):
+            cursor = (int(cursor.timestamp() * 1000) - DISCORD_EPOCH_MS) << 22
+        cursors[int(channel_id)] = cursor
+    return cursors
 
 
 @dataclass
@@ -17,7 +38,8 @@ class Query:
     after: str or datetime = None
     before: str or datetime = None
     dm: bool = False
-    channel_date_map: dict[str, datetime] = None
+    # Per channel, the snowflake that the next page's search continues below.
+    channel_date_map: Dict[int, int] = None
 
     def __post_init__(self):
         # Lazy import to avoid pulling in the full discord/bot_secrets graph
@@ -25,6 +47,11 @@ class Query:
         from ..messages import MALFORMED_DATE_STRING
         from ..exceptions import QueryException
 
+        if self.before or self.after:
+            # dateutil's parser is only needed for date-bounded queries.
+            from dateutil import parser
+            from dateutil.parser import ParserError
+
         if self.before:
             try:
                 before = parser.parse(self.before)
@@ -51,12 +78,6 @@ class Query:
         def _dt(v):
             return v.isoformat() if isinstance(v, datetime) else v
 
-        cdm = None
-        if self.channel_date_map:
-            cdm = {
-                k: (v.isoformat() if isinstance(v, datetime) else v)
-                for k, v in self.channel_date_map.items()
-            }
         return json.dumps({
             "filename": self.filename,
             "filetype": self.filetype,
@@ -67,7 +88,7 @@ class Query:
             "after": _dt(self.after),
             "before": _dt(self.before),
             "dm": self.dm,
-            "channel_date_map": cdm,
+            "channel_date_map": self.channel_date_map,
         })
 
     @classmethod
@@ -92,12 +113,6 @@ class Query:
         obj.after = datetime.fromisoformat(d["after"]) if d.get("after") else None
         obj.before = datetime.fromisoformat(d["before"]) if d.get("before") else None
         obj.dm = d.get("dm", False)
-        cdm = d.get("channel_date_map")
-        if cdm:
-            cdm = {
-                k: (datetime.fromisoformat(v) if isinstance(v, str) else v)
-                for k, v in cdm.items()
-            }
-        obj.channel_date_map = cdm
+        obj.channel_date_map = cursor_map(d.get("channel_date_map"))
         return obj
 
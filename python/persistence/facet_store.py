@@ -0,0 +1,252 @@
+"""SQLite-backed counters behind `/facets`.
+
+`facet_counts` holds attachment counts per guild, day and facet (category,
+extension, channel, uploader), so a facet query is a range sum over days.
+`facet_ledger` remembers what each counted message contributed, which is what
+lets a delete event (which only carries ids) take it back out, and lets a
+reconcile find messages that were counted but no longer exist.
+`facet_watermarks` records up to when each channel was last reconciled, and
+whether that reconcile finished or stopped partway, to be resumed.
+"""
+import json
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import aiosqlite
+
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS facet_counts (
+    guild_id      INTEGER NOT NULL,
+    day           INTEGER NOT NULL,
+    dimension     TEXT    NOT NULL,
+    key           TEXT    NOT NULL,
+    count         INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, day, dimension, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS facet_ledger (
+    message_id    INTEGER PRIMARY KEY,
+    guild_id      INTEGER NOT NULL,
+    channel_id    INTEGER NOT NULL,
+    author_id     INTEGER NOT NULL,
+    created_at    INTEGER NOT NULL,
+    attachments   TEXT    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_facet_ledger_channel ON facet_ledger(channel_id, created_at);
+CREATE TABLE IF NOT EXISTS facet_watermarks (
+    channel_id    INTEGER PRIMARY KEY,
+    guild_id      INTEGER NOT NULL,
+    reconciled_at INTEGER NOT NULL,
+    complete      INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS idx_facet_watermarks_guild ON facet_watermarks(guild_id);
+"""
+
+DAY_MS = 24 * 3600 * 1000
+DIMENSIONS = ("category", "extension", "channel", "uploader")
+# Ids bound per `IN (...)` list, well under SQLite's limit on variables.
+IN_CHUNK = 500
+
+# (category, extension) of one attachment
+Attachment = Tuple[str, str]
+
+
+def day_of(created_at_ms: int) -> int:
+    return created_at_ms // DAY_MS
+
+
+def _deltas(guild_id: int, channel_id: int, author_id: int, created_at: int,
+            attachments: Sequence[Attachment], sign: int) -> List[tuple]:
+    day = day_of(created_at)
+    counts: Dict[Tuple[str, str], int] = {}
+    for category, extension in attachments:
+        for dimension, key in (("category", category), ("extension", extension),
+                               ("channel", str(channel_id)), ("uploader", str(author_id))):
+            counts[(dimension, key)] = counts.get((dimension, key), 0) + sign
+    return [(guild_id, day, dimension, key, n) for (dimension, key), n in counts.items()]
+
+
+class FacetStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._db: Optional[aiosqlite.Connection] = None
+
+    async def init(self) -> None:
+        parent = os.path.dirname(self.path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self._db = await aiosqlite.connect(self.path)
+        self._db.row_factory = aiosqlite.Row
+        await self._execute("PRAGMA journal_mode=WAL;")
+        await self._execute("PRAGMA synchronous=NORMAL;")
+        await self._migrate()
+        await self._db.executescript(SCHEMA_SQL)
+        await self._db.commit()
+
+    async def _migrate(self) -> None:
+        async with self._db.execute("PRAGMA table_info(facet_watermarks)") as cur:
+            columns = {row["name"] for row in await cur.fetchall()}
+        if columns and "complete" not in columns:
+            # Databases created before reconciles could stop partway.
+            await self._execute("ALTER TABLE facet_watermarks ADD COLUMN complete INTEGER NOT NULL DEFAULT 1")
+
+    async def close(self) -> None:
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+    async def _execute(self, sql: str, params=(), many: bool = False) -> int:
+        """Run a write and close its cursor. Returns the number of rows changed.
+
+        A cursor left to the garbage collector is finalized on the event loop's
+        thread, where it can reset a cached statement that the connection's
+        thread is running for another write.
+        """
+        if many:
+            cursor = await self._db.executemany(sql, params)
+        else:
+            cursor = await self._db.execute(sql, params)
+        rowcount = cursor.rowcount
+        await cursor.close()
+        return rowcount
+
+    async def add_message(
+        self,
+        *,
+        message_id: int,
+        guild_id: int,
+        channel_id: int,
+        author_id: int,
+        created_at: int,
+        attachments: Sequence[Attachment],
+        commit: bool = True,
+    ) -> bool:
+        """Count a message's attachments, unless it was already counted. Returns whether it was added."""
+        if not attachments:
+            return False
+        added = await self._execute(
+            "INSERT OR IGNORE INTO facet_ledger "
+            "(message_id, guild_id, channel_id, author_id, created_at, attachments) VALUES (?, ?, ?, ?, ?, ?)",
+            (message_id, guild_id, channel_id, author_id, created_at, json.dumps(attachments)),
+        ) == 1
+        if added:
+            await self._apply(_deltas(guild_id, channel_id, author_id, created_at, attachments, +1))
+        if commit:
+            await self._db.commit()
+        return added
+
+    async def remove_messages(self, message_ids: Iterable[int], commit: bool = True) -> int:
+        """Take previously counted messages back out. Returns how many were counted."""
+        message_ids = list(message_ids)
+        removed = 0
+        for start in range(0, len(message_ids), IN_CHUNK):
+            chunk = message_ids[start:start + IN_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            async with self._db.execute(
+                "SELECT guild_id, channel_id, author_id, created_at, attachments FROM facet_ledger "
+                f"WHERE message_id IN ({placeholders})", chunk,
+            ) as cur:
+                rows = await cur.fetchall()
+            if not rows:
+                continue
+            deltas = []
+            for row in rows:
+                attachments = [tuple(a) for a in json.loads(row["attachments"])]
+                deltas += _deltas(row["guild_id"], row["channel_id"], row["author_id"], row["created_at"],
+                                  attachments, -1)
+            await self._apply(deltas)
+            await self._execute(f"DELETE FROM facet_ledger WHERE message_id IN ({placeholders})", chunk)
+            # Only the counters just decremented can have reached zero.
+            await self._execute(
+                "DELETE FROM facet_counts WHERE guild_id=? AND day=? AND dimension=? AND key=? AND count <= 0",
+                list({delta[:4] for delta in deltas}),
+                many=True,
+            )
+            removed += len(rows)
+        if commit:
+            await self._db.commit()
+        return removed
+
+    async def ledger_entry(self, message_id: int) -> Optional[dict]:
+        async with self._db.execute(
+            "SELECT guild_id, channel_id, author_id, created_at FROM facet_ledger WHERE message_id=?",
+            (message_id,),
+        ) as cur:
+            row = await cur.fetchone()
+        return dict(row) if row is not None else None
+
+    async def message_ids_between(self, channel_id: int, start_ms: int, end_ms: int) -> Set[int]:
+        """Ids of counted messages in a channel created in [start_ms, end_ms)."""
+        async with self._db.execute(
+            "SELECT message_id FROM facet_ledger WHERE channel_id=? AND created_at >= ? AND created_at < ?",
+            (channel_id, start_ms, end_ms),
+        ) as cur:
+            return {row[0] for row in await cur.fetchall()}
+
+    async def channel_message_ids(self, channel_id: int) -> Set[int]:
+        async with self._db.execute(
+            "SELECT message_id FROM facet_ledger WHERE channel_id=?", (channel_id,)
+        ) as cur:
+            return {row[0] for row in await cur.fetchall()}
+
+    async def counts(
+        self, guild_id: int, first_day: Optional[int] = None, last_day: Optional[int] = None
+    ) -> Dict[str, Dict[str, int]]:
+        """Attachment counts per dimension and key for a guild, over days [first_day, last_day]."""
+        first_day = first_day if first_day is not None else -(2 ** 62)
+        last_day = last_day if last_day is not None else 2 ** 62
+        facets: Dict[str, Dict[str, int]] = {dimension: {} for dimension in DIMENSIONS}
+        async with self._db.execute(
+            "SELECT dimension, key, SUM(count) FROM facet_counts "
+            "WHERE guild_id=? AND day BETWEEN ? AND ? GROUP BY dimension, key",
+            (guild_id, first_day, last_day),
+        ) as cur:
+            async for dimension, key, count in cur:
+                if count > 0:
+                    facets[dimension][key] = count
+        return facets
+
+    async def watermark(self, channel_id: int) -> Optional[Tuple[int, bool]]:
+        """When a channel was last reconciled up to, and whether that reconcile finished."""
+        async with self._db.execute(
+            "SELECT reconciled_at, complete FROM facet_watermarks WHERE channel_id=?", (channel_id,)
+        ) as cur:
+            row = await cur.fetchone()
+        return (row[0], bool(row[1])) if row is not None else None
+
+    async def watermarks(self, guild_id: int) -> Dict[int, Tuple[int, bool]]:
+        """`watermark` for every channel of a guild that has one."""
+        async with self._db.execute(
+            "SELECT channel_id, reconciled_at, complete FROM facet_watermarks WHERE guild_id=?", (guild_id,)
+        ) as cur:
+            return {row[0]: (row[1], bool(row[2])) for row in await cur.fetchall()}
+
+    async def set_watermark(self, channel_id: int, guild_id: int, reconciled_at: int, complete: bool = True) -> None:
+        await self._execute(
+            "INSERT INTO facet_watermarks (channel_id, guild_id, reconciled_at, complete) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(channel_id) DO UPDATE SET reconciled_at=excluded.reconciled_at, complete=excluded.complete",
+            (channel_id, guild_id, reconciled_at, int(complete)),
+        )
+        await self._db.commit()
+
+    async def forget_channel(self, channel_id: int) -> None:
+        """Uncount every message in a deleted channel."""
+        await self.remove_messages(await self.channel_message_ids(channel_id), commit=False)
+        await self._execute("DELETE FROM facet_watermarks WHERE channel_id=?", (channel_id,))
+        await self._db.commit()
+
+    async def commit(self) -> None:
+        await self._db.commit()
+
+    async def _apply(self, deltas: List[tuple]) -> None:
+        await self._execute(
+            "INSERT INTO facet_counts (guild_id, day, dimension, key, count) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(guild_id, day, dimension, key) DO UPDATE SET count = count + excluded.count",
+            deltas,
+            many=True,
+        )
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
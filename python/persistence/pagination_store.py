@@ -3,12 +3,24 @@
 Survives bot restarts so users can keep clicking Next/Back on a search result
 message they posted earlier. State is keyed by a `row_id` (uuid4 hex) which is
 baked into the persistent component custom_ids.
+
+`pagination_refs` is a reverse index from the message_id of every file shown
+on a stored page to the rows showing it, so deleted files can be pruned from
+the rows that reference them without scanning every row.
+
+Every row carries a `version`, bumped by each update. Processes sharing the
+database (during a rolling restart, or clusters pointed at one file) can't
+see each other's locks, so a read-modify-write passes the version it read to
+`update`, which only applies if the row is unchanged since. Within a
+process, `lock_for` keeps clicks on one row from racing at all; its locks
+are a bounded cache, since correctness no longer depends on them.
 """
 import asyncio
 import os
 import time
 import uuid
-from typing import Optional
+from collections import OrderedDict
+from typing import Iterable, Optional
 
 import aiosqlite
 
@@ -25,17 +37,35 @@ CREATE TABLE IF NOT EXISTS pagination_rows (
     current_page  INTEGER NOT NULL DEFAULT 1,
     last_page     INTEGER NOT NULL DEFAULT -1,
     created_at    INTEGER NOT NULL,
-    updated_at    INTEGER NOT NULL
+    updated_at    INTEGER NOT NULL,
+    version       INTEGER NOT NULL DEFAULT 0
 );
 CREATE INDEX IF NOT EXISTS idx_pagination_updated ON pagination_rows(updated_at);
+CREATE TABLE IF NOT EXISTS pagination_refs (
+    message_id    INTEGER NOT NULL,
+    row_id        TEXT    NOT NULL,
+    PRIMARY KEY (message_id, row_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_pagination_refs_row ON pagination_refs(row_id);
 """
 
+# Rows untouched for this long are swept by vacuum_old and no longer served.
+DEFAULT_TTL_SECONDS = 24 * 3600
+
+ROW_COLUMNS = (
+    "row_id, message_id, channel_id, guild_id, user_id, "
+    "query_json, pages_json, current_page, last_page, version"
+)
+# Per-row locks kept before the least recently used idle ones are dropped.
+LOCK_CACHE_SIZE = 4096
+
 
 class PaginationStore:
-    def __init__(self, path: str):
+    def __init__(self, path: str, lock_cache_size: int = LOCK_CACHE_SIZE):
         self.path = path
         self._db: Optional[aiosqlite.Connection] = None
-        self._locks: dict[str, asyncio.Lock] = {}
+        self._locks: "OrderedDict[str, asyncio.Lock]" = OrderedDict()
+        self._lock_cache_size = lock_cache_size
         self._registry_lock = asyncio.Lock()
 
     async def init(self) -> None:
@@ -44,24 +74,68 @@ class PaginationStore:
             os.makedirs(parent, exist_ok=True)
         self._db = await aiosqlite.connect(self.path)
         self._db.row_factory = aiosqlite.Row
-        await self._db.execute("PRAGMA journal_mode=WAL;")
-        await self._db.execute("PRAGMA synchronous=NORMAL;")
+        await self._execute("PRAGMA journal_mode=WAL;")
+        await self._execute("PRAGMA synchronous=NORMAL;")
         await self._db.executescript(SCHEMA_SQL)
+        await self._migrate()
         await self._db.commit()
 
+    async def _migrate(self) -> None:
+        async with self._db.execute("PRAGMA table_info(pagination_rows)") as cur:
+            columns = {row["name"] for row in await cur.fetchall()}
+        if "version" not in columns:
+            # Databases created before rows were versioned.
+            try:
+                await self._execute("ALTER TABLE pagination_rows ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            except aiosqlite.OperationalError as e:
+                # Another process sharing the database got there first.
+                if "duplicate column" not in str(e):
+                    raise
+
     async def close(self) -> None:
         if self._db is not None:
             await self._db.close()
             self._db = None
 
+    async def _execute(self, sql: str, params=(), many: bool = False) -> int:
+        """Run a write and close its cursor. Returns the number of rows changed.
+
+        A cursor left to the garbage collector is finalized on the event loop's
+        thread, where it can reset a cached statement that the connection's
+        thread is running for another click.
+        """
+        if many:
+            cursor = await self._db.executemany(sql, params)
+        else:
+            cursor = await self._db.execute(sql, params)
+        rowcount = cursor.rowcount
+        await cursor.close()
+        return rowcount
+
     async def lock_for(self, row_id: str) -> asyncio.Lock:
         async with self._registry_lock:
             lock = self._locks.get(row_id)
             if lock is None:
                 lock = asyncio.Lock()
                 self._locks[row_id] = lock
+            self._locks.move_to_end(row_id)
+            if len(self._locks) > self._lock_cache_size:
+                self._evict_locks()
             return lock
 
+    def _evict_locks(self) -> None:
+        """Drop the least recently used locks that nobody holds or waits on."""
+        for row_id in list(self._locks):
+            if len(self._locks) <= self._lock_cache_size:
+                return
+            if not self._locks[row_id].locked():
+                del self._locks[row_id]
+
+    @staticmethod
+    def new_row_id() -> str:
+        """Mint a row_id up front, for callers that bake it into the page they're about to store."""
+        return uuid.uuid4().hex
+
     async def create(
         self,
         *,
@@ -71,10 +145,12 @@ class PaginationStore:
         query_json: str,
         pages_json: str,
         last_page: int = -1,
+        row_id: Optional[str] = None,
+        add_refs: Iterable[int] = (),
     ) -> str:
-        row_id = uuid.uuid4().hex
+        row_id = row_id or self.new_row_id()
         now = int(time.time())
-        await self._db.execute(
+        await self._execute(
             "INSERT INTO pagination_rows "
             "(row_id, channel_id, guild_id, user_id, query_json, pages_json, "
             "current_page, last_page, created_at, updated_at) "
@@ -82,11 +158,12 @@ class PaginationStore:
             (row_id, channel_id, guild_id, user_id, query_json, pages_json,
              last_page, now, now),
         )
+        await self._add_refs(row_id, add_refs)
         await self._db.commit()
         return row_id
 
     async def attach_message(self, row_id: str, message_id: int) -> None:
-        await self._db.execute(
+        await self._execute(
             "UPDATE pagination_rows SET message_id=?, updated_at=? WHERE row_id=?",
             (message_id, int(time.time()), row_id),
         )
@@ -94,9 +171,7 @@ class PaginationStore:
 
     async def load(self, row_id: str) -> Optional[dict]:
         async with self._db.execute(
-            "SELECT row_id, message_id, channel_id, guild_id, user_id, "
-            "query_json, pages_json, current_page, last_page "
-            "FROM pagination_rows WHERE row_id=?",
+            f"SELECT {ROW_COLUMNS} FROM pagination_rows WHERE row_id=?",
             (row_id,),
         ) as cur:
             row = await cur.fetchone()
@@ -110,41 +185,110 @@ class PaginationStore:
         current_page: int,
         last_page: int,
         query_json: str,
-    ) -> None:
-        await self._db.execute(
+        add_refs: Iterable[int] = (),
+        expected_version: Optional[int] = None,
+    ) -> bool:
+        """
+        Store a row's new state.
+
+        Args:
+            row_id: The row to update
+            pages_json: Every stored page
+            current_page: The page the message shows
+            last_page: The last page, or -1 if there may be more
+            query_json: The query, with the cursor for the next page
+            add_refs: Message ids of files on newly stored pages
+            expected_version: Only update if the row is still at this version
+
+        Returns:
+            Whether the row was updated. False means another writer changed it
+            since `expected_version` was read, or it's gone.
+        """
+        sql = (
             "UPDATE pagination_rows SET pages_json=?, current_page=?, last_page=?, "
-            "query_json=?, updated_at=? WHERE row_id=?",
-            (pages_json, current_page, last_page, query_json, int(time.time()), row_id),
+            "query_json=?, updated_at=?, version=version+1 WHERE row_id=?"
         )
+        params = (pages_json, current_page, last_page, query_json, int(time.time()), row_id)
+        if expected_version is not None:
+            sql += " AND version=?"
+            params += (expected_version,)
+        updated = await self._execute(sql, params) == 1
+        if updated:
+            await self._add_refs(row_id, add_refs)
         await self._db.commit()
+        return updated
 
-    async def delete(self, row_id: str) -> None:
-        await self._db.execute(
-            "DELETE FROM pagination_rows WHERE row_id=?", (row_id,)
-        )
+    async def delete(self, row_id: str, expected_version: Optional[int] = None) -> bool:
+        """Delete a row, only if it's still at `expected_version` when given. Returns whether it was."""
+        sql, params = "DELETE FROM pagination_rows WHERE row_id=?", (row_id,)
+        if expected_version is not None:
+            sql, params = sql + " AND version=?", params + (expected_version,)
+        deleted = await self._execute(sql, params) == 1
+        if deleted or expected_version is None:
+            await self._execute(
+                "DELETE FROM pagination_refs WHERE row_id=?", (row_id,)
+            )
+            async with self._registry_lock:
+                self._locks.pop(row_id, None)
         await self._db.commit()
-        async with self._registry_lock:
-            self._locks.pop(row_id, None)
+        return deleted
 
     async def iter_active(self, ttl_seconds: int) -> list[dict]:
         """Return all rows with a message_id and updated_at within the TTL window."""
         cutoff = int(time.time()) - ttl_seconds
         async with self._db.execute(
-            "SELECT row_id, message_id, channel_id, guild_id, user_id, "
-            "query_json, pages_json, current_page, last_page "
-            "FROM pagination_rows "
+            f"SELECT {ROW_COLUMNS} FROM pagination_rows "
             "WHERE message_id IS NOT NULL AND updated_at >= ?",
             (cutoff,),
         ) as cur:
             rows = await cur.fetchall()
         return [dict(r) for r in rows]
 
+    async def rows_referencing(
+        self, message_ids: Iterable[int], ttl_seconds: int = DEFAULT_TTL_SECONDS
+    ) -> list[dict]:
+        """Return active rows whose stored pages show a file from any of `message_ids`."""
+        message_ids = list(message_ids)
+        if not message_ids:
+            return []
+        cutoff = int(time.time()) - ttl_seconds
+        placeholders = ",".join("?" * len(message_ids))
+        async with self._db.execute(
+            f"SELECT {ROW_COLUMNS} FROM pagination_rows WHERE updated_at >= ? AND row_id IN ("
+            f"SELECT row_id FROM pagination_refs WHERE message_id IN ({placeholders}))",
+            (cutoff, *message_ids),
+        ) as cur:
+            rows = await cur.fetchall()
+        return [dict(r) for r in rows]
+
+    async def drop_refs(self, message_ids: Iterable[int]) -> None:
+        """Forget `message_ids` in the reverse index, e.g. once their messages are deleted."""
+        message_ids = list(message_ids)
+        if not message_ids:
+            return
+        placeholders = ",".join("?" * len(message_ids))
+        await self._execute(
+            f"DELETE FROM pagination_refs WHERE message_id IN ({placeholders})", message_ids
+        )
+        await self._db.commit()
+
+    async def _add_refs(self, row_id: str, message_ids: Iterable[int]) -> None:
+        await self._execute(
+            "INSERT OR IGNORE INTO pagination_refs (message_id, row_id) VALUES (?, ?)",
+            [(message_id, row_id) for message_id in set(message_ids)],
+            many=True,
+        )
+
     async def vacuum_old(self, ttl_seconds: int) -> int:
         cutoff = int(time.time()) - ttl_seconds
-        cur = await self._db.execute(
+        await self._execute(
+            "DELETE FROM pagination_refs WHERE row_id IN "
+            "(SELECT row_id FROM pagination_rows WHERE updated_at < ?)", (cutoff,)
+        )
+        deleted = await self._execute(
             "DELETE FROM pagination_rows WHERE updated_at < ?", (cutoff,)
         )
         await self._db.commit()
         async with self._registry_lock:
             self._locks.clear()
-        return cur.rowcount
+        return deleted
@@ -0,0 +1,87 @@
+"""`PaginationStore` spread over several SQLite files, so writes aren't serialized behind one writer.
+
+Each row lives in the shard its `row_id` hashes to, along with its
+`pagination_refs` entries. Every shard is an ordinary `PaginationStore` with
+its own connection (and so its own writer thread) and its own WAL, so clicks
+on rows in different shards commit in parallel. Calls for one row go to its
+shard; calls that span rows (`iter_active`, `rows_referencing`, `drop_refs`,
+`vacuum_old`) are sent to every shard at once and their results combined.
+
+Changing the number of shards moves rows to other shards, so rows written
+before the change are no longer found. They're only kept for
+`DEFAULT_TTL_SECONDS` anyway.
+"""
+import asyncio
+import os
+import zlib
+from typing import Iterable, List, Optional
+
+from .pagination_store import PaginationStore
+
+
+def shard_path(path: str, shard: int) -> str:
+    """`pagination.sqlite3` -> `pagination.2.sqlite3`."""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{shard}{ext}"
+
+
+class ShardedPaginationStore:
+
+    def __init__(self, path: str, shards: int):
+        """
+        Create a ShardedPaginationStore.
+
+        Args:
+            path: Database path; shard `i` is stored at `shard_path(path, i)`
+            shards: Number of database files
+        """
+        if shards < 1:
+            raise ValueError("shards must be at least 1")
+        self.path = path
+        self.shards: List[PaginationStore] = [PaginationStore(shard_path(path, i)) for i in range(shards)]
+
+    def shard_for(self, row_id: str) -> PaginationStore:
+        return self.shards[zlib.crc32(row_id.encode()) % len(self.shards)]
+
+    async def init(self) -> None:
+        await asyncio.gather(*(shard.init() for shard in self.shards))
+
+    async def close(self) -> None:
+        await asyncio.gather(*(shard.close() for shard in self.shards))
+
+    async def lock_for(self, row_id: str) -> asyncio.Lock:
+        return await self.shard_for(row_id).lock_for(row_id)
+
+    new_row_id = staticmethod(PaginationStore.new_row_id)
+
+    async def create(self, *, row_id: Optional[str] = None, **kwargs) -> str:
+        row_id = row_id or self.new_row_id()
+        return await self.shard_for(row_id).create(row_id=row_id, **kwargs)
+
+    async def attach_message(self, row_id: str, message_id: int) -> None:
+        await self.shard_for(row_id).attach_message(row_id, message_id)
+
+    async def load(self, row_id: str) -> Optional[dict]:
+        return await self.shard_for(row_id).load(row_id)
+
+    async def update(self, row_id: str, **kwargs) -> bool:
+        return await self.shard_for(row_id).update(row_id, **kwargs)
+
+    async def delete(self, row_id: str, **kwargs) -> bool:
+        return await self.shard_for(row_id).delete(row_id, **kwargs)
+
+    async def iter_active(self, ttl_seconds: int) -> list[dict]:
+        results = await asyncio.gather(*(shard.iter_active(ttl_seconds) for shard in self.shards))
+        return [row for rows in results for row in rows]
+
+    async def rows_referencing(self, message_ids: Iterable[int], **kwargs) -> list[dict]:
+        message_ids = list(message_ids)
+        results = await asyncio.gather(*(shard.rows_referencing(message_ids, **kwargs) for shard in self.shards))
+        return [row for rows in results for row in rows]
+
+    async def drop_refs(self, message_ids: Iterable[int]) -> None:
+        message_ids = list(message_ids)
+        await asyncio.gather(*(shard.drop_refs(message_ids) for shard in self.shards))
+
+    async def vacuum_old(self, ttl_seconds: int) -> int:
+        return sum(await asyncio.gather(*(shard.vacuum_old(ttl_seconds) for shard in self.shards)))
@@ -0,0 +1,247 @@
+"""Admission control for searches: per-guild and per-user caps, fair queuing between guilds.
+
+At most `max_running` searches run at once, at most `per_guild` of them for one
+guild and `per_user` for one user. Searches past those caps wait in their
+guild's queue. When a slot frees up, it goes to the waiting search with the
+smallest virtual finish time, start-time fair queuing: each guild's searches
+are spaced `1 / weight` apart on a virtual clock that advances as searches are
+dispatched, so a guild that fires dozens of searches gets its fair share, not
+the whole bot, and a guild that searches rarely goes to the front.
+
+Queues are bounded. A search that would overflow its guild's queue, the
+user's queue, or the total is rejected at once rather than left waiting.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional
+
+
+MAX_RUNNING = int(os.environ.get("HAYSTACK_MAX_SEARCHES", 16))
+PER_GUILD = int(os.environ.get("HAYSTACK_GUILD_SEARCHES", 4))
+PER_USER = int(os.environ.get("HAYSTACK_USER_SEARCHES", 1))
+GUILD_QUEUE = int(os.environ.get("HAYSTACK_GUILD_QUEUE", 8))
+USER_QUEUE = int(os.environ.get("HAYSTACK_USER_QUEUE", 2))
+TOTAL_QUEUE = int(os.environ.get("HAYSTACK_SEARCH_QUEUE", 256))
+# Recent waits kept for the wait-time percentiles.
+WAIT_SAMPLES = 1000
+
+
+class AdmissionRejected(Exception):
+    """A search was shed because a queue it would join is full."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+@dataclass
+class _Waiter:
+    guild_id: int
+    user_id: int
+    tag: float
+    enqueued: float
+    future: asyncio.Future
+
+
+@dataclass
+class _GuildState:
+    running: int = 0
+    queue: Deque[_Waiter] = field(default_factory=deque)
+    # Virtual finish time of this guild's latest search
+    last_tag: float = 0.0
+
+
+class AdmissionController:
+
+    def __init__(
+        self,
+        max_running: int = MAX_RUNNING,
+        per_guild: int = PER_GUILD,
+        per_user: int = PER_USER,
+        guild_queue: int = GUILD_QUEUE,
+        user_queue: int = USER_QUEUE,
+        total_queue: int = TOTAL_QUEUE,
+        weights: Optional[Dict[int, float]] = None,
+    ):
+        """
+        Create an AdmissionController.
+
+        Args:
+            max_running: Searches that may run at once
+            per_guild: Searches one guild may run at once
+            per_user: Searches one user may run at once
+            guild_queue: Searches that may wait per guild
+            user_queue: Searches that may wait per user
+            total_queue: Searches that may wait in total
+            weights: Share of the bot per guild id, relative to the default of 1
+        """
+        self.max_running = max_running
+        self.per_guild = per_guild
+        self.per_user = per_user
+        self.guild_queue = guild_queue
+        self.user_queue = user_queue
+        self.total_queue = total_queue
+        self.weights = weights or {}
+        self.guilds: Dict[int, _GuildState] = {}
+        self.users_running: Dict[int, int] = {}
+        self.users_queued: Dict[int, int] = {}
+        self.running = 0
+        self.queued = 0
+        self.virtual_time = 0.0
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {"guild": 0, "user": 0, "total": 0}
+        self.waits: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+
+    @asynccontextmanager
+    async def admit(self, guild_id: int, user_id: int):
+        """
+        Hold a search slot for the duration of the block, waiting for one if needed.
+
+        Args:
+            guild_id: The guild searched, or the channel id for a DM
+            user_id: The user searching
+
+        Raises:
+            AdmissionRejected: If the search would overflow a queue
+        """
+        await self._acquire(guild_id, user_id)
+        try:
+            yield
+        finally:
+            self._release(guild_id, user_id)
+
+    async def _acquire(self, guild_id: int, user_id: int) -> None:
+        guild = self.guilds.setdefault(guild_id, _GuildState())
+        if not guild.queue and self._can_run(guild, user_id):
+            guild.last_tag = self._next_tag(guild, guild_id)
+            self._start(guild, user_id, waited=0.0)
+            return
+        if len(guild.queue) >= self.guild_queue:
+            self._reject(guild_id, "guild")
+        if self.users_queued.get(user_id, 0) >= self.user_queue:
+            self._reject(guild_id, "user")
+        if self.queued >= self.total_queue:
+            self._reject(guild_id, "total")
+
+        tag = guild.last_tag = self._next_tag(guild, guild_id)
+        waiter = _Waiter(guild_id, user_id, tag, time.perf_counter(), asyncio.get_running_loop().create_future())
+        guild.queue.append(waiter)
+        self.queued += 1
+        self.users_queued[user_id] = self.users_queued.get(user_id, 0) + 1
+        # The searches ahead in the queue may be held by their users' caps.
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Dispatched just as it was cancelled: hand the slot on.
+                self._release(guild_id, user_id)
+            else:
+                self._dequeue(guild, waiter)
+                self._dispatch()
+                self._forget_if_idle(guild_id)
+            raise
+
+    def _reject(self, guild_id: int, reason: str) -> None:
+        self.rejected[reason] += 1
+        self._forget_if_idle(guild_id)
+        raise AdmissionRejected(reason)
+
+    def _forget_if_idle(self, guild_id: int) -> None:
+        guild = self.guilds.get(guild_id)
+        if guild is not None and not guild.running and not guild.queue:
+            # An idle guild starts over at the current virtual time.
+            del self.guilds[guild_id]
+
+    def _next_tag(self, guild: _GuildState, guild_id: int) -> float:
+        return max(self.virtual_time, guild.last_tag) + 1 / self.weights.get(guild_id, 1.0)
+
+    def _can_run(self, guild: _GuildState, user_id: int) -> bool:
+        return (
+            self.running < self.max_running
+            and guild.running < self.per_guild
+            and self.users_running.get(user_id, 0) < self.per_user
+        )
+
+    def _start(self, guild: _GuildState, user_id: int, waited: float) -> None:
+        self.running += 1
+        guild.running += 1
+        self.users_running[user_id] = self.users_running.get(user_id, 0) + 1
+        self.admitted += 1
+        self.waits.append(waited)
+
+    def _dequeue(self, guild: _GuildState, waiter: _Waiter) -> None:
+        guild.queue.remove(waiter)
+        self.queued -= 1
+        self.users_queued[waiter.user_id] -= 1
+        if not self.users_queued[waiter.user_id]:
+            del self.users_queued[waiter.user_id]
+
+    def _release(self, guild_id: int, user_id: int) -> None:
+        guild = self.guilds[guild_id]
+        self.running -= 1
+        guild.running -= 1
+        self.users_running[user_id] -= 1
+        if not self.users_running[user_id]:
+            del self.users_running[user_id]
+        self._dispatch()
+        self._forget_if_idle(guild_id)
+
+    def _dispatch(self) -> None:
+        """Start waiting searches, smallest virtual finish time first, while slots are free."""
+        while self.running < self.max_running:
+            best: Optional[_Waiter] = None
+            for guild in self.guilds.values():
+                if guild.running >= self.per_guild:
+                    continue
+                for waiter in guild.queue:
+                    if self.users_running.get(waiter.user_id, 0) < self.per_user:
+                        if best is None or waiter.tag < best.tag:
+                            best = waiter
+                        break
+            if best is None:
+                return
+            guild = self.guilds[best.guild_id]
+            self._dequeue(guild, best)
+            self.virtual_time = max(self.virtual_time, best.tag - 1 / self.weights.get(best.guild_id, 1.0))
+            self._start(guild, best.user_id, waited=time.perf_counter() - best.enqueued)
+            best.future.set_result(None)
+
+    def snapshot(self) -> dict:
+        """Queue depths, wait-time percentiles and admission counts."""
+        waits = sorted(self.waits)
+        depths = {guild_id: len(g.queue) for guild_id, g in self.guilds.items() if g.queue}
+        return {
+            "running": self.running,
+            "queued": self.queued,
+            "deepest_queues": dict(sorted(depths.items(), key=lambda item: item[1], reverse=True)[:5]),
+            "wait_ms": {
+                "p50": round(_percentile(waits, 0.5) * 1000, 1),
+                "p99": round(_percentile(waits, 0.99) * 1000, 1),
+                "max": round(waits[-1] * 1000, 1) if waits else 0.0,
+            },
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+        }
+
+    def report(self) -> str:
+        s = self.snapshot()
+        lines = [
+            f"{s['running']} running, {s['queued']} queued, {s['admitted']} admitted, "
+            f"rejected {sum(s['rejected'].values())} "
+            f"({', '.join(f'{reason} {n}' for reason, n in s['rejected'].items())})",
+            f"wait p50 {s['wait_ms']['p50']}ms, p99 {s['wait_ms']['p99']}ms, max {s['wait_ms']['max']}ms",
+        ]
+        for guild_id, depth in s["deepest_queues"].items():
+            lines.append(f"  guild {guild_id}: {depth} queued")
+        return "\n".join(lines)
+
+
+def _percentile(ordered: List[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
@@ -0,0 +1,60 @@
+"""Limits on how long, and how much history, one search may spend.
+
+A search's budget is a deadline plus caps on the history it crawls: messages
+read and history requests made. Reading channels from the local index is
+free. When any limit runs out the search stops, returns what it found, and
+its cursor resumes from where each channel stopped.
+"""
+import os
+import time
+from typing import Optional
+
+
+DEADLINE_SECONDS = float(os.environ.get("HAYSTACK_SEARCH_DEADLINE_SECONDS", 30))
+MAX_MESSAGES = int(os.environ.get("HAYSTACK_SEARCH_MAX_MESSAGES", 50_000))
+MAX_REQUESTS = int(os.environ.get("HAYSTACK_SEARCH_MAX_REQUESTS", 500))
+# Messages per history request.
+PAGE_SIZE = 100
+
+
+class BudgetExhausted(Exception):
+    """Raised by a crawl that stopped before a page because the budget ran out."""
+
+
+class SearchBudget:
+
+    def __init__(
+        self,
+        seconds: Optional[float] = DEADLINE_SECONDS,
+        max_messages: Optional[int] = MAX_MESSAGES,
+        max_requests: Optional[int] = MAX_REQUESTS,
+    ):
+        """
+        Create a SearchBudget, starting the clock.
+
+        Args:
+            seconds: Time the search may take, or None for no deadline
+            max_messages: Messages the search may crawl, or None for no cap
+            max_requests: History requests the search may make, or None for no cap
+        """
+        self.deadline = time.monotonic() + seconds if seconds is not None else None
+        self.max_messages = max_messages
+        self.max_requests = max_requests
+        self.messages = 0
+        self.requests = 0
+
+    def remaining_seconds(self) -> Optional[float]:
+        return max(0.0, self.deadline - time.monotonic()) if self.deadline is not None else None
+
+    @property
+    def expired(self) -> bool:
+        """Past the deadline or the message cap: stop reading, even mid-page."""
+        return (
+            (self.deadline is not None and time.monotonic() >= self.deadline)
+            or (self.max_messages is not None and self.messages >= self.max_messages)
+        )
+
+    @property
+    def exhausted(self) -> bool:
+        """Expired, or out of requests: don't fetch another page."""
+        return self.expired or (self.max_requests is not None and self.requests >= self.max_requests)
@@ -0,0 +1,75 @@
+"""Content categories of attachments, as a small integer bitmask.
+
+Every `/search` filetype choice in `CONTENT_TYPE_CHOICES` gets one bit. An
+attachment is classified once, from its extension and content type, into the
+set of choices it satisfies, so a filetype filter is a single bitwise AND.
+
+A choice whose value is a MIME type ("image/png") matches that content type or
+the extensions in its name ("jpg/jpeg"). A choice whose value is a bare word
+("image", "audio", "zip" for archives) is a group: it matches content types
+containing the word and the extensions of every MIME choice it covers, plus
+`GROUP_EXTENSIONS`.
+"""
+from functools import lru_cache
+from typing import Dict, FrozenSet, Optional
+
+from ..utils import CONTENT_TYPE_CHOICES
+
+
+# Extensions a group matches beyond those of the MIME choices it covers.
+GROUP_EXTENSIONS: Dict[str, FrozenSet[str]] = {
+    "image": frozenset({"webp", "bmp"}),
+    "audio": frozenset({"wav", "ogg", "flac"}),
+    "zip": frozenset({"rar", "7z", "tar", "gz"}),
+}
+
+CATEGORY_BITS: Dict[str, int] = {choice.value: 1 << i for i, choice in enumerate(CONTENT_TYPE_CHOICES)}
+
+
+def _build_extension_table() -> Dict[str, int]:
+    mime_extensions = {
+        choice.value: frozenset(choice.name.split("/")) for choice in CONTENT_TYPE_CHOICES if "/" in choice.value
+    }
+    by_extension: Dict[str, int] = {}
+    for choice in CONTENT_TYPE_CHOICES:
+        if "/" in choice.value:
+            extensions = mime_extensions[choice.value]
+        else:
+            extensions = set(GROUP_EXTENSIONS.get(choice.value, ()))
+            for mime, mime_exts in mime_extensions.items():
+                if choice.value in mime:
+                    extensions |= mime_exts
+        for extension in extensions:
+            by_extension[extension] = by_extension.get(extension, 0) | CATEGORY_BITS[choice.value]
+    return by_extension
+
+
+_BY_EXTENSION = _build_extension_table()
+
+
+def extension(filename: str) -> str:
+    """The lowercased text after the last dot, or "unknown"."""
+    if '.' in filename:
+        return filename[filename.rindex('.') + 1:].lower()
+    return "unknown"
+
+
+@lru_cache(maxsize=4096)
+def classify_extension(ext: str, content_type: Optional[str]) -> int:
+    """The category bits of an attachment with extension `ext` (lowercased) and `content_type`."""
+    bits = _BY_EXTENSION.get(ext, 0)
+    if content_type:
+        content_type = content_type.lower()
+        for value, bit in CATEGORY_BITS.items():
+            if value in content_type:
+                bits |= bit
+    return bits
+
+
+def classify(filename: str, content_type: Optional[str]) -> int:
+    return classify_extension(extension(filename), content_type)
+
+
+def category_mask(filetype: Optional[str]) -> Optional[int]:
+    """The bit a filetype filter selects, or None if it isn't one of the choices."""
+    return CATEGORY_BITS.get(filetype) if filetype else None
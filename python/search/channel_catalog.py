@@ -0,0 +1,193 @@
+"""Which channels a guild-wide search reads, kept current by gateway events.
+
+A guild's catalog holds its text channels and forum threads, including
+archived forum threads, which aren't in discord.py's cache and take a REST
+call per forum (per 100 threads) to list. They're listed once, in the
+background, starting the first time the guild is searched; from then on
+thread events keep the catalog current. A search waits at most
+`ARCHIVED_WAIT_SECONDS` for the listing, then reads what's catalogued so far.
+
+Which of those channels the bot may read is resolved once and kept until an
+event that can change it: a channel's overwrites, a role, or the bot's own
+roles. Setting up a search is then a dictionary lookup.
+"""
+import asyncio
+import os
+from typing import Dict, List, Optional, Set
+
+import discord
+
+
+ARCHIVED_WAIT_SECONDS = float(os.environ.get("HAYSTACK_ARCHIVED_THREADS_WAIT_SECONDS", 2))
+
+
+class GuildCatalog:
+
+    def __init__(self, guild, archived: Optional[Dict[int, object]] = None):
+        """
+        Create a GuildCatalog.
+
+        Args:
+            guild: The guild, as cached by the gateway session
+            archived: Archived threads already listed for this guild by an earlier session
+        """
+        self.guild = guild
+        # Text channels, then forum threads, by id
+        self.channels: Dict[int, object] = {}
+        self.archived_loaded = archived is not None
+        self.archived: Dict[int, object] = archived if archived is not None else {}
+        self.readable: Optional[List] = None
+        # Listing the archived threads, while it runs
+        self.loading: Optional[asyncio.Task] = None
+        for channel in guild.text_channels:
+            self.channels[channel.id] = channel
+        for forum in guild.forums:
+            for thread in forum.threads:
+                self.channels[thread.id] = thread
+        for thread_id, thread in self.archived.items():
+            self.channels.setdefault(thread_id, thread)
+
+    def start_loading(self) -> asyncio.Task:
+        """Start listing the archived threads, unless that's already running."""
+        if self.loading is None:
+            self.loading = asyncio.get_running_loop().create_task(self.load_archived())
+        return self.loading
+
+    async def load_archived(self) -> None:
+        """List every forum's archived threads, adding each to the catalog as it's listed."""
+        try:
+            for forum in self.guild.forums:
+                if not forum.permissions_for(self.guild.me).read_message_history:
+                    continue
+                try:
+                    async for thread in forum.archived_threads(limit=None):
+                        self.archived[thread.id] = thread
+                        if thread.id not in self.channels:
+                            self.channels[thread.id] = thread
+                            self.readable = None
+                except (discord.Forbidden, discord.NotFound):
+                    continue
+            self.archived_loaded = True
+        except Exception as e:
+            # The next search starts over.
+            print(f"[catalog] listing archived threads failed for guild {self.guild.id}: {e!r}")
+        finally:
+            self.loading = None
+
+    def stop_loading(self) -> None:
+        if self.loading is not None:
+            self.loading.cancel()
+            self.loading = None
+
+    def searchable(self) -> List:
+        """The catalogued channels the bot can read the history of."""
+        if self.readable is None:
+            me = self.guild.me
+            self.readable = [c for c in self.channels.values() if c.permissions_for(me).read_message_history]
+        return self.readable
+
+    def put(self, channel) -> None:
+        self.channels[channel.id] = channel
+        self.readable = None
+
+    def discard(self, channel_id: int) -> None:
+        self.archived.pop(channel_id, None)
+        if self.channels.pop(channel_id, None) is not None:
+            self.readable = None
+
+
+class ChannelCatalog:
+    """Searchable channels per guild, built on first search."""
+
+    def __init__(self, archived_wait: float = ARCHIVED_WAIT_SECONDS):
+        """
+        Create a ChannelCatalog.
+
+        Args:
+            archived_wait: Seconds a guild's first search waits for its archived threads to be listed
+        """
+        self.guilds: Dict[int, GuildCatalog] = {}
+        self.archived_wait = archived_wait
+
+    async def searchable(self, guild) -> List:
+        """
+        The channels and threads a guild-wide search should read.
+
+        Args:
+            guild: The guild being searched
+
+        Returns:
+            The readable text channels and forum threads, with the archived
+            threads listed so far.
+        """
+        catalog = self.guilds.get(guild.id)
+        if catalog is None:
+            catalog = self.guilds[guild.id] = GuildCatalog(guild)
+        elif catalog.guild is not guild:
+            # A new gateway session rebuilt discord.py's cache; start from it,
+            # keeping the archived threads that were already listed.
+            catalog.stop_loading()
+            archived = catalog.archived if catalog.archived_loaded else None
+            catalog = self.guilds[guild.id] = GuildCatalog(guild, archived)
+        if not catalog.archived_loaded:
+            await asyncio.wait({catalog.start_loading()}, timeout=self.archived_wait)
+        return catalog.searchable()
+
+    def channel_created(self, channel) -> None:
+        catalog = self.guilds.get(channel.guild.id)
+        if catalog is not None and isinstance(channel, discord.TextChannel):
+            catalog.put(channel)
+
+    def channel_updated(self, channel) -> None:
+        """A channel's overwrites or category may have changed, and so its threads' permissions."""
+        catalog = self.guilds.get(channel.guild.id)
+        if catalog is None:
+            return
+        if channel.id in catalog.channels:
+            catalog.channels[channel.id] = channel
+        catalog.readable = None
+
+    def channel_deleted(self, channel) -> None:
+        catalog = self.guilds.get(channel.guild.id)
+        if catalog is None:
+            return
+        catalog.discard(channel.id)
+        orphans: Set[int] = {
+            thread_id for thread_id, thread in catalog.channels.items()
+            if getattr(thread, "parent_id", None) == channel.id
+        }
+        for thread_id in orphans:
+            catalog.discard(thread_id)
+
+    def thread_updated(self, thread: discord.Thread) -> None:
+        """A forum thread was created, archived, unarchived or otherwise changed."""
+        catalog = self.guilds.get(thread.guild.id)
+        if catalog is None or not isinstance(thread.parent, discord.ForumChannel):
+            return
+        if thread.archived:
+            catalog.archived[thread.id] = thread
+        else:
+            catalog.archived.pop(thread.id, None)
+        catalog.put(thread)
+
+    def thread_deleted(self, guild_id: int, thread_id: int) -> None:
+        catalog = self.guilds.get(guild_id)
+        if catalog is not None:
+            catalog.discard(thread_id)
+
+    def permissions_changed(self, guild_id: int) -> None:
+        """A role or the bot's roles changed; re-resolve the guild's permissions on its next search."""
+        catalog = self.guilds.get(guild_id)
+        if catalog is not None:
+            catalog.readable = None
+
+    def mark_unreadable(self, guild_id: int, channel_id: int) -> None:
+        """A search was refused a channel's history; leave it out until the guild's permissions are re-resolved."""
+        catalog = self.guilds.get(guild_id)
+        if catalog is not None and catalog.readable is not None:
+            catalog.readable = [c for c in catalog.readable if c.id != channel_id]
+
+    def forget_guild(self, guild_id: int) -> None:
+        catalog = self.guilds.pop(guild_id, None)
+        if catalog is not None:
+            catalog.stop_loading()
@@ -1,89 +1,317 @@
 """Search for files purely in discord."""
 import discord
-from typing import List, Union
+from typing import Callable, List, Optional, Union
 import asyncio
-from thefuzz import fuzz
+from discord.utils import time_snowflake
 from ..models.query import Query
 from .search_models import SearchResults, SearchResult
+from .result_cache import SearchResultCache
+from .scoring import FuzzyScorer
+from .categories import category_mask
+from .local_index import MAX_SNOWFLAKE, LocalIndex, Segment
+from .channel_catalog import ChannelCatalog
+from .ranking import OVERSCAN, STOP_SCORE, FirstK, TopK
+from .budget import DEADLINE_SECONDS, MAX_MESSAGES, MAX_REQUESTS, PAGE_SIZE, BudgetExhausted, SearchBudget
+
+
+# One history page; candidates from it are fuzzy-scored as one batch.
+SCORING_BATCH_MESSAGES = 100
+# How long past its deadline a search waits for channels stuck on Discord.
+HARD_STOP_GRACE_SECONDS = 1.0
 
 
 class DiscordSearcher:
     """Search for files in discord with just discord."""
 
-    def __init__(self, thresh: int = 85):
+    def __init__(self, thresh: int = 85, overscan: int = OVERSCAN, stop_score: int = STOP_SCORE):
         """
         Create a DiscordSearch object.
 
         Args:
             thresh: The string similarity threshold to determine a match
+            overscan: Matches a filename or content search scores before keeping the best;
+                at most `search_result_limit` turns ranking off
+            stop_score: Score at which a full page of matches ends a ranked search early
         """
         self.banned_file_ids = set()
         self.thresh = thresh
         self.search_result_limit = 25
+        self.overscan = overscan
+        self.stop_score = stop_score
+        self.deadline_seconds = DEADLINE_SECONDS
+        self.max_messages = MAX_MESSAGES
+        self.max_requests = MAX_REQUESTS
+        self.result_cache = SearchResultCache()
+        self.scorer = FuzzyScorer()
+        self.local_index = LocalIndex()
+        self.catalog = ChannelCatalog()
+
+    def _skip_failed_channel(self, onii_chan, error: Exception) -> None:
+        """Leave a channel whose search failed out of this search and its cursor.
+
+        A channel the bot turns out not to be allowed to read is also left out
+        of the guild's later searches, until its permissions are re-resolved.
+        """
+        print(f"[search] skipped channel {onii_chan.id}: {error!r}")
+        guild = getattr(onii_chan, "guild", None)
+        if guild is not None and isinstance(error, (discord.Forbidden, discord.NotFound)):
+            self.catalog.mark_unreadable(guild.id, onii_chan.id)
+
+    def plan(self, onii_chan, query: Query) -> List[Segment]:
+        """Split the range a query asks of a channel into local reads and crawls, newest first."""
+        if query.channel_date_map:
+            cursor = query.channel_date_map[onii_chan.id]
+        elif query.before:
+            cursor = time_snowflake(query.before, high=False)
+        else:
+            cursor = MAX_SNOWFLAKE
+        hi = cursor - 1 if cursor < MAX_SNOWFLAKE else MAX_SNOWFLAKE
+        lo = time_snowflake(query.after, high=True) + 1 if query.after else 0
+        return self.local_index.plan(onii_chan.id, lo, hi)
 
     async def chan_search(
             self,
             onii_chan: discord.TextChannel,
             query: Query,
-            files,
-            file_set,
-            channel_date_map,
-            sem
+            collector: FirstK,
+            budget: SearchBudget,
+            sem,
+            segments: List[Segment],
+            local_only: bool = False,
+            on_progress: Optional[Callable[[list], None]] = None,
     ):
         """
-        Search a channel index for a query.
+        Search a channel for a query.
+
+        Progress is kept in `segments`: finished segments are removed, and the
+        current one's `hi` is lowered past every message whose matches were
+        offered to `collector`. Whatever stops the search, including being
+        cancelled, the channel resumes from `segments[0].hi`.
 
         Args:
             onii_chan: The channel to search
             query: The query to use to search the channel
-
-        Yields:
-            A list of dicts of files
+            collector: Keeps the matches that make up the results
+            budget: Stops the search when it runs out
+            segments: The channel's plan
+            local_only: Stop at the first segment that would need a crawl
+            on_progress: Called with the results so far whenever matches are found
         """
         async with sem:
-            if query.channel_date_map:
-                before_time = query.channel_date_map[onii_chan.id]
-            else:
-                before_time = query.before
-            messages = onii_chan.history(limit=None, before=before_time, after=query.after)
-            async for message in messages:
-                if len(files) == self.search_result_limit:
-                    channel_date_map[onii_chan.id] = message.created_at
+            mask = category_mask(query.filetype)
+            while segments and not collector.full and not budget.expired:
+                segment = segments[0]
+                if local_only and not segment.local:
                     break
-                for attachment in message.attachments:
-                    metadata = SearchResult.from_discord_attachment(message, attachment)
-                    if metadata.objectId in self.banned_file_ids or metadata.objectId in file_set:
-                        continue
-                    if metadata.match_query(query=query, thresh=self.thresh):
-                        file_set.add(metadata.objectId)
-                        files.append(metadata)
+                if segment.local:
+                    messages = self._read_local(onii_chan.id, segment)
+                else:
+                    messages = self._crawl(onii_chan, segment, budget)
+                # Candidates that passed the cheap filters, fuzzy-scored together
+                # once per history page rather than one at a time, or sooner if
+                # they could fill the remaining result slots.
+                candidates = []
+                seen = 0
+                # Upper end of what's left of the segment, if stopping inside it
+                rest_hi = None
+                try:
+                    async for message_id, results in messages:
+                        seen += 1
+                        if candidates and (
+                            seen % SCORING_BATCH_MESSAGES == 0
+                            or len(candidates) >= collector.remaining
+                        ):
+                            leftover = await self._admit(candidates, query, collector, on_progress)
+                            candidates = []
+                            if leftover:
+                                rest_hi = leftover[0].message_id
+                                break
+                        if not candidates:
+                            # Everything newer has been offered.
+                            segment.hi = message_id
+                        if collector.full or budget.expired:
+                            rest_hi = message_id
+                            break
+                        for metadata in results:
+                            if mask is not None and not metadata.category & mask:
+                                continue
+                            if metadata.objectId in self.banned_file_ids or metadata.objectId in collector.seen:
+                                continue
+                            if metadata.match_filters(query=query):
+                                candidates.append(metadata)
+                        rest_hi = message_id - 1
+                    else:
+                        rest_hi = None
+                except BudgetExhausted:
+                    rest_hi = rest_hi if rest_hi is not None else segment.hi
+                finally:
+                    await messages.aclose()
+                leftover = await self._admit(candidates, query, collector, on_progress) if candidates else []
+                if leftover:
+                    rest_hi = leftover[0].message_id
+                if rest_hi is not None:
+                    segment.hi = rest_hi
+                    break
+                segments.pop(0)
+
+    async def _read_local(self, channel_id: int, segment: Segment):
+        for message_id, results in self.local_index.read(channel_id, segment.lo, segment.hi):
+            yield message_id, results
+
+    async def _crawl(self, onii_chan, segment: Segment, budget: SearchBudget):
+        """Crawl a gap newest first, recording every message and covering what was read.
+
+        Covers the whole gap if the crawl runs out, or down to the last message
+        read if it's stopped early. The open-ended head is only covered up to
+        when the crawl started; anything newer arrives through `on_message`.
+
+        Raises:
+            BudgetExhausted: Before fetching a page once `budget` is exhausted
+        """
+        top = min(segment.hi, time_snowflake(discord.utils.utcnow(), high=True))
+        messages = onii_chan.history(
+            limit=None,
+            before=discord.Object(id=segment.hi + 1) if segment.hi < MAX_SNOWFLAKE else None,
+            after=discord.Object(id=segment.lo - 1) if segment.lo > 0 else None,
+            oldest_first=False,
+        )
+        covered_to = top + 1
+        try:
+            nth = 0
+            while True:
+                if nth % PAGE_SIZE == 0:
+                    if budget.exhausted:
+                        raise BudgetExhausted()
+                    budget.requests += 1
+                try:
+                    message = await messages.__anext__()
+                except StopAsyncIteration:
+                    break
+                budget.messages += 1
+                nth += 1
+                results = [SearchResult.from_discord_attachment(message, a) for a in message.attachments]
+                self.local_index.record(onii_chan.id, message.id, results)
+                covered_to = message.id
+                yield message.id, results
+            covered_to = segment.lo
+        finally:
+            self.local_index.cover(onii_chan.id, covered_to, top)
+            await messages.aclose()
+
+    async def _admit(self, candidates, query: Query, collector: FirstK,
+                     on_progress: Optional[Callable[[list], None]] = None) -> list:
+        """Offer the candidates that pass the query's fuzzy checks to `collector`.
+
+        Returns the matches it had no room for. Room is only checked between
+        messages, so a message's files are never split across pages. A ranked
+        collector takes every match; the ones it doesn't keep are its remainder.
+        """
+        offered = len(collector.seen)
+        leftover = []
+        if collector.rank_by is None:
+            matches = await self.scorer.match(query, self.thresh, candidates)
+            for i, metadata in enumerate(matches):
+                if collector.full and (i == 0 or metadata.message_id != matches[i - 1].message_id):
+                    leftover = matches[i:]
+                    break
+                collector.offer(metadata)
+        else:
+            needle, field = collector.rank_by
+            for metadata, score in await self.scorer.match_scored(query, self.thresh, candidates, needle, field):
+                collector.offer(metadata, score)
+        if on_progress is not None and len(collector.seen) > offered:
+            on_progress(list(collector.results()))
+        return leftover
 
     async def search(self, onii_chans: List[Union[discord.DMChannel, discord.Guild]],
-                     bot_user=None, query: Query = None) -> SearchResults:
+                     bot_user=None, query: Query = None, readable: bool = False,
+                     budget: Optional[SearchBudget] = None,
+                     on_progress: Optional[Callable[[list], None]] = None) -> SearchResults:
         """
         Search all channels in a Guild or the provided channel.
 
+        The search stops when the page is full, history runs out, or `budget`
+        does. In the last case the results are marked partial; either way
+        `channel_date_map` resumes every channel that wasn't finished. A ranked
+        search also returns the matches it scanned past as `remainder`. A
+        channel whose search fails is skipped and left out of the cursor; the
+        search only fails if every channel it read did.
+
         Args:
             onii_chans: A list of channels to search
             bot_user: The name of the bot
             query: Search parameters
+            readable: Whether the bot is already known to be able to read every channel
+            budget: Deadline and crawl limits; defaults to this searcher's
+            on_progress: Called with the results so far, best first when ranked,
+                whenever a channel finds matches. Must not block.
 
         Returns:
             A list of dicts of files.
         """
+        if budget is None:
+            budget = SearchBudget(self.deadline_seconds, self.max_messages, self.max_requests)
         if query.channel_date_map:
             onii_chans = list(filter(lambda chan: chan.id in query.channel_date_map, onii_chans))
-        else:
+        elif not readable:
             onii_chans = list(filter(lambda chan: chan.permissions_for(bot_user).read_message_history, onii_chans))
-        files = []
-        files_set = set()
-        # getting files from each channel one at a time is really slow, but
-        channel_date_map = {}
-        sem = asyncio.Semaphore(10)
-        tasks = [self.chan_search(chan, query, files, files_set, channel_date_map, sem) for chan in onii_chans]
-        await asyncio.gather(*tasks)
+        rank_by = None
         if query.filename:
-            files = sorted(files, reverse=True, key=lambda x: fuzz.ratio(query.filename, x.filename))
+            rank_by = (query.filename, "filename")
         elif query.content:
-            files = sorted(files, reverse=True, key=lambda x: fuzz.ratio(query.content, x.content))
-        return SearchResults(files=files, channel_date_map=channel_date_map)
+            rank_by = (query.content, "content")
+        if rank_by and self.overscan > self.search_result_limit:
+            collector = TopK(self.search_result_limit, rank_by, self.overscan, self.stop_score)
+        else:
+            collector = FirstK(self.search_result_limit)
+        # getting files from each channel one at a time is really slow, but
+        sem = asyncio.Semaphore(10)
+        plans = {chan.id: self.plan(chan, query) for chan in onii_chans}
+        timed_out = False
+        searched, errors = set(), {}
+        # Serve what's already known locally first, and crawl only if that
+        # doesn't fill the page.
+        for local_only in (True, False):
+            if collector.full or budget.expired:
+                break
+            chans = [chan for chan in onii_chans if plans[chan.id]]
+            tasks = [
+                asyncio.ensure_future(self.chan_search(
+                    chan, query, collector, budget, sem, plans[chan.id], local_only, on_progress
+                ))
+                for chan in chans
+            ]
+            if not tasks:
+                continue
+            # Channels check the budget between messages; a channel stuck
+            # waiting on Discord is cancelled shortly after the deadline.
+            remaining = budget.remaining_seconds()
+            _, pending = await asyncio.wait(
+                tasks, timeout=remaining + HARD_STOP_GRACE_SECONDS if remaining is not None else None
+            )
+            for task in pending:
+                task.cancel()
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            timed_out |= bool(pending)
+            searched.update(chan.id for chan in chans)
+            for chan, result in zip(chans, results):
+                if isinstance(result, Exception):
+                    self._skip_failed_channel(chan, result)
+                    plans[chan.id] = []
+                    errors[chan.id] = result
+        if errors and len(errors) == len(searched):
+            raise next(iter(errors.values()))
+        channel_date_map = {}
+        for chan in onii_chans:
+            segments = plans[chan.id]
+            if segments:
+                hi = segments[0].hi
+                channel_date_map[chan.id] = hi + 1 if hi < MAX_SNOWFLAKE else MAX_SNOWFLAKE
+        partial = bool(channel_date_map) and not collector.full and (timed_out or budget.exhausted)
+        files = collector.results()
+        if rank_by and collector.rank_by is None:
+            needle, field = rank_by
+            files = await self.scorer.rank(needle, files, field)
+        return SearchResults(
+            files=files, channel_date_map=channel_date_map, partial=partial, remainder=collector.remainder()
+        )
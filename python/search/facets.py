@@ -0,0 +1,187 @@
+"""Keep `/facets` counters in step with the guilds the bot can read.
+
+Gateway events update the counters as files are posted, edited away or
+deleted (see the listeners in `Haystackfs`). Events missed while the bot was
+offline are caught by `reconcile_loop`, which re-reads each channel from a
+little before its last reconcile and fixes up whatever disagrees. The first
+reconcile of a channel backfills `BACKFILL_DAYS` of history.
+
+Reconciling shares REST buckets with user searches, so it reads one channel
+at a time, waits `RECONCILE_PAGE_DELAY_SECONDS` between history pages, and
+makes at most `RECONCILE_MAX_REQUESTS` requests per guild per pass. A channel
+the budget stops partway (usually a backfill) records how far it got and is
+resumed from there on the next pass; channels furthest behind go first.
+"""
+import asyncio
+import os
+from datetime import datetime, timezone
+from typing import Optional, Sequence
+
+import discord
+
+from ..persistence.facet_store import DAY_MS, Attachment, FacetStore, now_ms
+from ..utils import CONTENT_TYPE_CHOICES
+from .budget import PAGE_SIZE, SearchBudget
+from .categories import CATEGORY_BITS, classify_extension, extension
+
+
+BACKFILL_DAYS = 90
+RECONCILE_OVERLAP_DAYS = 2
+RECONCILE_INTERVAL_SECONDS = 6 * 3600
+RECONCILE_MAX_REQUESTS = int(os.environ.get("HAYSTACK_FACETS_RECONCILE_MAX_REQUESTS", 200))
+RECONCILE_PAGE_DELAY_SECONDS = float(os.environ.get("HAYSTACK_FACETS_RECONCILE_PAGE_DELAY_SECONDS", 1.0))
+
+# Category facets are the group choices ("image", "audio", "archive"); files
+# in none of them count as "other".
+_GROUPS = [(choice.name, CATEGORY_BITS[choice.value]) for choice in CONTENT_TYPE_CHOICES if "/" not in choice.value]
+
+
+def attachment_facets(filename: str, content_type: Optional[str]) -> Attachment:
+    ext = extension(filename)
+    bits = classify_extension(ext, content_type)
+    category = next((name for name, bit in _GROUPS if bits & bit), "other")
+    return category, ext
+
+
+class FacetIndexer:
+
+    def __init__(self, store: FacetStore, page_delay: float = RECONCILE_PAGE_DELAY_SECONDS):
+        """
+        Create a FacetIndexer.
+
+        Args:
+            store: Where the counters are kept
+            page_delay: Seconds a reconcile waits between history pages
+        """
+        self.store = store
+        self.page_delay = page_delay
+
+    async def add(self, message: discord.Message, commit: bool = True) -> bool:
+        if message.guild is None or not message.attachments:
+            return False
+        return await self.store.add_message(
+            message_id=message.id,
+            guild_id=message.guild.id,
+            channel_id=message.channel.id,
+            author_id=message.author.id,
+            created_at=round(message.created_at.timestamp() * 1000),
+            attachments=[attachment_facets(a.filename, a.content_type) for a in message.attachments],
+            commit=commit,
+        )
+
+    async def remove(self, message_ids: Sequence[int]) -> None:
+        await self.store.remove_messages(message_ids)
+
+    async def edit(self, payload: discord.RawMessageUpdateEvent) -> None:
+        """Recount a message whose attachments changed."""
+        if payload.guild_id is None or "attachments" not in payload.data:
+            return
+        entry = await self.store.ledger_entry(payload.message_id)
+        author = payload.data.get("author")
+        if entry is None and author is None:
+            return
+        attachments = [attachment_facets(a["filename"], a.get("content_type")) for a in payload.data["attachments"]]
+        await self.store.remove_messages([payload.message_id], commit=False)
+        await self.store.add_message(
+            message_id=payload.message_id,
+            guild_id=payload.guild_id,
+            channel_id=payload.channel_id,
+            author_id=entry["author_id"] if entry else int(author["id"]),
+            created_at=entry["created_at"] if entry else (payload.message_id >> 22) + discord.utils.DISCORD_EPOCH,
+            attachments=attachments,
+            commit=False,
+        )
+        await self.store.commit()
+
+    async def reconcile_channel(self, channel, guild_id: int, budget: Optional[SearchBudget] = None) -> int:
+        """Re-read a channel since shortly before its last reconcile and fix the counters.
+
+        If `budget` runs out first, the messages read so far are reconciled
+        and the next call resumes after them.
+
+        Returns the number of messages added or removed.
+        """
+        started = now_ms()
+        watermark = await self.store.watermark(channel.id)
+        start = started - BACKFILL_DAYS * DAY_MS
+        if watermark is not None:
+            reconciled_at, complete = watermark
+            # A stopped reconcile resumes at the millisecond it reached, which
+            # it may not have read all of.
+            start = max(start, reconciled_at - RECONCILE_OVERLAP_DAYS * DAY_MS if complete else reconciled_at - 1)
+        budget = budget or SearchBudget(None, None, None)
+        seen = set()
+        changed = 0
+        # Creation time of the last message read, while the channel isn't finished
+        reached = None
+        complete = False
+        after = datetime.fromtimestamp(start / 1000, tz=timezone.utc)
+        messages = channel.history(limit=None, after=after, oldest_first=True)
+        try:
+            nth = 0
+            while True:
+                if nth % PAGE_SIZE == 0:
+                    if budget.exhausted:
+                        break
+                    if nth:
+                        await asyncio.sleep(self.page_delay)
+                    budget.requests += 1
+                try:
+                    message = await messages.__anext__()
+                except StopAsyncIteration:
+                    complete = True
+                    break
+                nth += 1
+                budget.messages += 1
+                reached = round(message.created_at.timestamp() * 1000)
+                if not message.attachments:
+                    continue
+                seen.add(message.id)
+                if await self.add(message, commit=False):
+                    changed += 1
+        finally:
+            await messages.aclose()
+        if not complete and reached is None:
+            return 0
+        # Messages in (start, end) were all read; counted ones that weren't seen are gone.
+        end = started if complete else reached
+        missing = await self.store.message_ids_between(channel.id, start + 1, end) - seen
+        if missing:
+            changed += await self.store.remove_messages(missing, commit=False)
+        await self.store.commit()
+        await self.store.set_watermark(channel.id, guild_id, started if complete else reached, complete)
+        return changed
+
+    async def reconcile_guild(self, guild: discord.Guild, channels: Sequence, budget: SearchBudget) -> int:
+        """Reconcile a guild's channels, those furthest behind first, until `budget` runs out."""
+        watermarks = await self.store.watermarks(guild.id)
+
+        def behind(channel):
+            reconciled_at, complete = watermarks.get(channel.id, (0, False))
+            return reconciled_at if complete else 0
+
+        changed = 0
+        for channel in sorted(channels, key=behind):
+            if budget.exhausted:
+                break
+            try:
+                changed += await self.reconcile_channel(channel, guild.id, budget)
+            except (discord.Forbidden, discord.NotFound):
+                continue
+        return changed
+
+
+async def reconcile_loop(bot, indexer: FacetIndexer, catalog, interval: float = RECONCILE_INTERVAL_SECONDS,
+                         max_requests: Optional[int] = RECONCILE_MAX_REQUESTS):
+    """Reconcile every guild's searchable channels (per `catalog`) every `interval`, each on its own budget."""
+    await bot.wait_until_ready()
+    while True:
+        for guild in list(bot.guilds):
+            try:
+                channels = await catalog.searchable(guild)
+                changed = await indexer.reconcile_guild(guild, channels, SearchBudget(None, None, max_requests))
+                if changed:
+                    print(f"[facets] reconciled {changed} messages in guild {guild.id}")
+            except Exception as e:
+                print(f"[facets] reconcile failed for guild {guild.id}: {e!r}")
+        await asyncio.sleep(interval)
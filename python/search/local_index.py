@@ -0,0 +1,209 @@
+"""What the searcher already knows about each channel, and how to use it.
+
+For every channel, `LocalIndex` keeps a coverage map: the snowflake intervals
+whose attachments are all known locally, along with those attachments. Every
+message a search crawls is recorded, so the interval it crawled becomes
+covered. `plan` splits the range a query asks for into covered segments, read
+from the index, and gaps, crawled with `history()`.
+
+Coverage of a channel's newest messages is kept open-ended while the gateway
+stays connected: once a crawl has covered up to the present, every later
+message arrives through `on_message` and is recorded, so the head of the
+channel needs no crawl at all. A new gateway session (which may have missed
+events) closes every head again.
+"""
+import bisect
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import discord
+
+from .search_models import SearchResult
+
+
+# Upper bound of an open-ended interval: newer than any real snowflake.
+MAX_SNOWFLAKE = 2 ** 63 - 1
+DEFAULT_MAX_ENTRIES = 200_000
+
+
+@dataclass
+class Segment:
+    """A snowflake range [lo, hi] of one channel, served locally or crawled."""
+    lo: int
+    hi: int
+    local: bool
+
+
+class Coverage:
+    """A set of disjoint, sorted, closed snowflake intervals."""
+
+    def __init__(self):
+        self.intervals: List[List[int]] = []
+
+    def add(self, lo: int, hi: int) -> None:
+        if lo > hi:
+            return
+        merged: List[List[int]] = []
+        for start, end in sorted(self.intervals + [[lo, hi]]):
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        self.intervals = merged
+
+    def top(self) -> Optional[int]:
+        return self.intervals[-1][1] if self.intervals else None
+
+    def plan(self, lo: int, hi: int, open_head: bool = False) -> List[Segment]:
+        """Split [lo, hi] into local and crawl segments, newest first.
+
+        With `open_head`, the newest interval is treated as reaching MAX_SNOWFLAKE.
+        """
+        intervals = [list(i) for i in self.intervals]
+        if open_head and intervals:
+            intervals[-1][1] = MAX_SNOWFLAKE
+        segments = []
+        cursor = hi
+        for start, end in reversed(intervals):
+            if cursor < lo:
+                break
+            if start > cursor:
+                continue
+            if end < cursor:
+                gap_lo = max(end + 1, lo)
+                segments.append(Segment(gap_lo, cursor, local=False))
+                cursor = gap_lo - 1
+                if cursor < lo:
+                    break
+            local_lo = max(start, lo)
+            segments.append(Segment(local_lo, cursor, local=True))
+            cursor = local_lo - 1
+        if cursor >= lo:
+            segments.append(Segment(lo, cursor, local=False))
+        return segments
+
+
+@dataclass
+class ChannelIndex:
+    coverage: Coverage = field(default_factory=Coverage)
+    # Sorted ids of messages with attachments, and their attachments.
+    ids: List[int] = field(default_factory=list)
+    files: Dict[int, List[SearchResult]] = field(default_factory=dict)
+
+    def record(self, message_id: int, files: List[SearchResult]) -> int:
+        """Store a message's attachments. Returns how many entries were added."""
+        if not files:
+            return 0
+        if message_id not in self.files:
+            bisect.insort(self.ids, message_id)
+            added = len(files)
+        else:
+            added = len(files) - len(self.files[message_id])
+        self.files[message_id] = files
+        return added
+
+    def forget(self, message_id: int) -> int:
+        files = self.files.pop(message_id, None)
+        if files is None:
+            return 0
+        del self.ids[bisect.bisect_left(self.ids, message_id)]
+        return len(files)
+
+    def read(self, lo: int, hi: int) -> List[Tuple[int, List[SearchResult]]]:
+        """Messages with attachments in [lo, hi], newest first."""
+        start = bisect.bisect_left(self.ids, lo)
+        end = bisect.bisect_right(self.ids, hi)
+        return [(message_id, self.files[message_id]) for message_id in reversed(self.ids[start:end])]
+
+
+class LocalIndex:
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        """
+        Create a LocalIndex.
+
+        Args:
+            max_entries: Attachments to keep before dropping the least recently searched channels
+        """
+        self.max_entries = max_entries
+        self.channels: "OrderedDict[int, ChannelIndex]" = OrderedDict()
+        self.entries = 0
+        # Heads covered at or after this snowflake are kept current by gateway
+        # events. None until the gateway is connected.
+        self.live_since: Optional[int] = None
+
+    def channel(self, channel_id: int) -> ChannelIndex:
+        index = self.channels.get(channel_id)
+        if index is None:
+            index = self.channels[channel_id] = ChannelIndex()
+        self.channels.move_to_end(channel_id)
+        return index
+
+    def plan(self, channel_id: int, lo: int, hi: int) -> List[Segment]:
+        # Creating the channel's index here means messages posted while its
+        # gaps are being crawled are recorded by `on_message`.
+        index = self.channel(channel_id)
+        return index.coverage.plan(lo, hi, open_head=self.head_is_live(index))
+
+    def head_is_live(self, index: ChannelIndex) -> bool:
+        top = index.coverage.top()
+        return self.live_since is not None and top is not None and top >= self.live_since
+
+    def record(self, channel_id: int, message_id: int, files: List[SearchResult]) -> None:
+        self.entries += self.channel(channel_id).record(message_id, files)
+
+    def cover(self, channel_id: int, lo: int, hi: int) -> None:
+        self.channel(channel_id).coverage.add(lo, hi)
+        self._evict()
+
+    def read(self, channel_id: int, lo: int, hi: int) -> List[Tuple[int, List[SearchResult]]]:
+        return self.channel(channel_id).read(lo, hi)
+
+    def on_message(self, message: discord.Message) -> None:
+        """Record a new message in a channel that has been searched."""
+        index = self.channels.get(message.channel.id)
+        if index is None or not message.attachments:
+            return
+        self.entries += index.record(
+            message.id, [SearchResult.from_discord_attachment(message, a) for a in message.attachments]
+        )
+
+    def forget_messages(self, channel_id: int, message_ids) -> None:
+        index = self.channels.get(channel_id)
+        if index is None:
+            return
+        for message_id in message_ids:
+            self.entries -= index.forget(message_id)
+
+    def apply_edit(self, channel_id: int, message_id: int, data: dict) -> None:
+        """Apply a raw message edit: new content, or attachments removed."""
+        index = self.channels.get(channel_id)
+        files = index.files.get(message_id) if index is not None else None
+        if not files:
+            return
+        if "attachments" in data:
+            kept = {int(a["id"]) for a in data["attachments"]}
+            remaining = [f for f in files if f.objectId in kept]
+            self.entries -= len(files) - len(remaining)
+            if not remaining:
+                index.forget(message_id)
+                return
+            files = index.files[message_id] = remaining
+        if "content" in data:
+            for file in files:
+                file.content = data["content"]
+
+    def forget_channel(self, channel_id: int) -> None:
+        index = self.channels.pop(channel_id, None)
+        if index is not None:
+            self.entries -= sum(len(files) for files in index.files.values())
+
+    def connected(self) -> None:
+        """A new gateway session started; events before now may have been missed."""
+        self.live_since = discord.utils.time_snowflake(discord.utils.utcnow(), high=True)
+
+    def _evict(self) -> None:
+        while self.entries > self.max_entries and len(self.channels) > 1:
+            oldest = next(iter(self.channels))
+            self.forget_channel(oldest)
@@ -0,0 +1,104 @@
+"""How a search picks the files it returns from the matches it finds.
+
+Without ranking, a page is the first `k` matches a search comes across,
+sorted by score afterwards. With over-scan, a search that has a filename or
+content to rank by keeps scanning until it has seen `overscan` matches, and
+keeps the best `k` of them in a bounded heap; it stops sooner once it holds
+`k` matches scoring at least `stop_score`. The matches it scanned but didn't
+keep are the `remainder`, best first, which become the following pages, so
+over-scanning never skips a match.
+"""
+import heapq
+import os
+from typing import List, Optional, Set, Tuple
+
+
+OVERSCAN = int(os.environ.get("HAYSTACK_RANK_OVERSCAN", 500))
+STOP_SCORE = int(os.environ.get("HAYSTACK_RANK_STOP_SCORE", 95))
+
+
+class FirstK:
+    """Keep the first `k` matches."""
+
+    rank_by: Optional[Tuple[str, str]] = None
+
+    def __init__(self, k: int):
+        self.k = k
+        self.files: list = []
+        self.seen: Set[str] = set()
+
+    @property
+    def full(self) -> bool:
+        return len(self.files) >= self.k
+
+    @property
+    def remaining(self) -> int:
+        """How many more matches could change the outcome."""
+        return self.k - len(self.files)
+
+    def offer(self, file, score: int = 0) -> None:
+        if file.objectId in self.seen:
+            return
+        self.seen.add(file.objectId)
+        self.files.append(file)
+
+    def results(self) -> list:
+        return self.files
+
+    def remainder(self) -> list:
+        """Matches that were scanned but didn't make `results()`, in the order they should be shown."""
+        return []
+
+
+class TopK(FirstK):
+    """Keep the best `k` of the first `overscan` matches, by score."""
+
+    def __init__(self, k: int, rank_by: Tuple[str, str], overscan: int = OVERSCAN, stop_score: int = STOP_SCORE):
+        """
+        Create a TopK.
+
+        Args:
+            k: Files to return
+            rank_by: (needle, field) files are scored by, as `fuzz.ratio(needle, getattr(file, field))`
+            overscan: Matches to score before settling on the best `k`
+            stop_score: Stop early once `k` matches score at least this
+        """
+        super().__init__(k)
+        self.rank_by = rank_by
+        self.overscan = overscan
+        self.stop_score = stop_score
+        self.scanned = 0
+        # Min-heap of (score, -arrival, file): the root is the worst kept
+        # match, and among equal scores the latest to arrive.
+        self.heap: List[tuple] = []
+        # Entries pushed out of, or never admitted to, the heap.
+        self.passed: List[tuple] = []
+
+    @property
+    def full(self) -> bool:
+        if self.scanned >= self.overscan:
+            return True
+        return len(self.heap) >= self.k and self.heap[0][0] >= self.stop_score
+
+    @property
+    def remaining(self) -> int:
+        return self.overscan - self.scanned
+
+    def offer(self, file, score: int = 0) -> None:
+        if file.objectId in self.seen:
+            return
+        self.seen.add(file.objectId)
+        entry = (score, -self.scanned, file)
+        self.scanned += 1
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, entry)
+        elif entry[:2] > self.heap[0][:2]:
+            self.passed.append(heapq.heapreplace(self.heap, entry))
+        else:
+            self.passed.append(entry)
+
+    def results(self) -> list:
+        return [file for _, _, file in sorted(self.heap, key=lambda e: e[:2], reverse=True)]
+
+    def remainder(self) -> list:
+        return [file for _, _, file in sorted(self.passed, key=lambda e: e[:2], reverse=True)]
@@ -0,0 +1,169 @@
+"""Record the `history()` pages a search reads, as replayable benchmark fixtures.
+
+`RecordingSearcher` is a drop-in `DiscordSearcher` that wraps every channel it
+searches so the messages it pages through are captured, stripped down to the
+fields `SearchResult.from_discord_attachment` reads, and written to a gzip'd
+JSON fixture per guild. The bot swaps it in when `HAYSTACK_RECORD_DIR` is set;
+`benchmarks.fixtures.load_fixture` replays what it writes.
+"""
+import asyncio
+import gzip
+import json
+import os
+import time
+from typing import Dict, List, Optional, Set
+
+from .budget import PAGE_SIZE
+from .discord_searcher import DiscordSearcher
+
+
+FIXTURE_VERSION = 1
+# Fixtures are rewritten at most this often; a crash loses the searches since.
+SAVE_INTERVAL_SECONDS = float(os.environ.get("HAYSTACK_RECORD_INTERVAL_SECONDS", 60))
+
+
+class ChannelRecording:
+    """Everything captured for one channel across any number of history calls."""
+
+    def __init__(self, channel):
+        self.id = channel.id
+        self.name = getattr(channel, "name", None) or str(channel.id)
+        parent = getattr(channel, "parent", None)
+        self.parent_id = parent.id if parent is not None else None
+        self.parent_name = getattr(parent, "name", None)
+        self.readable = True
+        self.page_delays: List[float] = []
+        self.messages: Dict[int, list] = {}
+
+    def add(self, message) -> None:
+        attachments = [[a.id, a.filename, a.content_type] for a in message.attachments]
+        content = message.content if attachments else ""
+        self.messages[message.id] = [message.id, message.author.id, content, attachments]
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "parent_id": self.parent_id,
+            "parent_name": self.parent_name,
+            "readable": self.readable,
+            "page_delays": list(self.page_delays),
+            "messages": [self.messages[k] for k in sorted(self.messages, reverse=True)],
+        }
+
+
+class RecordingChannel:
+    """Proxy around a live channel that records what `history()` yields.
+
+    Everything except `history()` and `permissions_for` is forwarded to the
+    wrapped channel. Page boundaries are inferred every `PAGE_SIZE` messages,
+    which is how discord.py batches `logs_from` calls.
+    """
+
+    def __init__(self, channel, recording: ChannelRecording):
+        self._channel = channel
+        self._recording = recording
+
+    def __getattr__(self, name):
+        return getattr(self._channel, name)
+
+    def permissions_for(self, member):
+        permissions = self._channel.permissions_for(member)
+        self._recording.readable = bool(permissions.read_message_history)
+        return permissions
+
+    async def history(self, *args, **kwargs):
+        page_start = time.perf_counter()
+        served = 0
+        async for message in self._channel.history(*args, **kwargs):
+            if served % PAGE_SIZE == 0:
+                now = time.perf_counter()
+                self._recording.page_delays.append(now - page_start)
+                page_start = now
+            served += 1
+            self._recording.add(message)
+            yield message
+
+
+class HistoryRecorder:
+    """Collects `ChannelRecording`s per guild and writes them as fixtures."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.guilds: Dict[Optional[int], dict] = {}
+        # Guilds searched since their fixture was last written.
+        self.dirty: Set[Optional[int]] = set()
+
+    def wrap(self, channels: list) -> List[RecordingChannel]:
+        wrapped = []
+        for channel in channels:
+            guild = getattr(channel, "guild", None)
+            guild_id = guild.id if guild is not None else None
+            entry = self.guilds.setdefault(guild_id, {
+                "name": getattr(guild, "name", None) or "dm",
+                "channels": {},
+            })
+            recording = entry["channels"].setdefault(channel.id, ChannelRecording(channel))
+            wrapped.append(RecordingChannel(channel, recording))
+            self.dirty.add(guild_id)
+        return wrapped
+
+    def fixture_path(self, guild_id: Optional[int]) -> str:
+        return os.path.join(self.directory, f"guild_{guild_id if guild_id is not None else 'dm'}.json.gz")
+
+    def payloads(self) -> Dict[Optional[int], dict]:
+        """Snapshot the dirty guilds' fixtures and mark them clean.
+
+        Searches keep adding to the recordings, so call this on the event loop
+        and hand the result to `write`, which is safe to run in a thread.
+        """
+        payloads = {
+            guild_id: {
+                "version": FIXTURE_VERSION,
+                "guild": {"id": guild_id, "name": self.guilds[guild_id]["name"]},
+                "channels": [c.to_dict() for c in self.guilds[guild_id]["channels"].values()],
+            }
+            for guild_id in self.dirty
+        }
+        self.dirty.clear()
+        return payloads
+
+    def write(self, payloads: Dict[Optional[int], dict]) -> List[str]:
+        os.makedirs(self.directory, exist_ok=True)
+        paths = []
+        for guild_id, payload in payloads.items():
+            path = self.fixture_path(guild_id)
+            with gzip.open(path, "wt", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+            paths.append(path)
+        return paths
+
+    def save(self) -> List[str]:
+        return self.write(self.payloads())
+
+
+class RecordingSearcher(DiscordSearcher):
+    """A `DiscordSearcher` that records every channel it pages through.
+
+    Set `HAYSTACK_RECORD_DIR` when starting the bot to swap this in; the
+    fixtures of guilds searched since the last save are rewritten after a
+    search at most every `save_interval` seconds.
+    """
+
+    def __init__(self, directory: str, save_interval: float = SAVE_INTERVAL_SECONDS, **kwargs):
+        super().__init__(**kwargs)
+        self.recorder = HistoryRecorder(directory)
+        self.save_interval = save_interval
+        self._saved_at = float("-inf")
+
+    async def search(self, onii_chans, *args, **kwargs):
+        results = await super().search(self.recorder.wrap(onii_chans), *args, **kwargs)
+        if time.monotonic() - self._saved_at >= self.save_interval:
+            self._saved_at = time.monotonic()
+            payloads = self.recorder.payloads()
+            try:
+                await asyncio.to_thread(self.recorder.write, payloads)
+            except Exception as e:
+                self.recorder.dirty.update(payloads)
+                print(f"[recording] saving fixtures failed: {e!r}")
+        return results
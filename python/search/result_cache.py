@@ -0,0 +1,155 @@
+"""Short-lived cache of first-page search results.
+
+Users often re-run the same `/search` within minutes. Results are cached under
+a normalized form of the query plus where it ran, and dropped when a gateway
+event says they may be stale (see the listeners in `Haystackfs`), when they
+outlive the TTL, or when the cache is over its size cap (least recently used
+first).
+"""
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional, Set, Tuple
+
+from ..models.query import Query
+from .search_models import SearchResults
+
+
+DEFAULT_TTL_SECONDS = 300
+DEFAULT_MAX_ENTRIES = 1024
+
+
+def _lower(value: Optional[str]) -> Optional[str]:
+    return value.strip().lower() if value else None
+
+
+class SearchResultCache:
+
+    def __init__(
+        self,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Create a SearchResultCache.
+
+        Args:
+            ttl_seconds: How long an entry may be served after it was stored
+            max_entries: How many entries to keep before evicting the least recently used
+            clock: Monotonic time source, overridable for tests
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.clock = clock
+        # key -> (stored_at, results)
+        self._entries: "OrderedDict[Hashable, Tuple[float, SearchResults]]" = OrderedDict()
+        # scope id (guild, or channel for DMs) -> keys stored under it
+        self._by_scope: Dict[int, Set[Hashable]] = {}
+        # scope id -> bumped on every invalidation, so a search that started
+        # before an invalidation can't store what it found afterwards.
+        self._generations: Dict[int, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key_for(query: Query, scope_id: int) -> Optional[tuple]:
+        """Normalize a query into a cache key, or None if it shouldn't be cached.
+
+        Args:
+            query: The user query
+            scope_id: The guild the search ran in, or the channel id for DMs
+
+        Queries continuing from a pagination cursor are never cached.
+        """
+        if query.channel_date_map:
+            return None
+        return (
+            scope_id,
+            query.channel.id if query.channel else None,
+            _lower(query.filename),
+            _lower(query.filetype),
+            _lower(query.custom_filetype),
+            query.author.id if query.author else None,
+            _lower(query.content),
+            query.after.isoformat() if query.after else None,
+            query.before.isoformat() if query.before else None,
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[SearchResults]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        stored_at, results = entry
+        if self.clock() - stored_at > self.ttl_seconds:
+            self._drop(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return self._copy(results)
+
+    def generation(self, scope_id: int) -> int:
+        return self._generations.get(scope_id, 0)
+
+    def put(self, key: Hashable, results: SearchResults, generation: Optional[int] = None) -> None:
+        """Store `results`, unless `generation` shows the scope was invalidated since it was read."""
+        if generation is not None and generation != self.generation(key[0]):
+            return
+        self._drop(key)
+        self._entries[key] = (self.clock(), self._copy(results))
+        self._by_scope.setdefault(key[0], set()).add(key)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+
+    def invalidate_channel(self, scope_id: Optional[int], channel_id: int) -> int:
+        """Drop entries that could include files from `channel_id`.
+
+        That's every scope-wide search plus searches limited to that channel.
+        Returns the number of entries dropped.
+        """
+        scope_id = scope_id if scope_id is not None else channel_id
+        self._bump(scope_id)
+        stale = [key for key in self._by_scope.get(scope_id, ()) if key[1] is None or key[1] == channel_id]
+        for key in stale:
+            self._drop(key)
+        return len(stale)
+
+    def invalidate_scope(self, scope_id: int) -> int:
+        """Drop every entry stored for a guild (or DM channel)."""
+        self._bump(scope_id)
+        stale = list(self._by_scope.get(scope_id, ()))
+        for key in stale:
+            self._drop(key)
+        return len(stale)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._by_scope.clear()
+
+    def _bump(self, scope_id: int) -> None:
+        self._generations[scope_id] = self._generations.get(scope_id, 0) + 1
+
+    def _drop(self, key: Hashable) -> None:
+        if self._entries.pop(key, None) is None:
+            return
+        keys = self._by_scope.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_scope[key[0]]
+
+    @staticmethod
+    def _copy(results: SearchResults) -> SearchResults:
+        """Shallow copy so callers can't mutate what's cached."""
+        return SearchResults(
+            files=list(results.files) if results.files is not None else None,
+            message=results.message,
+            channel_date_map=dict(results.channel_date_map) if results.channel_date_map else results.channel_date_map,
+            partial=results.partial,
+            remainder=list(results.remainder) if results.remainder is not None else None,
+        )
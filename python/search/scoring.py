@@ -0,0 +1,160 @@
+"""Fuzzy scoring for batches of candidate files, off the event loop when large.
+
+`fuzz.partial_ratio` is pure CPU and costs roughly the product of the needle
+and haystack lengths, so a content search over long messages can hold the
+event loop for hundreds of milliseconds. `FuzzyScorer` measures each batch by
+the number of characters it has to score: small batches are scored inline,
+larger ones are sent to a process pool.
+
+Batches cross the process boundary as one NUL-joined string per field and
+come back as a `bytes` of per-file flags or scores, so pickling costs a few
+large copies rather than an object per file.
+"""
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Sequence
+
+from thefuzz import fuzz
+
+from ..models.query import Query
+
+
+# Characters of haystack text above which a batch is scored in the pool.
+OFFLOAD_CHARS = int(os.environ.get("HAYSTACK_SCORING_OFFLOAD_CHARS", 50_000))
+MAX_WORKERS = int(os.environ.get("HAYSTACK_SCORING_WORKERS", 0)) or None
+SEP = "\x00"
+
+
+def _join(values: Sequence[str]) -> str:
+    return SEP.join(value.replace(SEP, " ") for value in values)
+
+
+def _split(joined: str, n: int) -> List[str]:
+    return joined.split(SEP) if n else []
+
+
+def match_batch(n: int, thresh: int, content: Optional[str], contents: str,
+                filename: Optional[str], filenames: str,
+                custom_filetype: Optional[str], filetypes: str) -> bytes:
+    """Flag which of `n` files pass every fuzzy check of a query.
+
+    Args:
+        n: Number of files in the batch
+        thresh: Minimum `partial_ratio` for a field to match
+        content, filename, custom_filetype: Lowercased query fields, None if unset
+        contents, filenames, filetypes: The files' lowercased fields, NUL-joined;
+            empty when the matching query field is unset
+
+    Returns one byte per file, 1 if it matched.
+    """
+    flags = bytearray(b"\x01" * n)
+    for needle, joined in ((content, contents), (filename, filenames), (custom_filetype, filetypes)):
+        if not needle:
+            continue
+        for i, haystack in enumerate(_split(joined, n)):
+            if flags[i] and fuzz.partial_ratio(needle, haystack) < thresh:
+                flags[i] = 0
+    return bytes(flags)
+
+
+def scored_match_batch(n: int, thresh: int, content: Optional[str], contents: str,
+                       filename: Optional[str], filenames: str,
+                       custom_filetype: Optional[str], filetypes: str,
+                       needle: str, haystacks: str) -> bytes:
+    """`match_batch`, then the `fuzz.ratio` of `needle` against each match's NUL-joined haystack.
+
+    Returns one byte per file: 0 if it didn't match, its score plus one if it did.
+    """
+    flags = match_batch(n, thresh, content, contents, filename, filenames, custom_filetype, filetypes)
+    return bytes(
+        fuzz.ratio(needle, haystack) + 1 if keep else 0
+        for keep, haystack in zip(flags, _split(haystacks, n))
+    )
+
+
+def ratio_batch(n: int, needle: str, haystacks: str) -> bytes:
+    """`fuzz.ratio` of `needle` against each of `n` NUL-joined haystacks, one byte per score."""
+    return bytes(fuzz.ratio(needle, haystack) for haystack in _split(haystacks, n))
+
+
+class FuzzyScorer:
+    """Run fuzzy checks and ranking for `DiscordSearcher`, offloading large batches."""
+
+    def __init__(self, offload_chars: int = OFFLOAD_CHARS, max_workers: Optional[int] = MAX_WORKERS):
+        """
+        Create a FuzzyScorer.
+
+        Args:
+            offload_chars: Batches with more haystack characters than this go to the pool
+            max_workers: Pool size; defaults to the number of CPUs
+        """
+        self.offload_chars = offload_chars
+        self.max_workers = max_workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.inline_batches = 0
+        self.offloaded_batches = 0
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Spawned rather than forked: the bot process has a running event
+            # loop and helper threads that a forked child would inherit.
+            self._pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def _run(self, size: int, fn, *args):
+        if size <= self.offload_chars:
+            self.inline_batches += 1
+            return fn(*args)
+        self.offloaded_batches += 1
+        return await asyncio.get_running_loop().run_in_executor(self.pool, fn, *args)
+
+    @staticmethod
+    def _match_args(query: Query, thresh: int, files: list) -> Optional[tuple]:
+        content = query.content.lower() if query.content else None
+        filename = query.filename.lower() if query.filename else None
+        custom_filetype = query.custom_filetype.lower() if query.custom_filetype else None
+        if not (content or filename or custom_filetype):
+            return None
+        contents = _join([(f.content or "").lower() for f in files]) if content else ""
+        filenames = _join([f.filename.lower() for f in files]) if filename else ""
+        filetypes = _join([f.filetype.lower() for f in files]) if custom_filetype else ""
+        return len(files), thresh, content, contents, filename, filenames, custom_filetype, filetypes
+
+    async def match(self, query: Query, thresh: int, files: list) -> list:
+        """Keep the files in `files` that pass the query's fuzzy checks.
+
+        `files` should already have passed `SearchResult.match_filters`.
+        """
+        args = self._match_args(query, thresh, files) if files else None
+        if args is None:
+            return files
+        flags = await self._run(len(args[3]) + len(args[5]) + len(args[7]), match_batch, *args)
+        return [f for f, keep in zip(files, flags) if keep]
+
+    async def match_scored(self, query: Query, thresh: int, files: list, needle: str, field: str) -> list:
+        """`match`, paired with each match's `fuzz.ratio` of `needle` against its `field`."""
+        if not files:
+            return []
+        args = self._match_args(query, thresh, files) or (len(files), thresh, None, "", None, "", None, "")
+        haystacks = _join([getattr(f, field) or "" for f in files])
+        scores = await self._run(
+            len(args[3]) + len(args[5]) + len(args[7]) + len(haystacks), scored_match_batch, *args, needle, haystacks
+        )
+        return [(f, score - 1) for f, score in zip(files, scores) if score]
+
+    async def rank(self, needle: str, files: list, field: str) -> list:
+        """`files` sorted by descending `fuzz.ratio` of `needle` against each file's `field`."""
+        if len(files) < 2:
+            return files
+        haystacks = _join([getattr(f, field) or "" for f in files])
+        scores = await self._run(len(haystacks), ratio_batch, len(files), needle, haystacks)
+        order = sorted(range(len(files)), key=scores.__getitem__, reverse=True)
+        return [files[i] for i in order]
@@ -1,103 +1,149 @@
-from dataclasses import asdict, dataclass, fields
-from typing import List
-from ..models.query import Query
+from dataclasses import dataclass
+from typing import List, Optional
+from ..models.query import Query, cursor_map
+from .categories import CATEGORY_BITS, category_mask, classify
 from thefuzz import fuzz
-from datetime import datetime
+from datetime import datetime, timedelta
+
+
+EPOCH = datetime(1970, 1, 1)
+
+# Columns persisted by `SearchResults.to_dict`, in `SearchResult` field order.
+COLUMNS = ("objectId", "author_id", "channel_id", "message_id", "guild_id", "filename", "content_type", "created_at")
 
 
 @dataclass
 class SearchResult:
+    """One attachment that matched a query.
+
+    Only what can't be derived is stored; `url`, `jump_url` and `filetype`
+    are computed from the ids and filename on demand. `created_at` is
+    milliseconds since the Unix epoch (UTC). `content` references the
+    message's content string (shared by every attachment on that message) and
+    is None once results have been persisted, since nothing reads it after
+    the search. `category` is the attachment's content-category bitmask
+    (see `categories.py`), derived once on construction.
+    """
+    __slots__ = COLUMNS + ("content", "category")
+
     objectId: int
     author_id: int
-    content: str
-    filename: str
-    content_type: str
-    filetype: str
     channel_id: int
     message_id: int
-    url: str
-    jump_url: str
-    created_at: str
+    guild_id: Optional[int]
+    filename: str
+    content_type: Optional[str]
+    created_at: int
+    content: Optional[str]
+
+    def __post_init__(self):
+        self.category = classify(self.filename, self.content_type)
 
     @staticmethod
     def from_discord_attachment(message, file) -> 'SearchResult':
-        if '.' in file.filename:
-            filetype = file.filename[file.filename.rindex('.') + 1:]
-        else:
-            filetype = "unknown"
+        guild = message.guild
         return SearchResult(
             objectId=file.id,
             author_id=message.author.id,
-            content=message.content,
-            filename=file.filename,
-            content_type=file.content_type,
-            filetype=filetype,
             channel_id=message.channel.id,
             message_id=message.id,
-            url=file.url,
-            jump_url=message.jump_url,
-            created_at=message.created_at.isoformat()
+            guild_id=guild.id if guild is not None else None,
+            filename=file.filename,
+            content_type=file.content_type,
+            created_at=round(message.created_at.timestamp() * 1000),
+            content=message.content,
         )
 
+    @property
+    def filetype(self) -> str:
+        if '.' in self.filename:
+            return self.filename[self.filename.rindex('.') + 1:]
+        return "unknown"
+
+    @property
+    def url(self) -> str:
+        return f"https://cdn.discordapp.com/attachments/{self.channel_id}/{self.objectId}/{self.filename}"
+
+    @property
+    def jump_url(self) -> str:
+        guild_segment = self.guild_id if self.guild_id is not None else "@me"
+        return f"https://discord.com/channels/{guild_segment}/{self.channel_id}/{self.message_id}"
+
+    @property
+    def created_datetime(self) -> datetime:
+        """`created_at` as a naive UTC datetime."""
+        return EPOCH + timedelta(milliseconds=self.created_at)
+
     def match_query(self, query: Query, thresh):
-        query_fields = list(filter(lambda field: getattr(query, field.name), fields(query)))
-        for field in query_fields:
-            key = field.name
-            value = getattr(query, key)
-            if key == "content" or key == "filename" or key == "custom_filetype":
-                if key == "custom_filetype":
-                    key = "filetype"
-                score = fuzz.partial_ratio(value.lower(), getattr(self, key).lower())
-                if score < thresh:
-                    return False
-            elif key == "after":
-                created_at = datetime.fromisoformat(self.created_at)
-                created_at = created_at.replace(tzinfo=None)
-                if created_at < query.after:
-                    return False
-            elif key == "before":
-                created_at = datetime.fromisoformat(self.created_at)
-                created_at = created_at.replace(tzinfo=None)
-                if created_at > query.before:
-                    return False
-            elif key == "author" or key == "channel":
-                if getattr(self, key + "_id") != value.id:
-                    return False
-            elif key == "filetype":
-                if value == 'image' and not self.is_image():
-                    return False
-                if value == 'audio' and not self.is_audio():
-                    return False
-                if value == 'archive' and not self.is_archive():
+        return self.match_filters(query) and self.match_fuzzy(query, thresh)
+
+    def match_filters(self, query: Query) -> bool:
+        """The cheap, exact checks of `match_query`."""
+        if query.after and self.created_datetime < query.after:
+            return False
+        if query.before and self.created_datetime > query.before:
+            return False
+        if query.author and self.author_id != query.author.id:
+            return False
+        if query.channel and self.channel_id != query.channel.id:
+            return False
+        if query.filetype:
+            mask = category_mask(query.filetype)
+            if mask is not None:
+                if not self.category & mask:
                     return False
-                matches_file_type = self.filetype is not None and self.filetype != "unknown" and value in self.filetype
+            else:
+                value = query.filetype
+                filetype = self.filetype
+                matches_file_type = filetype != "unknown" and value in filetype
                 matches_content_type = self.content_type is not None and value in self.content_type
                 if not matches_content_type and not matches_file_type:
                     return False
         return True
 
-    def is_image(self):
-        if not self.content_type:
+    def match_fuzzy(self, query: Query, thresh) -> bool:
+        """The fuzzy checks of `match_query`; see `FuzzyScorer.match` for scoring many files at once."""
+        if query.content and fuzz.partial_ratio(query.content.lower(), (self.content or "").lower()) < thresh:
+            return False
+        if query.filename and fuzz.partial_ratio(query.filename.lower(), self.filename.lower()) < thresh:
+            return False
+        if query.custom_filetype and fuzz.partial_ratio(query.custom_filetype.lower(), self.filetype.lower()) < thresh:
             return False
-        if 'image' in self.content_type:
-            return True
-        return self.filetype in {'jpg', 'jpeg', 'gif', 'png'}
+        return True
+
+    def is_image(self):
+        return bool(self.category & CATEGORY_BITS["image"])
 
     def is_audio(self):
-        if not self.content_type:
-            return False
-        if 'audio' in self.content_type:
-            return True
-        return self.filetype in {'wav', 'mp3'}
+        return bool(self.category & CATEGORY_BITS["audio"])
 
     def is_archive(self):
-        if not self.content_type:
-            return False
-        return self.filetype in {'rar', 'zip'}
+        return bool(self.category & CATEGORY_BITS["zip"])
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in COLUMNS + ("content",)}
 
     @classmethod
     def from_dict(cls, d: dict) -> 'SearchResult':
-        return cls(**d)
+        """Build from `to_dict` output, or from the older 11-field dataclass dict."""
+        created_at = d["created_at"]
+        if isinstance(created_at, str):
+            created_at = round(datetime.fromisoformat(created_at).timestamp() * 1000)
+        guild_id = d.get("guild_id")
+        if guild_id is None and d.get("jump_url"):
+            guild_segment = d["jump_url"].split('/')[4]
+            guild_id = int(guild_segment) if guild_segment.isdigit() else None
+        return cls(
+            objectId=d["objectId"],
+            author_id=d["author_id"],
+            channel_id=d["channel_id"],
+            message_id=d["message_id"],
+            guild_id=guild_id,
+            filename=d["filename"],
+            content_type=d.get("content_type"),
+            created_at=created_at,
+            content=d.get("content"),
+        )
 
 
 @dataclass
@@ -105,6 +151,12 @@ class SearchResults:
     files: List[SearchResult] = None
     message: str = ""
     channel_date_map: dict = None
+    # Whether the search stopped at its deadline or scan budget rather than
+    # filling the page or running out of history.
+    partial: bool = False
+    # Ranked matches that were scanned but didn't make this page, best first.
+    # They're shown on the following pages, and aren't stored with this one.
+    remainder: List[SearchResult] = None
 
     @staticmethod
     def from_discord_message(message) -> 'SearchResults':
@@ -114,28 +166,31 @@ class SearchResults:
         return SearchResults(files=files)
 
     def to_dict(self) -> dict:
-        cdm = None
-        if self.channel_date_map:
-            cdm = {
-                k: (v.isoformat() if isinstance(v, datetime) else v)
-                for k, v in self.channel_date_map.items()
-            }
+        """Serialize for the pagination store.
+
+        Files are stored as columns (one array per `SearchResult` field) rather
+        than one object per file, and message content is dropped.
+        """
+        files = self.files or []
         return {
-            "files": [asdict(f) for f in (self.files or [])],
+            "files": {name: [getattr(f, name) for f in files] for name in COLUMNS},
             "message": self.message,
-            "channel_date_map": cdm,
+            "channel_date_map": self.channel_date_map,
+            "partial": self.partial,
         }
 
     @classmethod
     def from_dict(cls, d: dict) -> 'SearchResults':
-        cdm = d.get("channel_date_map")
-        if cdm:
-            cdm = {
-                k: (datetime.fromisoformat(v) if isinstance(v, str) else v)
-                for k, v in cdm.items()
-            }
+        files = d.get("files") or []
+        if isinstance(files, dict):
+            # Columnar, as written by to_dict.
+            files = [SearchResult(*row, None) for row in zip(*(files[name] for name in COLUMNS))]
+        else:
+            # One dict per file, as written before pages were columnar.
+            files = [SearchResult.from_dict(f) for f in files]
         return cls(
-            files=[SearchResult.from_dict(f) for f in (d.get("files") or [])],
+            files=files,
             message=d.get("message", ""),
-            channel_date_map=cdm,
+            channel_date_map=cursor_map(d.get("channel_date_map")),
+            partial=d.get("partial", False),
         )
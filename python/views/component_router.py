@@ -0,0 +1,65 @@
+"""Route clicks on results messages by `custom_id`, without a view per message.
+
+Every component a results message carries has its `row_id` in its
+`custom_id` (`hfs:next:<row_id>`, `hfs:back:<row_id>`, `hfs:dd:<row_id>`).
+Each item class declares a `template` matching its custom_ids and a
+`from_custom_id` that builds the item from a match, like discord.py's
+`DynamicItem`. `ComponentRouter` holds one entry per class, so the bot
+registers the same few handlers however many results messages are live, and
+there's nothing to rebuild when it restarts.
+"""
+import re
+from typing import List, Optional, Type
+
+import discord
+
+
+class TemplatedItem:
+    """Mixin for items that can be rebuilt from the custom_id of a click."""
+
+    template: re.Pattern
+
+    @classmethod
+    def from_custom_id(cls, interaction: discord.Interaction, match: re.Match) -> "TemplatedItem":
+        return cls(row_id=match["row_id"])
+
+
+class ComponentRouter:
+
+    def __init__(self, items: List[Type[TemplatedItem]]):
+        """
+        Create a ComponentRouter.
+
+        Args:
+            items: The item classes to route clicks to, by their `template`
+        """
+        self.items = items
+        self.routed = 0
+
+    def match(self, custom_id: str) -> Optional[tuple]:
+        for item in self.items:
+            match = item.template.fullmatch(custom_id)
+            if match is not None:
+                return item, match
+        return None
+
+    async def dispatch(self, interaction: discord.Interaction) -> bool:
+        """
+        Run the callback of the item a component interaction was for.
+
+        Args:
+            interaction: Any interaction the bot received
+
+        Returns:
+            Whether the interaction was routed.
+        """
+        if interaction.type is not discord.InteractionType.component or not interaction.data:
+            return False
+        routed = self.match(interaction.data.get("custom_id", ""))
+        if routed is None:
+            return False
+        cls, match = routed
+        item = cls.from_custom_id(interaction, match)
+        self.routed += 1
+        await item.callback(interaction)
+        return True
@@ -0,0 +1,26 @@
+from typing import Dict
+
+from .haystack_embed import HaystackEmbed
+
+
+TOP_KEYS = 10
+
+
+def _top(counts: Dict[str, int], fmt) -> str:
+    ranked = sorted(counts.items(), key=lambda kv: kv[1], reverse=True)
+    lines = [f"{fmt(key)}: {count}" for key, count in ranked[:TOP_KEYS]]
+    if len(ranked) > TOP_KEYS:
+        lines.append(f"...and {len(ranked) - TOP_KEYS} more")
+    return "\n".join(lines) or "-"
+
+
+class FacetsEmbed(HaystackEmbed):
+
+    def __init__(self, facets: Dict[str, Dict[str, int]], window: str, name: str, avatar_url: str):
+        """Build the `/facets` embed: top counts for each dimension."""
+        total = sum(facets["category"].values())
+        super().__init__(title=f"{total} file{'s' if total != 1 else ''} {window}", name=name, avatar_url=avatar_url)
+        self.add_field(name="Categories", value=_top(facets["category"], str))
+        self.add_field(name="Extensions", value=_top(facets["extension"], lambda ext: f".{ext}"))
+        self.add_field(name="Channels", value=_top(facets["channel"], lambda channel_id: f"<#{channel_id}>"), inline=False)
+        self.add_field(name="Uploaders", value=_top(facets["uploader"], lambda user_id: f"<@{user_id}>"), inline=False)
@@ -1,9 +1,14 @@
+import re
+
 import discord
 from ..search.search_models import SearchResults, SearchResult
+from .pagination_callbacks import lookup_filename
+from .component_router import TemplatedItem
 
 
-class FileDropDown(discord.ui.Select):
+class FileDropDown(TemplatedItem, discord.ui.Select):
     MAX_OPTIONS = 25
+    template = re.compile(r"hfs:dd:(?P<row_id>[0-9a-f]+)")
 
     def __init__(self, files: SearchResults, *, row_id: str):
         self.row_id = row_id
@@ -18,6 +23,12 @@ class FileDropDown(discord.ui.Select):
             custom_id=f"hfs:dd:{row_id}",
         )
 
+    @classmethod
+    def from_custom_id(cls, interaction: discord.Interaction, match: re.Match) -> "FileDropDown":
+        dropdown = cls(SearchResults(files=[]), row_id=match["row_id"])
+        dropdown._refresh_state(interaction, interaction.data)
+        return dropdown
+
     @staticmethod
     def build_select_value(file: SearchResult):
         return ','.join(map(str, [file.channel_id, file.message_id, file.objectId]))
@@ -27,7 +38,15 @@ class FileDropDown(discord.ui.Select):
 
     async def callback(self, interaction: discord.Interaction):
         value = self.values[0]
-        name = self.value_to_name[value]
+        name = self.value_to_name.get(value)
+        if name is None:
+            # Rebuilt from the click's custom_id, which doesn't carry the page's files.
+            name = await lookup_filename(interaction, self.row_id, value)
+            if name is None:
+                await interaction.response.send_message(
+                    "This search has expired. Run `/search` again.", ephemeral=True
+                )
+                return
         message = interaction.message
         embed = message.embeds[0]
         channel_id, message_id, file_id = value.split(',')
@@ -1,21 +1,28 @@
 from .haystack_embed import HaystackEmbed
 from ..search.search_models import SearchResults
-from ..messages import SEARCH_RESULTS_FOUND
+from ..messages import PARTIAL_RESULTS, SEARCH_RESULTS_FOUND
 
 
 class FileEmbed(HaystackEmbed):
 
-    def __init__(self, search_results: SearchResults, name: str, avatar_url: str):
-        """Build file search embed."""
+    def __init__(self, search_results: SearchResults, name: str, avatar_url: str, page: int = 1):
+        """Build file search embed for one page of results."""
+        files = search_results.files or []
         super().__init__(
-            title=SEARCH_RESULTS_FOUND.format(len(search_results.files)) + f" file{'s' if search_results.files else ''}",
+            title=SEARCH_RESULTS_FOUND.format(len(files)) + f" file{'s' if len(files) != 1 else ''}",
             name=name, avatar_url=avatar_url
         )
-        first_file = search_results.files[0]
-        filename = first_file.filename[:100]
-        media_url = first_file.jump_url
+        if files:
+            first_file = files[0]
+            filename = first_file.filename[:100]
+            media_url = first_file.jump_url
 
-        super().insert_field_at(index=0, name=filename, value=media_url, inline=False)
-        if first_file.is_image():
-            super().set_image(url=first_file.url)
-        super().set_footer(text="Page 1, " + super().footer.text, icon_url=super().footer.icon_url)
+            super().insert_field_at(index=0, name=filename, value=media_url, inline=False)
+            if first_file.is_image():
+                super().set_image(url=first_file.url)
+        if search_results.partial:
+            self.description = PARTIAL_RESULTS
+        elif not files:
+            # A placeholder page for a search that may still find more.
+            self.description = search_results.message
+        super().set_footer(text=f"Page {page}, " + super().footer.text, icon_url=super().footer.icon_url)
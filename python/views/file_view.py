@@ -2,16 +2,23 @@
 
 `FileView` is a thin component carrier — it owns no pagination state. State
 lives in `PaginationStore`, keyed by the `row_id` baked into each component's
-`custom_id`. The view is registered with `bot.add_view(view, message_id=...)`
-so clicks survive bot restarts.
+`custom_id`.
+
+Each page's embed and file components are rendered once, when the page is
+stored, by `build_page_payload`; the payload is kept next to the page in
+`pages_json` and replayed with `PayloadView` on every later visit. Clicks are
+routed by `ComponentRouter`, which rebuilds the clicked item from its
+`custom_id`, so nothing is registered per message and nothing needs rebuilding
+when the bot restarts.
 """
 import discord
 
 from .file_dropdown import FileDropDown
 from .file_button import FileButton
+from .file_embed import FileEmbed
 from .page_back_button import PageBackButton
 from .page_next_button import PageNextButton
-from ..search.search_models import SearchResult, SearchResults
+from ..search.search_models import SearchResults
 
 
 class FileView(discord.ui.View):
@@ -30,9 +37,6 @@ class FileView(discord.ui.View):
             - Next button only when current_page != last_page (more pages exist
               or are unknown — last_page == -1 is the "more pages" sentinel).
             - Neither when current_page == 1 == last_page (single-page result).
-
-        `bot.add_view(view, message_id=...)` is called on every edit, so the
-        registered component shape always matches what's currently on the message.
         """
         super().__init__(timeout=None)
         self.row_id = row_id
@@ -41,7 +45,7 @@ class FileView(discord.ui.View):
         if 0 < len(files) <= 5:
             for file in files:
                 self.add_item(FileButton(file))
-        else:
+        elif files:
             self.add_item(FileDropDown(results, row_id=row_id))
 
         if current_page > 1:
@@ -50,32 +54,60 @@ class FileView(discord.ui.View):
             self.add_item(PageNextButton(row_id=row_id))
 
 
-def build_page_embed(
-    message: discord.Message, results: SearchResults, current_page: int
-) -> discord.Embed:
-    """Mutate the embed currently on `message` to preview the first file of `results`."""
-    embed = message.embeds[0]
-    preview_file: SearchResult = results.files[0]
-
-    guild_segment = str(message.guild.id) if message.guild is not None else "@me"
-    jump_url = (
-        f"https://discord.com/channels/{guild_segment}/"
-        f"{preview_file.channel_id}/{preview_file.message_id}"
-    )
-    media_url = (
-        f"https://cdn.discordapp.com/attachments/"
-        f"{preview_file.channel_id}/{preview_file.objectId}/{preview_file.filename}"
-    )
-
-    num_files = len(results.files)
-    embed.title = f"Found {num_files} file{'s' if num_files != 1 else ''}"
-    embed.clear_fields()
-    embed.insert_field_at(index=0, name=preview_file.filename[:256], value=jump_url)
-    embed.set_image(url=media_url)
-
-    footer_text = embed.footer.text or ""
-    idx = footer_text.find("Delivered")
-    if idx != -1:
-        footer_text = footer_text[idx:]
-    embed.set_footer(text=f"Page {current_page}, {footer_text}", icon_url=embed.footer.icon_url)
-    return embed
+class PayloadView(discord.ui.View):
+    """Sends pre-rendered component payloads instead of building items.
+
+    The view is stopped immediately so discord.py doesn't track it for the
+    message; `ComponentRouter` handles the clicks.
+    """
+
+    def __init__(self, components: list):
+        super().__init__(timeout=None)
+        self.components = components
+        self.stop()
+
+    def to_components(self) -> list:
+        return self.components
+
+
+def build_page_payload(
+    results: SearchResults, *, row_id: str, page: int, name: str, avatar_url: str
+) -> dict:
+    """Render one page's embed and file components to plain dicts, for storing with the page."""
+    return {
+        "embed": FileEmbed(results, name=name, avatar_url=avatar_url, page=page).to_dict(),
+        "components": FileView(results, row_id=row_id).to_components(),
+    }
+
+
+def render_components(payload: dict, *, row_id: str, current_page: int, last_page: int) -> list:
+    """The page's cached file components plus the nav row for its position.
+
+    Nav buttons aren't cached with the page since `last_page` can change after
+    the page was stored.
+    """
+    nav = []
+    if current_page > 1:
+        nav.append(PageBackButton(row_id=row_id).to_component_dict())
+    if current_page != last_page:
+        nav.append(PageNextButton(row_id=row_id).to_component_dict())
+    if not nav:
+        return payload["components"]
+    return payload["components"] + [{"type": discord.ComponentType.action_row.value, "components": nav}]
+
+
+def differs(cached, live) -> bool:
+    """Whether `live` (as echoed back by Discord) disagrees with anything set in `cached`.
+
+    Discord decorates what it echoes back (proxy URLs, image sizes, defaults),
+    so only the keys present in `cached` are compared.
+    """
+    if isinstance(cached, dict):
+        if not isinstance(live, dict):
+            return True
+        return any(differs(value, live.get(key)) for key, value in cached.items())
+    if isinstance(cached, list):
+        if not isinstance(live, list) or len(cached) != len(live):
+            return True
+        return any(differs(c, l) for c, l in zip(cached, live))
+    return cached != live
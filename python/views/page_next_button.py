@@ -1,9 +1,14 @@
+import re
+
 import discord
 
+from .component_router import TemplatedItem
 from .pagination_callbacks import handle_next_click
 
 
-class PageNextButton(discord.ui.Button):
+class PageNextButton(TemplatedItem, discord.ui.Button):
+    template = re.compile(r"hfs:next:(?P<row_id>[0-9a-f]+)")
+
     def __init__(self, *, row_id: str):
         super().__init__(
             style=discord.ButtonStyle.secondary,
@@ -3,18 +3,35 @@
 `PageNextButton` / `PageBackButton` callbacks delegate here. This module owns
 the read-modify-write against `PaginationStore` and the message re-render.
 
-State lives entirely in the store; the View instances are stateless wrappers
-holding only `row_id`. That makes the callbacks safe to invoke after a bot
-restart that rehydrated the view via `bot.add_view(view, message_id=...)`.
+State lives entirely in the store; the items are stateless wrappers holding
+only `row_id`, rebuilt from the custom_id of each click by `ComponentRouter`.
+That makes the callbacks safe to invoke after a bot restart.
+Each page is stored with its rendered payload, so revisiting it costs one
+store read and one message edit.
+
+Another process sharing the store may change a row between our read and our
+write. Every write passes the version it read, and a click that loses the
+race is replayed on the row's new state, so neither click is lost.
+
+A click that needs a search goes through the bot's admission control, like
+`/search` does, so clicking Next can't get around the per-guild and per-user
+limits.
 """
 import json
-from datetime import datetime
+import time
 
 import discord
 
 from ..bot_commands import fsearch
 from ..models.query import Query
+from ..search.admission import AdmissionRejected
 from ..search.search_models import SearchResults
+from ..messages import FILES_DELETED_KEEP_LOOKING, NOTHING_MORE_YET, SEARCH_QUEUE_FULL, SEARCH_USER_QUEUE_FULL
+
+
+# Times a click is replayed after losing a race with another process.
+CAS_RETRIES = 8
+EXPIRED = "This search has expired. Run `/search` again."
 
 
 async def _guard(interaction: discord.Interaction, store, row_id: str):
@@ -24,9 +41,7 @@ async def _guard(interaction: discord.Interaction, store, row_id: str):
     """
     row = await store.load(row_id)
     if row is None:
-        await interaction.response.send_message(
-            "This search has expired. Run `/search` again.", ephemeral=True
-        )
+        await interaction.response.send_message(EXPIRED, ephemeral=True)
         return None
     if interaction.user.id != row["user_id"]:
         await interaction.response.send_message(
@@ -44,7 +59,10 @@ async def handle_next_click(interaction: discord.Interaction, row_id: str) -> No
         row = await _guard(interaction, store, row_id)
         if row is None:
             return
-        await _advance(interaction, store, searcher, row)
+        # What an attempt that lost a race leaves for the next: the pages it
+        # fetched, by (query, page), and the message as it last edited it.
+        carry = {}
+        await _replay(interaction, store, row, lambda row: _advance(interaction, store, searcher, row, carry))
 
 
 async def handle_back_click(interaction: discord.Interaction, row_id: str) -> None:
@@ -53,13 +71,28 @@ async def handle_back_click(interaction: discord.Interaction, row_id: str) -> No
         row = await _guard(interaction, store, row_id)
         if row is None:
             return
-        await _retreat(interaction, store, row)
+        await _replay(interaction, store, row, lambda row: _retreat(interaction, store, row))
+
+
+async def _replay(interaction, store, row, attempt) -> None:
+    """Run `attempt(row)` until its write lands, reloading the row after each lost race."""
+    for _ in range(CAS_RETRIES):
+        if await attempt(row):
+            return
+        row = await store.load(row["row_id"])
+        if row is None:
+            await interaction.followup.send(EXPIRED, ephemeral=True)
+            return
+    print(f"[pagination] row {row['row_id']} kept changing; gave up after {CAS_RETRIES} attempts")
+    await interaction.followup.send("This search is busy. Try again in a moment.", ephemeral=True)
 
 
-async def _advance(interaction, store, searcher, row) -> None:
+async def _advance(interaction, store, searcher, row, carry: dict) -> bool:
+    """Show the next page, searching for it if it isn't stored. Returns False if the write lost a race."""
     pages = json.loads(row["pages_json"])
     current = row["current_page"]
     last = row["last_page"]
+    message = carry.get("message", interaction.message)
 
     query_blob = row["query_json"]
     query = Query.from_json(query_blob, bot=interaction.client)
@@ -75,72 +108,261 @@ async def _advance(interaction, store, searcher, row) -> None:
             "This search references a channel or user the bot can no longer see. "
             "Run `/search` again.", ephemeral=True,
         )
-        return
+        return True
 
     if current != last:
         current += 1
 
+    new_refs = []
+    nothing_yet = False
     if str(current) not in pages and current != last:
-        in_prog = _build_in_progress_embed(interaction.message, current)
-        await interaction.message.edit(embed=in_prog, view=None)
-
-        sr = await fsearch(interaction, searcher, query)
-        if not sr.files:
+        key = (query_blob, current)
+        sr = carry.get(key)
+        if sr is None:
+            in_prog = _build_in_progress_embed(message, current)
+            message = carry["message"] = await message.edit(embed=in_prog, view=None)
+            try:
+                sr = carry[key] = await _admitted_search(interaction, searcher, query)
+            except AdmissionRejected as e:
+                # Put the page back as it was; the click changed nothing.
+                await _rerender(interaction, message, row["row_id"], pages, row["current_page"], last)
+                await interaction.followup.send(
+                    SEARCH_USER_QUEUE_FULL if e.reason == "user" else SEARCH_QUEUE_FULL, ephemeral=True
+                )
+                return True
+        if not sr.files and sr.partial:
+            # The search ran out of budget before finding anything; keep its
+            # progress so the next click continues from there.
+            current -= 1
+            query.channel_date_map = sr.channel_date_map
+            nothing_yet = True
+        elif not sr.files:
             current -= 1
             last = current
         else:
-            pages[str(current)] = sr.to_dict()
+            pages[str(current)] = _store_page(interaction.client, row["row_id"], sr, current)
+            more = remainder_pages(sr, searcher.search_result_limit, current) if sr.remainder else {}
+            pages.update(more)
+            new_refs = [f.message_id for f in sr.files] + [f.message_id for f in sr.remainder or []]
             if sr.channel_date_map:
                 query.channel_date_map = sr.channel_date_map
             else:
-                last = current
+                last = current + len(more)
 
-    await store.update(
+    if not await store.update(
         row["row_id"],
         pages_json=json.dumps(pages),
         current_page=current,
         last_page=last,
         query_json=query.to_json(),
-    )
-    await _rerender(interaction, row["row_id"], pages, current, last)
+        add_refs=new_refs,
+        expected_version=row["version"],
+    ):
+        return False
+    await _rerender(interaction, message, row["row_id"], pages, current, last)
+    if nothing_yet:
+        await interaction.followup.send(NOTHING_MORE_YET, ephemeral=True)
+    return True
 
 
-async def _retreat(interaction, store, row) -> None:
-    pages = json.loads(row["pages_json"])
+async def _admitted_search(interaction, searcher, query: Query) -> SearchResults:
+    """Run `fsearch` once the bot's admission control lets it, timing it per shard as `locate` does.
+
+    Raises:
+        AdmissionRejected: If the guild's or the user's queue is full
+    """
+    bot = interaction.client
+    shard_id = interaction.guild.shard_id if interaction.guild is not None else 0
+    scope_id = interaction.guild.id if interaction.guild is not None else interaction.channel_id
+    async with bot.admission.admit(scope_id, interaction.user.id):
+        start = time.perf_counter()
+        ok = False
+        try:
+            results = await fsearch(interaction, searcher, query)
+            ok = True
+            return results
+        finally:
+            bot.shard_stats.record(shard_id, time.perf_counter() - start, ok=ok)
+
+
+async def _retreat(interaction, store, row) -> bool:
+    """Show the previous page. Returns False if the write lost a race."""
     current = row["current_page"]
     last = row["last_page"]
 
     if current <= 1:
         # Already at the first page; nothing to do beyond a quiet ack.
-        return
+        return True
 
     current -= 1
-    await store.update(
+    if not await store.update(
         row["row_id"],
-        pages_json=json.dumps(pages),
+        pages_json=row["pages_json"],
         current_page=current,
         last_page=last,
         query_json=row["query_json"],
-    )
-    await _rerender(interaction, row["row_id"], pages, current, last)
+        expected_version=row["version"],
+    ):
+        return False
+    pages = json.loads(row["pages_json"])
+    await _rerender(interaction, interaction.message, row["row_id"], pages, current, last)
+    return True
 
 
-async def _rerender(interaction, row_id: str, pages: dict, current: int, last: int) -> None:
-    """Edit the message with a fresh embed + view for the current page.
+def remainder_pages(results: SearchResults, page_size: int, first: int) -> dict:
+    """The pages after page `first` that show a ranked search's `remainder`.
 
-    The view's component shape (which nav buttons are present) depends on
-    current/last, so we re-register it with the bot after the edit. discord.py's
-    view store keys by message_id, so this replaces the previous registration.
+    They're stored unrendered and rendered when first shown, since most are
+    never visited.
     """
-    from .file_view import FileView, build_page_embed  # lazy to avoid circular import
+    remainder = results.remainder or []
+    return {
+        str(first + 1 + i): SearchResults(files=remainder[start:start + page_size]).to_dict()
+        for i, start in enumerate(range(0, len(remainder), page_size))
+    }
+
+
+def _store_page(client, row_id: str, results: SearchResults, page: int) -> dict:
+    """Serialize a page along with its pre-rendered embed and file components."""
+    from .file_view import build_page_payload  # lazy to avoid circular import
 
-    page_results = SearchResults.from_dict(pages[str(current)])
-    embed = build_page_embed(interaction.message, page_results, current)
-    view = FileView(
-        page_results, row_id=row_id, current_page=current, last_page=last,
+    stored = results.to_dict()
+    stored["render"] = build_page_payload(
+        results,
+        row_id=row_id,
+        page=page,
+        name=client.user.name,
+        avatar_url=client.user.display_avatar.url,
     )
-    await interaction.message.edit(embed=embed, view=view)
-    interaction.client.add_view(view, message_id=interaction.message.id)
+    return stored
+
+
+async def _rerender(interaction, message, row_id: str, pages: dict, current: int, last: int) -> None:
+    """Edit `message` to show the current page from its cached payload.
+
+    Only the parts that differ from what the message already shows are sent.
+    Click routing doesn't depend on the page (see `ComponentRouter`), so
+    nothing is registered with the bot.
+    """
+    from .file_view import PayloadView, differs, render_components  # lazy to avoid circular import
+
+    page = pages[str(current)]
+    payload = page.get("render")
+    if payload is None:
+        # Pages stored before payloads were cached.
+        payload = _store_page(interaction.client, row_id, SearchResults.from_dict(page), current)["render"]
+
+    components = render_components(payload, row_id=row_id, current_page=current, last_page=last)
+    edits = {}
+    live_embed = message.embeds[0].to_dict() if message.embeds else None
+    if differs(payload["embed"], live_embed):
+        edits["embed"] = discord.Embed.from_dict(payload["embed"])
+    if differs(components, [row.to_dict() for row in message.components]):
+        edits["view"] = PayloadView(components)
+    if edits:
+        await message.edit(**edits)
+
+
+async def lookup_filename(interaction: discord.Interaction, row_id: str, value: str):
+    """Resolve a dropdown value (`channel,message,file` ids) to its filename via the store."""
+    row = await interaction.client.pagination_store.load(row_id)
+    if row is None:
+        return None
+    file_id = int(value.split(',')[2])
+    page = SearchResults.from_dict(json.loads(row["pages_json"])[str(row["current_page"])])
+    for file in page.files:
+        if file.objectId == file_id:
+            return file.filename
+    return None
+
+
+async def prune_deleted_messages(client, message_ids) -> None:
+    """Remove files from deleted messages from every active row that shows them.
+
+    Rows are found through the store's reverse index rather than a scan.
+    Pages left empty are dropped and the rest renumbered; pages that changed
+    are re-rendered, and the results message is edited only if the page it
+    currently shows changed. A row left with no pages is deleted, unless its
+    search can still find more: then it keeps its cursor behind an empty page.
+    """
+    store = client.pagination_store
+    deleted = set(message_ids)
+    for row in await store.rows_referencing(deleted):
+        async with await store.lock_for(row["row_id"]):
+            for _ in range(CAS_RETRIES):
+                if await _prune_row(client, store, row["row_id"], deleted):
+                    break
+    await store.drop_refs(deleted)
+
+
+async def _prune_row(client, store, row_id: str, deleted: set) -> bool:
+    """Prune one row. Returns False if another process changed it first."""
+    from .file_view import PayloadView, render_components  # lazy to avoid circular import
+
+    row = await store.load(row_id)
+    if row is None:
+        return True
+    old_pages = json.loads(row["pages_json"])
+    surviving = []
+    current, current_changed = row["current_page"], False
+    for number in sorted(old_pages, key=int):
+        page = old_pages[number]
+        results = SearchResults.from_dict(page)
+        kept = [f for f in results.files if f.message_id not in deleted]
+        changed = len(kept) != len(results.files) or int(number) != len(surviving) + 1
+        if int(number) == row["current_page"]:
+            current = max(len(surviving) + (1 if kept else 0), 1)
+            current_changed = changed
+        if not kept:
+            continue
+        if changed:
+            results.files = kept
+            page = _store_page(client, row["row_id"], results, len(surviving) + 1)
+        surviving.append(page)
+
+    if not surviving and row["last_page"] == -1:
+        # The search can still find more; keep its cursor behind an empty page.
+        empty = SearchResults(files=[], message=FILES_DELETED_KEEP_LOOKING)
+        surviving.append(_store_page(client, row["row_id"], empty, 1))
+        current, current_changed = 1, True
+    if not surviving:
+        if not await store.delete(row["row_id"], expected_version=row["version"]):
+            return False
+        if row["message_id"] is not None:
+            await _edit_results_message(
+                client, row, content="All files in this search were deleted.", embed=None, view=None,
+            )
+        return True
+
+    pages = {str(i): page for i, page in enumerate(surviving, start=1)}
+    last = row["last_page"] if row["last_page"] == -1 else len(surviving)
+    current = min(current, len(surviving))
+    if not await store.update(
+        row["row_id"],
+        pages_json=json.dumps(pages),
+        current_page=current,
+        last_page=last,
+        query_json=row["query_json"],
+        expected_version=row["version"],
+    ):
+        return False
+    if current_changed and row["message_id"] is not None:
+        payload = pages[str(current)].get("render") or \
+            _store_page(client, row["row_id"], SearchResults.from_dict(pages[str(current)]), current)["render"]
+        await _edit_results_message(
+            client, row,
+            embed=discord.Embed.from_dict(payload["embed"]),
+            view=PayloadView(render_components(payload, row_id=row["row_id"], current_page=current, last_page=last)),
+        )
+    return True
+
+
+async def _edit_results_message(client, row: dict, **edits) -> None:
+    channel = client.get_partial_messageable(row["channel_id"])
+    try:
+        await channel.get_partial_message(row["message_id"]).edit(**edits)
+    except (discord.NotFound, discord.Forbidden):
+        pass
 
 
 def _build_in_progress_embed(message: discord.Message, current_page: int) -> discord.Embed:
@@ -0,0 +1,80 @@
+"""Show a search's results on its "Searching..." message while it's still running.
+
+The searcher reports the files found so far as channels produce matches.
+`ProgressiveRender` shows the first batch straight away and then edits the
+message at most once per `interval`, always with the latest snapshot, so a
+search that finds matches all over the guild doesn't run into edit rate
+limits. Closing it waits for any edit in flight, so the final render, which
+adds the page buttons, is never overwritten by a late progressive one.
+"""
+import asyncio
+import os
+import time
+from typing import List, Optional
+
+import discord
+
+from ..discord_utils import send_or_edit
+from ..messages import STILL_SEARCHING
+from ..search.search_models import SearchResults
+from .file_embed import FileEmbed
+
+
+PROGRESS_EDIT_INTERVAL_SECONDS = float(os.environ.get("HAYSTACK_PROGRESS_EDIT_SECONDS", 2.0))
+
+
+class ProgressiveRender:
+
+    def __init__(self, message, name: str, avatar_url: str, interval: float = PROGRESS_EDIT_INTERVAL_SECONDS):
+        """
+        Create a ProgressiveRender.
+
+        Args:
+            message: The "Searching..." message to edit
+            name: The bot's name, for the embed footer
+            avatar_url: The bot's avatar, for the embed footer
+            interval: Minimum seconds between edits
+        """
+        self.message = message
+        self.name = name
+        self.avatar_url = avatar_url
+        self.interval = interval
+        self.edits = 0
+        self._latest: Optional[List] = None
+        self._last_edit = float("-inf")
+        self._task: Optional[asyncio.Task] = None
+        self._closed = asyncio.Event()
+
+    def update(self, files: List) -> None:
+        """Show `files` on the next edit. Called by the searcher; never blocks."""
+        if self._closed.is_set() or not files:
+            return
+        self._latest = files
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while self._latest is not None and not self._closed.is_set():
+            wait = self._last_edit + self.interval - time.monotonic()
+            if wait > 0:
+                try:
+                    await asyncio.wait_for(self._closed.wait(), timeout=wait)
+                    break
+                except asyncio.TimeoutError:
+                    pass
+            files, self._latest = self._latest, None
+            embed = FileEmbed(SearchResults(files=files), name=self.name, avatar_url=self.avatar_url)
+            embed.description = STILL_SEARCHING
+            try:
+                await send_or_edit(send_source=None, edit_source=self.message, send=False, embed=embed)
+                self.edits += 1
+            except discord.HTTPException as e:
+                print(f"[search] progressive render failed: {e!r}")
+            self._last_edit = time.monotonic()
+        self._task = None
+
+    async def close(self) -> None:
+        """Stop editing, waiting for an edit that's already being sent."""
+        self._closed.set()
+        if self._task is not None:
+            await self._task
@@ -0,0 +1,24 @@
+"""Shared test setup.
+
+bot_secrets.py asserts its config exists at import time; give it dummy values.
+Import the real discord.py up front when it's installed so tests that need
+more than test_query_roundtrip's minimal stubs get the real thing regardless
+of collection order.
+"""
+import os
+
+for _name in (
+    "ERROR_CHANNEL_ID",
+    "SEARCH_METRICS_CHANNEL_ID",
+    "EXPORT_METRICS_CHANNEL_ID",
+    "DELETE_METRICS_CHANNEL_ID",
+    "SERVER_COUNT_CHANNEL_ID",
+):
+    os.environ.setdefault(_name, "1")
+os.environ.setdefault("DB_NAME", "production")
+os.environ.setdefault("DISCORD_TOKEN", "x")
+
+try:
+    import discord  # noqa: F401
+except ImportError:
+    pass
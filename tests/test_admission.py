@@ -0,0 +1,130 @@
+"""Tests for search admission control and fair queuing."""
+import asyncio
+
+import pytest
+
+import python.views.pagination_callbacks as pagination_callbacks
+from benchmarks.clicks import FakeClickClient, FakeClickInteraction, seed_row, stub_fsearch
+from python.messages import SEARCH_USER_QUEUE_FULL
+from python.persistence.pagination_store import PaginationStore
+from python.search.admission import AdmissionController, AdmissionRejected
+
+
+async def _search(controller, order, guild_id, user_id, release):
+    async with controller.admit(guild_id, user_id):
+        order.append(guild_id)
+        await release.wait()
+
+
+async def _drain(release, tasks):
+    for _ in range(len(tasks)):
+        release.set()
+        await asyncio.sleep(0)
+        release.clear()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def test_a_busy_guild_does_not_starve_a_quiet_one():
+    async def go():
+        controller = AdmissionController(max_running=1, per_guild=1, per_user=10, guild_queue=20, user_queue=20)
+        order, release = [], asyncio.Event()
+        tasks = [asyncio.create_task(_search(controller, order, 1, 100 + i, release)) for i in range(6)]
+        await asyncio.sleep(0)
+        tasks += [asyncio.create_task(_search(controller, order, 2, 200 + i, release)) for i in range(2)]
+        await asyncio.sleep(0)
+        while not all(t.done() for t in tasks):
+            release.set()
+            await asyncio.sleep(0)
+            release.clear()
+            await asyncio.sleep(0)
+        return order, controller
+
+    order, controller = asyncio.run(go())
+    assert sorted(order) == [1] * 6 + [2] * 2
+    # Guild 2's searches run within the first few, not after all of guild 1's.
+    assert order.index(2) <= 2 and order[::-1].index(2) >= 3
+    assert controller.running == controller.queued == 0
+    assert controller.guilds == {}
+
+
+def test_full_queues_reject_at_once():
+    async def go():
+        controller = AdmissionController(max_running=1, per_guild=1, per_user=1, guild_queue=2, user_queue=1)
+        order, release = [], asyncio.Event()
+        tasks = [asyncio.create_task(_search(controller, order, 1, 1, release))]
+        tasks.append(asyncio.create_task(_search(controller, order, 1, 1, release)))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as user:
+            await _search(controller, order, 1, 1, release)
+        tasks.append(asyncio.create_task(_search(controller, order, 1, 2, release)))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as guild:
+            await _search(controller, order, 1, 3, release)
+        snapshot = controller.snapshot()
+        await _drain(release, tasks)
+        return user.value.reason, guild.value.reason, snapshot
+
+    user, guild, snapshot = asyncio.run(go())
+    assert (user, guild) == ("user", "guild")
+    assert snapshot["running"] == 1 and snapshot["queued"] == 2
+    assert snapshot["rejected"] == {"guild": 1, "user": 1, "total": 0}
+    assert snapshot["deepest_queues"] == {1: 2}
+
+
+def test_per_user_cap_lets_other_users_through():
+    async def go():
+        controller = AdmissionController(max_running=4, per_guild=4, per_user=1)
+        order, release = [], asyncio.Event()
+        tasks = [asyncio.create_task(_search(controller, order, 1, user, release)) for user in (1, 1, 2)]
+        await asyncio.sleep(0)
+        running = controller.running
+        await _drain(release, tasks)
+        return running
+
+    assert asyncio.run(go()) == 2
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def go():
+        controller = AdmissionController(max_running=1, per_guild=1, per_user=1)
+        order, release = [], asyncio.Event()
+        first = asyncio.create_task(_search(controller, order, 1, 1, release))
+        waiting = asyncio.create_task(_search(controller, order, 2, 2, release))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        await asyncio.sleep(0)
+        queued = controller.queued
+        await _drain(release, [first])
+        return queued, order, controller
+
+    queued, order, controller = asyncio.run(go())
+    assert queued == 0 and order == [1]
+    assert controller.running == 0 and controller.guilds == {}
+
+
+def test_next_clicks_are_admitted_like_searches(tmp_path, monkeypatch):
+    monkeypatch.setattr(pagination_callbacks, "fsearch", stub_fsearch())
+
+    async def go():
+        store = PaginationStore(str(tmp_path / "pagination.sqlite3"))
+        await store.init()
+        controller = AdmissionController(max_running=4, per_guild=4, per_user=1, guild_queue=4, user_queue=0)
+        client = FakeClickClient(store, admission=controller)
+        try:
+            row_id, message = await seed_row(store, client, message_id=10)
+            # The user already has a search running, and may queue none.
+            async with controller.admit(1, 1):
+                click = FakeClickInteraction(client, message, 1)
+                await pagination_callbacks.handle_next_click(click, row_id)
+            assert click.followup.sent == [SEARCH_USER_QUEUE_FULL]
+            row = await store.load(row_id)
+            assert (row["current_page"], row["version"]) == (1, 0)
+            assert not message.embeds[0].title.startswith("Gathering")
+            # Once the other search is done, the click goes through and is counted.
+            await pagination_callbacks.handle_next_click(FakeClickInteraction(client, message, 1), row_id)
+            assert (await store.load(row_id))["current_page"] == 2
+            assert controller.admitted == 2 and controller.rejected["user"] == 1
+            assert client.shard_stats.take()[0].searches == 1
+        finally:
+            await store.close()
+    asyncio.run(go())
@@ -0,0 +1,151 @@
+"""Tests for the per-guild catalog of searchable channels."""
+import asyncio
+from types import SimpleNamespace
+
+import discord
+import pytest
+
+from benchmarks.synthetic import FakeInteraction, FakeTextChannel, GuildSpec, build_guild
+from python.bot_commands import fsearch
+from python.models.query import Query
+from python.search.channel_catalog import ChannelCatalog
+from python.search.discord_searcher import DiscordSearcher
+
+
+def _guild():
+    return build_guild(GuildSpec(text_channels=4, forum_channels=2, threads_per_forum=2,
+                                 archived_threads_per_forum=3, messages_per_channel=10, unreadable_ratio=0.0))
+
+
+def test_archived_threads_are_listed_once():
+    guild = _guild()
+    catalog = ChannelCatalog()
+
+    async def go():
+        first = await catalog.searchable(guild)
+        second = await catalog.searchable(guild)
+        return first, second
+
+    first, second = asyncio.run(go())
+    assert {c.id for c in first} == {c.id for c in guild.searchable_channels}
+    assert len(first) == 4 + 2 * (2 + 3)
+    assert second is first
+    assert [forum.requests for forum in guild.forums] == [1, 1]
+
+
+def test_permissions_are_resolved_until_something_changes():
+    guild = _guild()
+    catalog = ChannelCatalog()
+    hidden = guild.text_channels[0]
+
+    async def go():
+        await catalog.searchable(guild)
+        hidden.readable = False
+        stale = await catalog.searchable(guild)
+        catalog.channel_updated(hidden)
+        fresh = await catalog.searchable(guild)
+        hidden.readable = True
+        catalog.permissions_changed(guild.id)
+        return stale, fresh, await catalog.searchable(guild)
+
+    stale, fresh, restored = asyncio.run(go())
+    assert hidden in stale
+    assert hidden not in fresh
+    assert hidden in restored
+
+
+def test_deleting_a_forum_drops_its_threads():
+    guild = _guild()
+    catalog = ChannelCatalog()
+    forum = guild.forums[0]
+
+    async def go():
+        await catalog.searchable(guild)
+        catalog.channel_deleted(forum)
+        catalog.thread_deleted(guild.id, guild.text_channels[1].id)
+        return await catalog.searchable(guild)
+
+    remaining = {c.id for c in asyncio.run(go())}
+    assert not remaining & {t.id for t in [*forum.threads, *forum.archived]}
+    assert guild.text_channels[1].id not in remaining
+    assert len(remaining) == 3 + 5
+
+
+def test_new_session_keeps_listed_archived_threads():
+    guild = _guild()
+    catalog = ChannelCatalog()
+
+    async def go():
+        await catalog.searchable(guild)
+        # A new gateway session hands out new guild objects.
+        rebuilt = build_guild(GuildSpec(text_channels=4, forum_channels=2, threads_per_forum=2,
+                                        archived_threads_per_forum=3, messages_per_channel=10,
+                                        unreadable_ratio=0.0))
+        rebuilt.id = guild.id
+        rebuilt.text_channels.append(FakeTextChannel(1, "new", rebuilt))
+        return rebuilt, await catalog.searchable(rebuilt)
+
+    rebuilt, channels = asyncio.run(go())
+    assert [forum.requests for forum in rebuilt.forums] == [0, 0]
+    assert 1 in {c.id for c in channels}
+    assert len(channels) == 5 + 2 * 2 + 2 * 3
+
+
+def test_first_search_waits_only_briefly_for_archived_threads():
+    guild = _guild()
+    catalog = ChannelCatalog(archived_wait=0.05)
+    forum = guild.forums[1]
+    list_archived = forum.archived_threads
+
+    async def slow_archived_threads(limit=100):
+        await asyncio.sleep(0.3)
+        async for thread in list_archived(limit):
+            yield thread
+    forum.archived_threads = slow_archived_threads
+
+    async def go():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        first = await catalog.searchable(guild)
+        waited = loop.time() - started
+        await catalog.guilds[guild.id].loading
+        return first, waited, await catalog.searchable(guild)
+
+    first, waited, later = asyncio.run(go())
+    assert waited < 0.25
+    # The quick forum's archived threads are in; the slow one's come later.
+    assert len(first) == 4 + 2 * 2 + 3
+    assert {c.id for c in later} == {c.id for c in guild.searchable_channels}
+
+
+def _refuse(channel):
+    async def history(*args, **kwargs):
+        raise discord.Forbidden(SimpleNamespace(status=403, reason="Forbidden"), "Missing Access")
+        yield
+    channel.history = history
+
+
+def test_a_channel_that_refuses_its_history_is_skipped_and_left_out():
+    guild = _guild()
+    searcher = DiscordSearcher()
+    interaction = FakeInteraction(guild, guild.text_channels[0], guild.members[0])
+    refused = guild.text_channels[1]
+    _refuse(refused)
+
+    async def go():
+        return await fsearch(interaction, searcher, Query()), await searcher.catalog.searchable(guild)
+
+    found, searchable = asyncio.run(go())
+    assert found.files and refused.id not in found.channel_date_map
+    assert refused.id not in {f.channel_id for f in found.files}
+    assert refused not in searchable and len(searchable) == len(guild.searchable_channels) - 1
+
+
+def test_a_search_fails_only_if_every_channel_does():
+    guild = _guild()
+    for channel in guild.searchable_channels:
+        _refuse(channel)
+
+    with pytest.raises(discord.Forbidden):
+        asyncio.run(DiscordSearcher().search(onii_chans=guild.searchable_channels, bot_user=guild.me,
+                                             query=Query(), readable=True))
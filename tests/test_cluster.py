@@ -0,0 +1,93 @@
+"""Tests for cluster sharding and health aggregation."""
+import asyncio
+import types
+
+import python.views.pagination_callbacks as pagination_callbacks
+from benchmarks.clicks import FakeClickClient, FakeClickInteraction, seed_row, stub_fsearch
+from python.cluster import (
+    CLUSTER_ID_ENV, SHARD_COUNT_ENV, SHARD_IDS_ENV, STATE_DIR_ENV,
+    ClusterConfig, ShardStats, _write_state, shard_slices, shard_snapshot, total_guilds,
+)
+from python.persistence.pagination_store import PaginationStore
+
+
+def test_shard_slices_cover_every_shard_once():
+    slices = shard_slices(10, 3)
+    assert slices == [[0, 1, 2, 3], [4, 5, 6], [7, 8, 9]]
+    assert shard_slices(2, 4) == [[0], [1]]
+
+
+def test_config_roundtrips_through_env(monkeypatch, tmp_path):
+    config = ClusterConfig(cluster_id=2, shard_ids=[4, 5], shard_count=8, state_dir=str(tmp_path), cluster_count=4)
+    for key, value in config.to_env().items():
+        monkeypatch.setenv(key, value)
+    assert ClusterConfig.from_env() == config
+    assert config.db_path("/data/pagination.sqlite3") == "/data/pagination.cluster2.sqlite3"
+
+
+def test_scoring_workers_are_split_across_clusters(monkeypatch):
+    config = ClusterConfig(cluster_id=0, shard_ids=[0], shard_count=4, cluster_count=4)
+    assert config.scoring_workers(8) == 2
+    assert config.scoring_workers(2) == 1
+    monkeypatch.setattr("os.cpu_count", lambda: 16)
+    assert config.scoring_workers(None) == 4
+
+
+def test_standalone_has_no_config(monkeypatch):
+    for key in (CLUSTER_ID_ENV, SHARD_COUNT_ENV, SHARD_IDS_ENV, STATE_DIR_ENV):
+        monkeypatch.delenv(key, raising=False)
+    assert ClusterConfig.from_env() is None
+
+
+def _bot(guild_shards, shard_ids):
+    shards = {i: types.SimpleNamespace(latency=0.05, is_closed=lambda: False) for i in shard_ids}
+    return types.SimpleNamespace(
+        guilds=[types.SimpleNamespace(shard_id=s) for s in guild_shards],
+        shards=shards,
+        get_shard=shards.get,
+    )
+
+
+def test_snapshot_reports_each_shard_and_resets_counters():
+    stats = ShardStats()
+    stats.record(1, 0.2)
+    stats.record(1, 0.4, ok=False)
+    snapshot = shard_snapshot(_bot([0, 1, 1], [0, 1]), stats, interval=60)
+    assert [s["guilds"] for s in snapshot] == [1, 2]
+    assert snapshot[1]["searches_per_min"] == 2
+    assert snapshot[1]["mean_search_ms"] == 300
+    assert snapshot[1]["errors"] == 1
+    assert snapshot[0]["latency_ms"] == 50
+    assert stats.take() == {}
+
+
+def test_total_guilds_adds_other_clusters(tmp_path):
+    config = ClusterConfig(cluster_id=0, shard_ids=[0], shard_count=2, state_dir=str(tmp_path))
+    other = ClusterConfig(cluster_id=1, shard_ids=[1], shard_count=2, state_dir=str(tmp_path))
+    _write_state(other.state_path, {"cluster_id": 1, "shards": [{"guilds": 7}]})
+    _write_state(config.state_path, {"cluster_id": 0, "shards": [{"guilds": 1000}]})
+    assert total_guilds(_bot([0, 0], [0]), config) == 9
+
+
+def test_results_sent_to_a_dm_are_clickable_from_cluster_zero(tmp_path, monkeypatch):
+    monkeypatch.setattr(pagination_callbacks, "fsearch", stub_fsearch())
+    pagination, facets = str(tmp_path / "pagination.sqlite3"), str(tmp_path / "facets.sqlite3")
+    searched_in = ClusterConfig(cluster_id=1, shard_ids=[1], shard_count=2, state_dir=str(tmp_path))
+    dm_cluster = ClusterConfig(cluster_id=0, shard_ids=[0], shard_count=2, state_dir=str(tmp_path))
+    assert searched_in.database_paths(pagination, facets)[1] != dm_cluster.database_paths(pagination, facets)[1]
+
+    async def go():
+        guild_store = PaginationStore(searched_in.database_paths(pagination, facets)[0])
+        dm_store = PaginationStore(dm_cluster.database_paths(pagination, facets)[0])
+        await guild_store.init()
+        await dm_store.init()
+        try:
+            row_id, message = await seed_row(guild_store, FakeClickClient(guild_store), message_id=10)
+            click = FakeClickInteraction(FakeClickClient(dm_store), message, 1)
+            await pagination_callbacks.handle_next_click(click, row_id)
+            assert click.response.sent == [] and click.followup.sent == []
+            assert (await guild_store.load(row_id))["current_page"] == 2
+        finally:
+            await guild_store.close()
+            await dm_store.close()
+    asyncio.run(go())
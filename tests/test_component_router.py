@@ -0,0 +1,74 @@
+"""Tests for routing results-message clicks by custom_id."""
+import asyncio
+from types import SimpleNamespace
+
+import discord
+
+import python.views.file_dropdown as file_dropdown
+import python.views.page_back_button as page_back_button
+import python.views.page_next_button as page_next_button
+from python.persistence.pagination_store import PaginationStore
+from python.views.component_router import ComponentRouter
+from python.views.file_dropdown import FileDropDown
+from python.views.page_back_button import PageBackButton
+from python.views.page_next_button import PageNextButton
+
+
+def _router():
+    return ComponentRouter([PageNextButton, PageBackButton, FileDropDown])
+
+
+def _click(custom_id, **data):
+    return SimpleNamespace(type=discord.InteractionType.component, data={"custom_id": custom_id, **data})
+
+
+def test_custom_ids_round_trip_through_their_templates():
+    row_id = PaginationStore.new_row_id()
+    router = _router()
+    for item in (PageNextButton(row_id=row_id), PageBackButton(row_id=row_id),
+                 FileDropDown(file_dropdown.SearchResults(files=[]), row_id=row_id)):
+        cls, match = router.match(item.custom_id)
+        assert cls is type(item)
+        assert match["row_id"] == row_id
+    assert router.match("hfs:next:") is None
+    assert router.match("hfs:page:" + row_id) is None
+    assert router.match("someone-elses-button") is None
+
+
+def test_dispatch_calls_the_handler_with_the_row_id(monkeypatch):
+    calls = []
+
+    def handle(name):
+        async def handler(interaction, row_id):
+            calls.append((name, row_id))
+        return handler
+
+    monkeypatch.setattr(page_next_button, "handle_next_click", handle("next"))
+    monkeypatch.setattr(page_back_button, "handle_back_click", handle("back"))
+
+    async def run():
+        router = _router()
+        routed = [
+            await router.dispatch(_click("hfs:next:abc123")),
+            await router.dispatch(_click("hfs:back:def456")),
+            await router.dispatch(_click("unrelated")),
+            await router.dispatch(SimpleNamespace(type=discord.InteractionType.application_command, data={})),
+        ]
+        return routed, router.routed
+
+    routed, count = asyncio.run(run())
+    assert routed == [True, True, False, False]
+    assert count == 2
+    assert calls == [("next", "abc123"), ("back", "def456")]
+
+
+def test_dropdown_is_rebuilt_with_the_selected_value(monkeypatch):
+    seen = []
+
+    async def callback(self, interaction):
+        seen.append((self.row_id, self.values))
+
+    monkeypatch.setattr(FileDropDown, "callback", callback)
+    routed = asyncio.run(_router().dispatch(_click("hfs:dd:abc123", values=["1,2,3"])))
+    assert routed
+    assert seen == [("abc123", ["1,2,3"])]
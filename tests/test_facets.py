@@ -0,0 +1,130 @@
+"""Tests for facet counters: incremental updates and reconcile."""
+import asyncio
+import sqlite3
+
+from benchmarks.synthetic import GuildSpec, build_guild
+from python.persistence.facet_store import DAY_MS, FacetStore, day_of
+from python.search.budget import SearchBudget
+from python.search.channel_catalog import ChannelCatalog
+from python.search.facets import FacetIndexer, attachment_facets
+
+
+def _run(tmp_path, body):
+    async def go():
+        store = FacetStore(str(tmp_path / "facets.sqlite3"))
+        await store.init()
+        try:
+            return await body(FacetIndexer(store, page_delay=0))
+        finally:
+            await store.close()
+    return asyncio.run(go())
+
+
+def test_attachment_facets():
+    assert attachment_facets("Photo.PNG", None) == ("image", "png")
+    assert attachment_facets("song.mp3", "audio/mpeg") == ("audio", "mp3")
+    assert attachment_facets("backup.rar", None) == ("archive", "rar")
+    assert attachment_facets("paper.pdf", "application/pdf") == ("other", "pdf")
+
+
+def test_counts_are_added_windowed_and_removed(tmp_path):
+    async def body(indexer):
+        store = indexer.store
+        base = 100 * DAY_MS
+        await store.add_message(message_id=1, guild_id=9, channel_id=5, author_id=7, created_at=base,
+                                attachments=[("image", "png"), ("other", "pdf")])
+        await store.add_message(message_id=2, guild_id=9, channel_id=6, author_id=8, created_at=base + 3 * DAY_MS,
+                                attachments=[("image", "png")])
+        # Counting the same message twice is a no-op.
+        assert not await store.add_message(message_id=2, guild_id=9, channel_id=6, author_id=8,
+                                           created_at=base + 3 * DAY_MS, attachments=[("image", "png")])
+        facets = await store.counts(9)
+        assert facets["category"] == {"image": 2, "other": 1}
+        assert facets["channel"] == {"5": 2, "6": 1}
+        assert facets["uploader"] == {"7": 2, "8": 1}
+        assert (await store.counts(9, first_day=day_of(base) + 1))["extension"] == {"png": 1}
+        assert await store.remove_messages([1, 999]) == 1
+        assert (await store.counts(9))["extension"] == {"png": 1}
+        assert (await store.counts(10))["category"] == {}
+    _run(tmp_path, body)
+
+
+def test_forgetting_a_large_channel_clears_its_counters(tmp_path):
+    async def body(indexer):
+        store = indexer.store
+        for i in range(1200):
+            await store.add_message(message_id=i, guild_id=9, channel_id=5, author_id=i % 3, created_at=i * DAY_MS,
+                                    attachments=[("image", "png")], commit=False)
+        await store.add_message(message_id=50000, guild_id=9, channel_id=6, author_id=1, created_at=0,
+                                attachments=[("other", "pdf")])
+        # More ids than SQLite allows variables in one statement (lowered here; builds differ).
+        await store._db._execute(store._db._conn.setlimit, sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+        assert await store.remove_messages(range(1100, 5000)) == 100
+        await store.forget_channel(5)
+        assert (await store.counts(9))["channel"] == {"6": 1}
+        async with store._db.execute("SELECT COUNT(*) FROM facet_counts") as cur:
+            assert (await cur.fetchone())[0] == 4
+    _run(tmp_path, body)
+
+
+def test_reconcile_backfills_then_catches_missed_deletes(tmp_path):
+    guild = build_guild(GuildSpec(text_channels=2, forum_channels=0, messages_per_channel=200, days=30,
+                                  unreadable_ratio=0.0))
+    channel = guild.text_channels[0]
+    expected = sum(len(m.attachments) for m in channel.messages)
+
+    async def body(indexer):
+        added = await indexer.reconcile_channel(channel, guild.id)
+        assert added == sum(1 for m in channel.messages if m.attachments)
+        assert sum((await indexer.store.counts(guild.id))["category"].values()) == expected
+        # Nothing changed: reconciling again is a no-op.
+        assert await indexer.reconcile_channel(channel, guild.id) == 0
+        # A message with files deleted while offline is uncounted by the next reconcile.
+        gone = next(m for m in channel.messages if m.attachments)
+        channel.messages.remove(gone)
+        assert await indexer.reconcile_channel(channel, guild.id) == 1
+        counts = await indexer.store.counts(guild.id)
+        assert sum(counts["category"].values()) == expected - len(gone.attachments)
+    _run(tmp_path, body)
+
+
+def test_backfill_stops_at_its_budget_and_resumes_where_it_stopped(tmp_path):
+    guild = build_guild(GuildSpec(text_channels=1, forum_channels=0, messages_per_channel=600, days=30,
+                                  unreadable_ratio=0.0))
+    channel = guild.text_channels[0]
+    expected = sum(len(m.attachments) for m in channel.messages)
+
+    async def body(indexer):
+        passes = 0
+        while True:
+            passes += 1
+            budget = SearchBudget(None, None, 2)
+            await indexer.reconcile_channel(channel, guild.id, budget)
+            assert budget.requests <= 2
+            if (await indexer.store.watermark(channel.id))[1]:
+                break
+        assert passes > 1
+        # Each pass picks up where the last one stopped rather than starting over.
+        assert channel.requests <= 600 // 100 + passes
+        assert sum((await indexer.store.counts(guild.id))["category"].values()) == expected
+    _run(tmp_path, body)
+
+
+def test_reconcile_guild_reads_catalogued_channels_furthest_behind_first(tmp_path):
+    guild = build_guild(GuildSpec(text_channels=3, forum_channels=1, threads_per_forum=2, messages_per_channel=100,
+                                  days=30, unreadable_ratio=0.0))
+
+    async def body(indexer):
+        channels = await ChannelCatalog().searchable(guild)
+        budget = SearchBudget(None, None, 2)
+        await indexer.reconcile_guild(guild, channels, budget)
+        first = await indexer.store.watermarks(guild.id)
+        assert budget.requests == 2 and len(first) < len(channels)
+        # The next pass goes to channels that haven't been reconciled yet.
+        await indexer.reconcile_guild(guild, channels, SearchBudget(None, None, 2))
+        second = await indexer.store.watermarks(guild.id)
+        assert len(second) > len(first)
+        assert all(second[c] == mark for c, mark in first.items() if mark[1])
+        await indexer.reconcile_guild(guild, channels, SearchBudget(None, None, None))
+        assert set(await indexer.store.watermarks(guild.id)) == {c.id for c in channels}
+    _run(tmp_path, body)
@@ -0,0 +1,67 @@
+"""Tests for the local index and the searcher's query plans."""
+import asyncio
+
+from benchmarks.synthetic import GuildSpec, build_guild
+from python.models.query import Query
+from python.search.discord_searcher import DiscordSearcher
+from python.search.local_index import MAX_SNOWFLAKE, ChannelIndex, Coverage, Segment
+
+
+def test_coverage_merges_adjacent_and_overlapping_intervals():
+    coverage = Coverage()
+    coverage.add(10, 20)
+    coverage.add(30, 40)
+    coverage.add(21, 25)
+    coverage.add(35, 50)
+    assert coverage.intervals == [[10, 25], [30, 50]]
+    coverage.add(26, 29)
+    assert coverage.intervals == [[10, 50]]
+    assert coverage.top() == 50
+
+
+def test_plan_splits_range_newest_first():
+    coverage = Coverage()
+    coverage.add(10, 20)
+    coverage.add(30, 40)
+    assert coverage.plan(0, 100) == [
+        Segment(41, 100, False), Segment(30, 40, True), Segment(21, 29, False),
+        Segment(10, 20, True), Segment(0, 9, False),
+    ]
+    assert coverage.plan(12, 35) == [Segment(30, 35, True), Segment(21, 29, False), Segment(12, 20, True)]
+    # A live head needs no crawl above the newest interval.
+    assert coverage.plan(25, MAX_SNOWFLAKE, open_head=True) == [
+        Segment(30, MAX_SNOWFLAKE, True), Segment(25, 29, False),
+    ]
+    assert Coverage().plan(0, 5) == [Segment(0, 5, False)]
+
+
+def test_channel_index_reads_newest_first():
+    index = ChannelIndex()
+    assert index.record(5, ["a"]) == 1
+    assert index.record(3, ["b", "c"]) == 2
+    assert index.record(9, []) == 0
+    assert index.record(7, ["d"]) == 1
+    assert [m for m, _ in index.read(3, 6)] == [5, 3]
+    assert index.forget(5) == 1
+    assert [m for m, _ in index.read(0, 100)] == [7, 3]
+
+
+def test_repeated_searches_stop_crawling():
+    guild = build_guild(GuildSpec(messages_per_channel=300))
+    channels = guild.searchable_channels
+
+    async def go():
+        searcher = DiscordSearcher()
+        searcher.local_index.connected()
+        results = []
+        for _ in range(3):
+            for channel in channels:
+                channel.reset_counters()
+            result = await searcher.search(onii_chans=channels, bot_user=guild.me, query=Query())
+            results.append(([f.objectId for f in result.files], sum(c.requests for c in channels)))
+        return results
+
+    (first, crawled), (second, warm), (third, warmer) = asyncio.run(go())
+    assert crawled > 0
+    assert warm == warmer == 0
+    assert set(second) == set(first) == set(third)
@@ -0,0 +1,35 @@
+"""Tests for the event-loop lag watchdog."""
+import asyncio
+import time
+
+from python.diagnostics.loop_watchdog import BUCKETS_MS, LoopWatchdog
+
+
+def _block_the_loop(seconds):
+    time.sleep(seconds)
+
+
+def test_long_stalls_are_attributed_to_the_blocking_frame(capsys):
+    async def go():
+        watchdog = LoopWatchdog(threshold=0.05, interval=0.01)
+        watchdog.start()
+        await asyncio.sleep(0.05)
+        _block_the_loop(0.2)
+        await asyncio.sleep(0.05)
+        watchdog.stop()
+        return watchdog
+
+    watchdog = asyncio.run(go())
+    (offender,) = watchdog.worst_offenders()
+    assert "in _block_the_loop" in offender.where
+    assert offender.stalls == 1
+    assert offender.worst_ms >= 150
+    assert "blocked for" in capsys.readouterr().out
+    assert "_block_the_loop" in watchdog.report()
+
+
+def test_histogram_buckets():
+    watchdog = LoopWatchdog()
+    assert watchdog._bucket(0.5) == 0
+    assert watchdog._bucket(BUCKETS_MS[-1]) == len(BUCKETS_MS) - 1
+    assert watchdog._bucket(10_000) == len(BUCKETS_MS)
@@ -0,0 +1,96 @@
+"""Tests for the memory report of the bot's long-lived structures."""
+import asyncio
+import sys
+from types import SimpleNamespace
+
+import discord
+
+import python.diagnostics.memory_report as memory_report
+from python.diagnostics.memory_report import MemoryMonitor, deep_sizeof, estimate_bytes
+from python.persistence.pagination_store import PaginationStore
+from python.search.discord_searcher import DiscordSearcher
+from python.search.search_models import SearchResults
+
+
+def test_deep_sizeof_follows_references_but_not_shared_objects():
+    payload = "x" * 10_000
+    node = {"payload": payload, "client": discord.Client(intents=discord.Intents.none())}
+    node["self"] = node
+    size = deep_sizeof(node)
+    assert sys.getsizeof(payload) < size < sys.getsizeof(payload) + 2_000
+    # A payload already counted elsewhere isn't counted twice.
+    assert deep_sizeof([payload, payload]) < sys.getsizeof(payload) + 200
+
+
+def test_estimate_scales_a_sample_to_the_whole_container():
+    container = {n: f"{n:x}" * 100 for n in range(10_000)}
+    exact = sys.getsizeof(container, 0) + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in container.items())
+    assert abs(estimate_bytes(container) - exact) / exact < 0.05
+
+
+def test_nested_containers_are_sampled_too(monkeypatch):
+    channels = {c: SimpleNamespace(files={m: [f"{c}:{m}" * 20] for m in range(2_000)}) for c in range(100)}
+    exact = sys.getsizeof(channels, 0) + sum(
+        sys.getsizeof(c) + sys.getsizeof(index, 0) + sys.getsizeof(vars(index), 0) + sys.getsizeof("files")
+        + sys.getsizeof(index.files, 0) + sum(sys.getsizeof(m) + sys.getsizeof(f) + sys.getsizeof(f[0])
+                                              for m, f in index.files.items())
+        for c, index in channels.items()
+    )
+    walked = 0
+    walk = memory_report.deep_sizeof
+
+    def counting(*args):
+        nonlocal walked
+        walked += 1
+        return walk(*args)
+    monkeypatch.setattr(memory_report, "deep_sizeof", counting)
+    estimate = estimate_bytes(channels)
+    assert abs(estimate - exact) / exact < 0.1
+    # 200k messages, but only a sample of a sample is walked.
+    assert walked < 50_000
+
+
+def test_measure_counts_each_structure_and_flags_budgets(tmp_path, capsys):
+    async def go():
+        searcher = DiscordSearcher()
+        searcher.banned_file_ids.update(range(1000))
+        searcher.result_cache._entries["key"] = (0.0, SearchResults(files=[]))
+        store = PaginationStore(str(tmp_path / "pagination.sqlite3"))
+        for n in range(5):
+            await store.lock_for(f"row{n}")
+        bot = SimpleNamespace(search_client=searcher, pagination_store=store)
+        monitor = MemoryMonitor(bot, interval=0.01, budgets={"banned_file_ids": 1024})
+        monitor.start()
+        await asyncio.sleep(0.05)
+        monitor.stop()
+        return monitor
+
+    monitor = asyncio.run(go())
+    gauges = {g.name: g for g in monitor.gauges}
+    # The bot has no discord.py connection state, so those structures are skipped.
+    assert "message_cache" not in gauges
+    assert gauges["banned_file_ids"].objects == 1000
+    assert gauges["banned_file_ids"].over_budget
+    assert gauges["pagination_locks"].objects == 5
+    assert gauges["result_cache"].objects == 1
+    assert monitor.snapshot()["structures"]["banned_file_ids"]["objects"] == 1000
+    out = capsys.readouterr().out
+    assert "[memory] " in out and "banned_file_ids is over budget" in out
+    assert "OVER" in asyncio.run(monitor.report())
+
+
+def _leak(store):
+    store.extend(bytearray(1024) for _ in range(2000))
+
+
+def test_trace_diff_shows_the_allocating_line():
+    monitor = MemoryMonitor(SimpleNamespace(), interval=None)
+    assert monitor.trace_diff().startswith("Not tracing")
+    leaked = []
+    monitor.start_tracing()
+    try:
+        _leak(leaked)
+        diff = monitor.trace_diff()
+    finally:
+        monitor.stop_tracing()
+    assert "test_memory_report.py" in diff.splitlines()[1]
@@ -0,0 +1,93 @@
+"""Tests for the mock Discord REST server and the crawler running against it."""
+import asyncio
+
+import aiohttp
+
+from benchmarks.mock_discord import HISTORY_ROUTE, MOCK_TOKEN, MockDiscord
+from benchmarks.synthetic import FakeInteraction, GuildSpec, build_guild
+from python.cogs.haystack_cog import Haystackfs
+from python.models.query import Query
+from python.search.budget import SearchBudget
+from python.search.discord_searcher import DiscordSearcher
+
+
+def small_guild(**kwargs):
+    spec = dict(text_channels=3, forum_channels=0, messages_per_channel=250, unreadable_ratio=0.0)
+    spec.update(kwargs)
+    return build_guild(GuildSpec(**spec))
+
+
+def test_rate_limit_headers_and_429s():
+    async def go():
+        guild = small_guild(text_channels=1)
+        channel_id = guild.text_channels[0].id
+        async with MockDiscord(guild, route_limit=2, route_window=30, global_limit=None) as server:
+            url = f"{server.base_url}/channels/{channel_id}/messages?limit=100"
+            async with aiohttp.ClientSession(headers={"Authorization": f"Bot {MOCK_TOKEN}"}) as session:
+                async with session.get(url) as response:
+                    assert response.status == 200
+                    assert response.headers["Content-Type"] == "application/json"
+                    assert response.headers["X-RateLimit-Limit"] == "2"
+                    assert response.headers["X-RateLimit-Remaining"] == "1"
+                    assert float(response.headers["X-RateLimit-Reset-After"]) > 29
+                    bucket = response.headers["X-RateLimit-Bucket"]
+                    assert len(await response.json()) == 100
+                async with session.get(url) as response:
+                    assert response.headers["X-RateLimit-Remaining"] == "0"
+                    assert response.headers["X-RateLimit-Bucket"] == bucket
+                async with session.get(url) as response:
+                    assert response.status == 429
+                    assert response.headers["Via"]
+                    body = await response.json()
+                    assert body["global"] is False and body["retry_after"] > 29
+            async with aiohttp.ClientSession() as session:
+                async with session.get(url) as response:
+                    assert response.status == 401
+        assert server.stats["429_route"] == 1
+    asyncio.run(go())
+
+
+def test_search_over_http_matches_in_process_search_despite_429s():
+    guild = small_guild()
+    # Fewer matches than a page, so every channel is crawled to the end.
+    query = lambda: Query(filetype="zip")  # noqa: E731
+    expected = asyncio.run(DiscordSearcher().search(
+        onii_chans=guild.searchable_channels, query=query(), readable=True, budget=SearchBudget(None, None, None)
+    ))
+
+    async def go():
+        # The headers advertise more than is enforced, and the global limit is
+        # tight, so discord.py gets both kinds of 429 and has to retry.
+        server = MockDiscord(guild, route_limit=2, route_window=0.2, advertised_limit=10,
+                             global_limit=4, global_window=0.2)
+        async with server, server.client() as bot:
+            found = await DiscordSearcher().search(
+                onii_chans=bot.readable_channels(), query=query(), readable=True,
+                budget=SearchBudget(None, None, None),
+            )
+        return found, server.stats
+    found, stats = asyncio.run(go())
+    assert 0 < len(expected.files) < 25
+    assert sorted(f.objectId for f in found.files) == sorted(f.objectId for f in expected.files)
+    assert stats[HISTORY_ROUTE] == 9
+    assert stats["429_route"] > 0 and stats["429_global"] > 0
+
+
+def test_delete_removes_messages_through_the_cog():
+    async def go():
+        guild = small_guild(text_channels=1)
+        channel = guild.text_channels[0]
+        before = len(channel.messages)
+        async with MockDiscord(guild) as server, server.client() as bot:
+            cog = Haystackfs(bot, DiscordSearcher())
+            interaction = FakeInteraction(None, bot.get_channel(channel.id), guild.me)
+            located = await cog.locate(interaction=interaction, query=Query())
+            deleted = await cog.delete_files(located.files)
+            # Already gone: Discord's 404 is skipped.
+            assert await cog.delete_files(located.files) == []
+        # A message's other files go with it, so only its first file is reported.
+        messages = {f.message_id for f in located.files}
+        assert len(deleted) == len(messages)
+        assert len(channel.messages) == before - len(messages)
+        assert server.stats["deleted"] == len(messages)
+    asyncio.run(go())
@@ -0,0 +1,101 @@
+"""Tests for versioned pagination rows shared by several processes."""
+import asyncio
+import json
+import sqlite3
+
+import python.views.pagination_callbacks as pagination_callbacks
+from benchmarks.clicks import FakeClickClient, FakeClickInteraction, seed_row, stub_fsearch
+from python.persistence.pagination_store import PaginationStore
+from python.views.pagination_callbacks import handle_back_click, handle_next_click
+
+
+def test_unversioned_database_is_migrated(tmp_path):
+    path = str(tmp_path / "pagination.sqlite3")
+    db = sqlite3.connect(path)
+    db.execute(
+        "CREATE TABLE pagination_rows (row_id TEXT PRIMARY KEY, message_id INTEGER, channel_id INTEGER NOT NULL, "
+        "guild_id INTEGER, user_id INTEGER NOT NULL, query_json TEXT NOT NULL, pages_json TEXT NOT NULL, "
+        "current_page INTEGER NOT NULL DEFAULT 1, last_page INTEGER NOT NULL DEFAULT -1, "
+        "created_at INTEGER NOT NULL, updated_at INTEGER NOT NULL)"
+    )
+    db.execute("INSERT INTO pagination_rows VALUES ('old', 5, 1, NULL, 1, '{}', '{}', 1, -1, 0, 0)")
+    db.commit()
+    db.close()
+
+    async def go():
+        store = PaginationStore(path)
+        await store.init()
+        try:
+            assert (await store.load("old"))["version"] == 0
+            assert await store.update("old", pages_json="{}", current_page=2, last_page=-1, query_json="{}",
+                                      expected_version=0)
+            assert (await store.load("old"))["version"] == 1
+        finally:
+            await store.close()
+        # Opening it again doesn't migrate twice.
+        store = PaginationStore(path)
+        await store.init()
+        await store.close()
+    asyncio.run(go())
+
+
+def test_stale_update_is_rejected_without_side_effects(tmp_path):
+    async def go():
+        store = PaginationStore(str(tmp_path / "pagination.sqlite3"))
+        await store.init()
+        try:
+            row_id = await store.create(user_id=1, channel_id=2, guild_id=3, query_json="{}", pages_json="{}")
+            kwargs = dict(pages_json="{}", current_page=2, last_page=-1, query_json="{}")
+            assert await store.update(row_id, expected_version=0, **kwargs)
+            assert not await store.update(row_id, expected_version=0, add_refs=[42], **kwargs)
+            assert await store.rows_referencing([42]) == []
+            assert not await store.delete(row_id, expected_version=0)
+            assert await store.load(row_id) is not None
+            assert await store.delete(row_id, expected_version=1)
+        finally:
+            await store.close()
+    asyncio.run(go())
+
+
+def test_concurrent_clicks_from_two_processes_both_land(tmp_path, monkeypatch):
+    monkeypatch.setattr(pagination_callbacks, "fsearch", stub_fsearch(latency=0.05))
+    path = str(tmp_path / "pagination.sqlite3")
+
+    async def go():
+        first, second = PaginationStore(path), PaginationStore(path)
+        await first.init()
+        await second.init()
+        try:
+            client_a, client_b = FakeClickClient(first), FakeClickClient(second)
+            row_id, message = await seed_row(first, client_a, message_id=10)
+            # Each process has its own lock registry, so both read version 0.
+            await asyncio.gather(
+                handle_next_click(FakeClickInteraction(client_a, message, 1), row_id),
+                handle_next_click(FakeClickInteraction(client_b, message, 1), row_id),
+            )
+            row = await first.load(row_id)
+            assert row["current_page"] == 3
+            assert sorted(json.loads(row["pages_json"]), key=int) == ["1", "2", "3"]
+            assert row["version"] == 2
+
+            await asyncio.gather(
+                handle_back_click(FakeClickInteraction(client_a, message, 1), row_id),
+                handle_back_click(FakeClickInteraction(client_b, message, 1), row_id),
+            )
+            assert (await second.load(row_id))["current_page"] == 1
+        finally:
+            await first.close()
+            await second.close()
+    asyncio.run(go())
+
+
+def test_lock_cache_is_bounded_and_keeps_held_locks(tmp_path):
+    async def go():
+        store = PaginationStore(str(tmp_path / "pagination.sqlite3"), lock_cache_size=4)
+        held = await store.lock_for("held")
+        async with held:
+            for n in range(10):
+                await store.lock_for(f"row{n}")
+            assert len(store._locks) == 4
+            assert store._locks["held"] is held
+    asyncio.run(go())
@@ -0,0 +1,111 @@
+"""Tests for PaginationStore's reverse index from file messages to rows, and its sharded form."""
+import asyncio
+import json
+from types import SimpleNamespace
+
+import python.views.pagination_callbacks as pagination_callbacks
+from benchmarks.clicks import FakeClickClient, FakeClickInteraction, seed_row, stub_fsearch
+from python.messages import FILES_DELETED_KEEP_LOOKING
+from python.persistence.pagination_store import PaginationStore
+from python.persistence.sharded_pagination_store import ShardedPaginationStore
+
+
+def _run(tmp_path, body):
+    async def go():
+        store = PaginationStore(str(tmp_path / "pagination.sqlite3"))
+        await store.init()
+        try:
+            return await body(store)
+        finally:
+            await store.close()
+    return asyncio.run(go())
+
+
+async def _create(store, refs):
+    return await store.create(
+        user_id=1, channel_id=2, guild_id=3, query_json="{}", pages_json="{}", add_refs=refs,
+    )
+
+
+def test_rows_referencing_finds_only_rows_showing_the_message(tmp_path):
+    async def body(store):
+        a = await _create(store, [100, 101])
+        b = await _create(store, [101, 102])
+        await _create(store, [200])
+        assert {r["row_id"] for r in await store.rows_referencing([101])} == {a, b}
+        assert [r["row_id"] for r in await store.rows_referencing([102, 999])] == [b]
+        assert await store.rows_referencing([]) == []
+    _run(tmp_path, body)
+
+
+def test_update_adds_refs_and_delete_drops_them(tmp_path):
+    async def body(store):
+        row_id = await _create(store, [100])
+        await store.update(row_id, pages_json="{}", current_page=2, last_page=-1, query_json="{}", add_refs=[300])
+        assert [r["row_id"] for r in await store.rows_referencing([300])] == [row_id]
+        await store.delete(row_id)
+        assert await store.rows_referencing([100, 300]) == []
+    _run(tmp_path, body)
+
+
+def test_drop_refs_and_vacuum(tmp_path):
+    async def body(store):
+        row_id = await _create(store, [100, 101])
+        await store.drop_refs([100])
+        assert await store.rows_referencing([100]) == []
+        assert [r["row_id"] for r in await store.rows_referencing([101])] == [row_id]
+        await store.vacuum_old(-1)
+        async with store._db.execute("SELECT COUNT(*) FROM pagination_refs") as cur:
+            assert (await cur.fetchone())[0] == 0
+    _run(tmp_path, body)
+
+
+def test_sharded_store_routes_rows_and_gathers_across_shards(tmp_path):
+    async def go():
+        store = ShardedPaginationStore(str(tmp_path / "pagination.sqlite3"), shards=4)
+        await store.init()
+        try:
+            rows = [await _create(store, [100, n]) for n in range(40)]
+            assert all(len([r for r in rows if store.shard_for(r) is shard]) for shard in store.shards)
+            await store.update(rows[0], pages_json="{}", current_page=2, last_page=-1, query_json="{}")
+            assert (await store.load(rows[0]))["current_page"] == 2
+            assert {r["row_id"] for r in await store.rows_referencing([100])} == set(rows)
+            assert [r["row_id"] for r in await store.rows_referencing([7])] == [rows[7]]
+            await store.drop_refs([100])
+            assert await store.rows_referencing([100]) == []
+            await store.attach_message(rows[1], 555)
+            assert [r["row_id"] for r in await store.iter_active(3600)] == [rows[1]]
+            assert await store.vacuum_old(-1) == 40
+            assert await store.load(rows[1]) is None
+        finally:
+            await store.close()
+    asyncio.run(go())
+    assert sorted(p.name for p in tmp_path.glob("*.sqlite3")) == [f"pagination.{i}.sqlite3" for i in range(4)]
+
+
+def test_pruning_every_file_keeps_a_row_that_can_find_more(tmp_path, monkeypatch):
+    monkeypatch.setattr(pagination_callbacks, "fsearch", stub_fsearch())
+
+    async def body(store):
+        client = FakeClickClient(store)
+        open_id, message = await seed_row(store, client, message_id=10)
+        closed_id, closed_message = await seed_row(store, client, message_id=11)
+        row = await store.load(closed_id)
+        await store.update(closed_id, pages_json=row["pages_json"], current_page=1, last_page=1,
+                           query_json=row["query_json"], expected_version=row["version"])
+        messages = {10: message, 11: closed_message}
+        client.get_partial_messageable = lambda _: SimpleNamespace(get_partial_message=messages.get)
+
+        await pagination_callbacks.prune_deleted_messages(client, range(1000, 1025))
+        assert await store.load(closed_id) is None
+        assert closed_message.content == "All files in this search were deleted."
+        row = await store.load(open_id)
+        assert (row["current_page"], row["last_page"]) == (1, -1)
+        assert json.loads(row["pages_json"])["1"]["files"]["objectId"] == []
+        assert message.embeds[0].description == FILES_DELETED_KEEP_LOOKING
+        assert [c["custom_id"] for r in message.components for c in r.to_dict()["components"]] == \
+            [f"hfs:next:{open_id}"]
+
+        await pagination_callbacks.handle_next_click(FakeClickInteraction(client, message, 1), open_id)
+        assert (await store.load(open_id))["current_page"] == 2
+    _run(tmp_path, body)
@@ -0,0 +1,79 @@
+"""Tests for rendering search results while the search is still running."""
+import asyncio
+
+from benchmarks.synthetic import GuildSpec, build_guild
+from python.messages import SEARCH_RESULTS_FOUND, STILL_SEARCHING
+from python.models.query import Query
+from python.search.budget import SearchBudget
+from python.search.discord_searcher import DiscordSearcher
+from python.search.search_models import SearchResult
+from python.views.progressive_render import ProgressiveRender
+
+
+class _Message:
+
+    def __init__(self, edit_seconds=0.0):
+        self.edit_seconds = edit_seconds
+        self.edits = []
+
+    async def edit(self, **kwargs):
+        await asyncio.sleep(self.edit_seconds)
+        self.edits.append(kwargs["embed"])
+
+
+def _file(n):
+    return SearchResult(
+        objectId=n, author_id=1, channel_id=1, message_id=n, guild_id=1,
+        filename=f"file{n}.png", content_type="image/png", created_at=0, content="",
+    )
+
+
+def test_updates_within_an_interval_coalesce_into_one_edit():
+    async def run():
+        message = _Message()
+        render = ProgressiveRender(message, "bot", "", interval=0.2)
+        render.update([_file(1)])
+        await asyncio.sleep(0.05)
+        for n in range(2, 10):
+            render.update([_file(i) for i in range(1, n + 1)])
+        await asyncio.sleep(0.3)
+        await render.close()
+        return message
+
+    message = asyncio.run(run())
+    # The first batch straight away, then the latest snapshot once.
+    assert len(message.edits) == 2
+    assert message.edits[-1].title.startswith(SEARCH_RESULTS_FOUND.format(9))
+    assert message.edits[-1].description == STILL_SEARCHING
+
+
+def test_close_drops_pending_updates_and_waits_for_an_edit_in_flight():
+    async def run():
+        message = _Message(edit_seconds=0.1)
+        render = ProgressiveRender(message, "bot", "", interval=10)
+        render.update([_file(1)])
+        await asyncio.sleep(0.01)
+        render.update([_file(1), _file(2)])
+        await render.close()
+        edits_at_close = len(message.edits)
+        render.update([_file(3)])
+        await asyncio.sleep(0.05)
+        return edits_at_close, message
+
+    edits_at_close, message = asyncio.run(run())
+    assert edits_at_close == 1
+    assert len(message.edits) == 1
+
+
+def test_search_reports_progress_before_it_finishes():
+    guild = build_guild(GuildSpec(text_channels=4, forum_channels=0, threads_per_forum=0,
+                                  messages_per_channel=300, unreadable_ratio=0.0))
+    snapshots = []
+
+    result = asyncio.run(DiscordSearcher().search(
+        onii_chans=guild.searchable_channels, bot_user=guild.me, query=Query(),
+        budget=SearchBudget(None, None, None), on_progress=snapshots.append,
+    ))
+    assert snapshots
+    assert all(0 < len(s) <= len(result.files) for s in snapshots)
+    assert {f.objectId for f in snapshots[-1]} == {f.objectId for f in result.files}
@@ -122,13 +122,21 @@ def test_roundtrip_preserves_simple_fields():
 def test_roundtrip_channel_date_map():
     q = Query()
     q.channel_date_map = {
-        "12345": datetime(2026, 4, 1, 12, 0, 0),
-        "67890": datetime(2026, 4, 2, 8, 30, 0),
+        12345: 1223832286146252801,
+        67890: 1224181600231092225,
     }
     rehydrated = Query.from_json(q.to_json(), bot=_FakeBot())
     assert rehydrated.channel_date_map == q.channel_date_map
 
 
+def test_legacy_datetime_cursors_become_snowflakes():
+    blob = Query().to_json().replace(
+        '"channel_date_map": null', '"channel_date_map": {"12345": "2015-01-01T00:00:01+00:00"}'
+    )
+    rehydrated = Query.from_json(blob, bot=_FakeBot())
+    assert rehydrated.channel_date_map == {12345: 1000 << 22}
+
+
 def test_roundtrip_empty_query():
     q = Query()
     rehydrated = Query.from_json(q.to_json(), bot=_FakeBot())
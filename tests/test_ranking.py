@@ -0,0 +1,141 @@
+"""Tests for over-scan top-k ranking."""
+import asyncio
+import json
+from types import SimpleNamespace
+
+from thefuzz import fuzz
+
+import python.views.pagination_callbacks as pagination_callbacks
+from benchmarks.clicks import FakeClickClient, FakeClickInteraction, seed_row, synthetic_page
+from benchmarks.synthetic import FakeInteraction, GuildSpec, build_guild
+from python.bot_commands import fsearch
+from python.persistence.pagination_store import PaginationStore
+from python.models.query import Query
+from python.search.budget import SearchBudget
+from python.search.discord_searcher import DiscordSearcher
+from python.search.ranking import FirstK, TopK
+from python.search.scoring import FuzzyScorer
+from python.search.search_models import SearchResult
+
+
+def _result(i, filename):
+    return SearchResult(
+        objectId=i, author_id=1, channel_id=2, message_id=i, guild_id=3, filename=filename,
+        content_type="application/pdf", created_at=0, content="",
+    )
+
+
+def test_top_k_keeps_the_best_in_arrival_order_on_ties():
+    top = TopK(3, ("report", "filename"), overscan=10, stop_score=100)
+    for i, score in enumerate([50, 90, 70, 90, 10, 95]):
+        top.offer(_result(i, str(i)), score)
+    top.offer(_result(1, "1"), 100)  # already seen
+    assert [f.objectId for f in top.results()] == [5, 1, 3]
+    assert [f.objectId for f in top.remainder()] == [2, 0, 4]
+    assert top.scanned == 6 and top.remaining == 4
+    assert not top.full
+
+
+def test_top_k_stops_at_overscan_or_a_page_of_good_matches():
+    top = TopK(2, ("report", "filename"), overscan=4, stop_score=90)
+    top.offer(_result(1, "a"), 95)
+    top.offer(_result(2, "b"), 80)
+    assert not top.full
+    top.offer(_result(3, "c"), 92)
+    assert top.full
+    first = FirstK(2)
+    first.offer(_result(1, "a"))
+    first.offer(_result(1, "a"))
+    assert not first.full and first.remaining == 1
+
+
+def test_match_scored_pairs_matches_with_ratio():
+    files = [_result(1, "report.pdf"), _result(2, "holiday.png"), _result(3, "Quarterly_Report.pdf")]
+    query = Query(filename="report")
+    scored = asyncio.run(FuzzyScorer().match_scored(query, 85, files, "report", "filename"))
+    assert [(f.objectId, s) for f, s in scored] == [
+        (1, fuzz.ratio("report", "report.pdf")), (3, fuzz.ratio("report", "Quarterly_Report.pdf")),
+    ]
+
+
+def test_overscan_improves_relevance():
+    guild = build_guild(GuildSpec(text_channels=4, forum_channels=0, messages_per_channel=600,
+                                  unreadable_ratio=0.0))
+
+    async def go(overscan):
+        searcher = DiscordSearcher(overscan=overscan)
+        result = await searcher.search(onii_chans=guild.searchable_channels, bot_user=guild.me,
+                                       query=Query(filename="report"))
+        return [fuzz.ratio("report", f.filename) for f in result.files]
+
+    unranked, ranked = asyncio.run(go(25)), asyncio.run(go(2000))
+    assert len(ranked) == 25
+    assert ranked == sorted(ranked, reverse=True)
+    assert sum(ranked) > sum(unranked)
+
+
+def test_ranked_pages_and_their_remainder_skip_no_match():
+    guild = build_guild(GuildSpec(text_channels=4, forum_channels=0, messages_per_channel=600,
+                                  unreadable_ratio=0.0))
+
+    async def every_match(overscan):
+        searcher = DiscordSearcher(overscan=overscan)
+        query = Query(filename="report")
+        found = []
+        while True:
+            result = await searcher.search(onii_chans=guild.searchable_channels, bot_user=guild.me, query=query,
+                                           budget=SearchBudget(None, None, None))
+            found += [f.objectId for f in result.files + (result.remainder or [])]
+            if not result.channel_date_map:
+                return found
+            query.channel_date_map = result.channel_date_map
+
+    unranked, ranked = asyncio.run(every_match(25)), asyncio.run(every_match(100))
+    assert len(unranked) > 100
+    assert len(ranked) == len(set(ranked))
+    assert sorted(ranked) == sorted(unranked)
+
+
+def test_cache_hits_keep_the_remainder():
+    guild = build_guild(GuildSpec(text_channels=4, forum_channels=0, messages_per_channel=600,
+                                  unreadable_ratio=0.0))
+    searcher = DiscordSearcher(overscan=100)
+    interaction = FakeInteraction(guild, guild.text_channels[0], guild.members[0])
+
+    async def go():
+        return await fsearch(interaction=interaction, search_client=searcher, query=Query(filename="report"))
+
+    searched, cached = asyncio.run(go()), asyncio.run(go())
+    assert searched.remainder and not searched.partial
+    assert [f.objectId for f in cached.remainder] == [f.objectId for f in searched.remainder]
+    cached.remainder.clear()
+    assert asyncio.run(go()).remainder
+
+
+def test_next_shows_the_remainder_before_searching_again(tmp_path, monkeypatch):
+    searches = []
+
+    async def fsearch(interaction, search_client, query, on_progress=None):
+        searches.append(query.channel_date_map)
+        results = synthetic_page(2)
+        results.remainder = synthetic_page(3, files=30).files
+        return results
+    monkeypatch.setattr(pagination_callbacks, "fsearch", fsearch)
+
+    async def go():
+        store = PaginationStore(str(tmp_path / "pagination.sqlite3"))
+        await store.init()
+        try:
+            client = FakeClickClient(store, SimpleNamespace(search_result_limit=25))
+            row_id, message = await seed_row(store, client, message_id=10)
+            for _ in range(4):
+                await pagination_callbacks.handle_next_click(FakeClickInteraction(client, message, 1), row_id)
+            row = await store.load(row_id)
+            pages = json.loads(row["pages_json"])
+            assert (row["current_page"], row["last_page"]) == (4, 4)
+            assert [len(pages[str(n)]["files"]["objectId"]) for n in range(1, 5)] == [25, 25, 25, 5]
+            assert await store.rows_referencing([3029]) != []
+        finally:
+            await store.close()
+    asyncio.run(go())
+    assert len(searches) == 1
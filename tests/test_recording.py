@@ -0,0 +1,70 @@
+"""Tests for recording searches as benchmark fixtures."""
+import asyncio
+import os
+
+from benchmarks.fixtures import load_fixture
+from benchmarks.synthetic import FakeInteraction, GuildSpec, build_guild
+from python.bot_commands import fsearch
+from python.models.query import Query
+from python.search.recording import RecordingSearcher
+
+
+def test_fsearch_through_the_recorder_writes_a_replayable_fixture(tmp_path):
+    guild = build_guild(GuildSpec(text_channels=2, forum_channels=0, messages_per_channel=150, unreadable_ratio=0.0))
+    searcher = RecordingSearcher(str(tmp_path))
+    interaction = FakeInteraction(guild, guild.text_channels[0], guild.members[0])
+
+    found = asyncio.run(fsearch(interaction=interaction, search_client=searcher, query=Query()))
+    assert found.files
+
+    path = searcher.recorder.fixture_path(guild.id)
+    assert os.path.exists(path)
+    replayed = load_fixture(path)
+    expected = asyncio.run(fsearch(
+        interaction=FakeInteraction(replayed, replayed.text_channels[0], replayed.members[0]),
+        search_client=RecordingSearcher(str(tmp_path / "again")),
+        query=Query(),
+    ))
+    assert [f.objectId for f in expected.files] == [f.objectId for f in found.files]
+
+
+def test_progress_reaches_the_caller_through_the_recorder(tmp_path):
+    guild = build_guild(GuildSpec(text_channels=3, forum_channels=0, messages_per_channel=150, unreadable_ratio=0.0))
+    interaction = FakeInteraction(guild, guild.text_channels[0], guild.members[0])
+    progress = []
+
+    found = asyncio.run(fsearch(
+        interaction=interaction,
+        search_client=RecordingSearcher(str(tmp_path)),
+        query=Query(),
+        on_progress=lambda files: progress.append(len(files)),
+    ))
+    assert progress and progress[-1] <= len(found.files)
+
+
+def test_fixtures_are_saved_at_most_every_interval(tmp_path):
+    guild = build_guild(GuildSpec(text_channels=2, forum_channels=0, messages_per_channel=150, unreadable_ratio=0.0))
+    searcher = RecordingSearcher(str(tmp_path), save_interval=3600)
+    interaction = FakeInteraction(guild, guild.text_channels[0], guild.members[0])
+
+    asyncio.run(fsearch(interaction=interaction, search_client=searcher, query=Query()))
+    path = searcher.recorder.fixture_path(guild.id)
+    os.remove(path)
+    asyncio.run(fsearch(interaction=interaction, search_client=searcher, query=Query(filename="report")))
+    assert not os.path.exists(path)
+    assert searcher.recorder.dirty == {guild.id}
+    assert searcher.recorder.save() == [path]
+    assert not searcher.recorder.dirty
+
+
+def test_a_failed_save_is_logged_and_retried(tmp_path, capsys):
+    guild = build_guild(GuildSpec(text_channels=2, forum_channels=0, messages_per_channel=150, unreadable_ratio=0.0))
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    searcher = RecordingSearcher(str(blocker), save_interval=0)
+    interaction = FakeInteraction(guild, guild.text_channels[0], guild.members[0])
+
+    found = asyncio.run(fsearch(interaction=interaction, search_client=searcher, query=Query()))
+    assert found.files
+    assert "[recording] saving fixtures failed" in capsys.readouterr().out
+    assert searcher.recorder.dirty == {guild.id}
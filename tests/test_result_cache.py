@@ -0,0 +1,91 @@
+"""Tests for SearchResultCache keying, expiry and invalidation."""
+import types
+
+from python.models.query import Query
+from python.search.result_cache import SearchResultCache
+from python.search.search_models import SearchResults
+
+
+GUILD = 10
+CHANNEL = 20
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _results(n=1):
+    return SearchResults(files=[object()] * n)
+
+
+def test_keys_are_normalized():
+    a = SearchResultCache.key_for(Query(filename="  Report "), GUILD)
+    b = SearchResultCache.key_for(Query(filename="report"), GUILD)
+    assert a == b
+    assert SearchResultCache.key_for(Query(filename="report"), GUILD + 1) != a
+
+
+def test_cursor_queries_are_not_cached():
+    q = Query(filename="report")
+    q.channel_date_map = {"1": None}
+    assert SearchResultCache.key_for(q, GUILD) is None
+
+
+def test_ttl_expiry():
+    clock = _Clock()
+    cache = SearchResultCache(ttl_seconds=10, clock=clock)
+    key = cache.key_for(Query(filename="report"), GUILD)
+    cache.put(key, _results())
+    clock.now = 5
+    assert cache.get(key) is not None
+    clock.now = 11
+    assert cache.get(key) is None
+    assert len(cache) == 0
+
+
+def test_size_cap_evicts_least_recently_used():
+    cache = SearchResultCache(max_entries=2)
+    keys = [cache.key_for(Query(filename=name), GUILD) for name in ("a", "b", "c")]
+    cache.put(keys[0], _results())
+    cache.put(keys[1], _results())
+    cache.get(keys[0])
+    cache.put(keys[2], _results())
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[2]) is not None
+
+
+def test_channel_invalidation_spares_other_channel_scoped_entries():
+    cache = SearchResultCache()
+    other = types.SimpleNamespace(id=CHANNEL + 1)
+    guild_wide = cache.key_for(Query(filename="a"), GUILD)
+    this_channel = cache.key_for(Query(filename="a", channel=types.SimpleNamespace(id=CHANNEL)), GUILD)
+    other_channel = cache.key_for(Query(filename="a", channel=other), GUILD)
+    for key in (guild_wide, this_channel, other_channel):
+        cache.put(key, _results())
+
+    assert cache.invalidate_channel(GUILD, CHANNEL) == 2
+    assert cache.get(guild_wide) is None
+    assert cache.get(this_channel) is None
+    assert cache.get(other_channel) is not None
+
+
+def test_put_after_invalidation_is_dropped():
+    cache = SearchResultCache()
+    key = cache.key_for(Query(filename="a"), GUILD)
+    generation = cache.generation(GUILD)
+    cache.invalidate_channel(GUILD, CHANNEL)
+    cache.put(key, _results(), generation=generation)
+    assert cache.get(key) is None
+
+
+def test_returned_results_are_copies():
+    cache = SearchResultCache()
+    key = cache.key_for(Query(filename="a"), GUILD)
+    cache.put(key, _results(2))
+    cache.get(key).files.clear()
+    assert len(cache.get(key).files) == 2
@@ -0,0 +1,88 @@
+"""Tests for the on-demand sampling profiler."""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from python.diagnostics.sampling_profiler import ProfileAlreadyRunning, SamplingProfiler
+
+
+def _spin(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+async def _busy(rounds):
+    for _ in range(rounds):
+        _spin(0.01)
+        await asyncio.sleep(0)
+
+
+def test_samples_are_attributed_to_the_running_task():
+    async def go():
+        profiler = SamplingProfiler(interval=0.002, max_overhead=0.5)
+        profiler.start()
+        try:
+            await asyncio.gather(
+                asyncio.create_task(_busy(20), name="crawler"),
+                asyncio.create_task(_busy(20)),
+            )
+            await asyncio.sleep(0.05)
+        finally:
+            profiler.stop()
+        return profiler
+
+    profiler = asyncio.run(go())
+    lines = profiler.collapsed().splitlines()
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+    roots = {line.split(";", 1)[0] for line in lines}
+    assert {"task:crawler", "task:_busy", "<idle>"} <= roots
+    assert any(line.startswith("task:crawler;") and "_spin (tests/test_sampling_profiler.py" in line for line in lines)
+    assert "task:crawler" in profiler.report()
+
+
+def test_other_threads_are_sampled_when_asked():
+    async def go():
+        profiler = SamplingProfiler(interval=0.002, max_overhead=0.5, all_threads=True)
+        worker = threading.Thread(target=_spin, args=(0.2,), name="worker")
+        worker.start()
+        await profiler.run(0.1)
+        worker.join()
+        return profiler
+
+    assert "thread:worker;" in asyncio.run(go()).collapsed()
+
+
+def test_only_one_profile_runs_at_a_time():
+    async def go():
+        first = SamplingProfiler()
+        first.start()
+        try:
+            with pytest.raises(ProfileAlreadyRunning):
+                SamplingProfiler().start()
+        finally:
+            first.stop()
+        await SamplingProfiler().run(0.01)
+    asyncio.run(go())
+
+
+def test_sampling_slows_down_to_stay_under_the_overhead_cap():
+    async def deep(n):
+        if n:
+            return await deep(n - 1)
+        _spin(0.3)
+
+    async def go():
+        profiler = SamplingProfiler(interval=0.0001, max_overhead=0.01)
+        profiler.start()
+        try:
+            await deep(200)
+        finally:
+            profiler.stop()
+        return profiler
+
+    profiler = asyncio.run(go())
+    assert profiler.samples > 0
+    assert profiler.overhead < 0.03
@@ -0,0 +1,51 @@
+"""Tests for batched fuzzy scoring, inline and in the process pool."""
+import asyncio
+
+from thefuzz import fuzz
+
+from python.models.query import Query
+from python.search.scoring import FuzzyScorer
+from python.search.search_models import SearchResult
+
+
+def _result(i, filename, content=""):
+    return SearchResult(
+        objectId=i, author_id=1, channel_id=2, message_id=i, guild_id=3, filename=filename,
+        content_type="application/pdf", created_at=0, content=content,
+    )
+
+
+FILES = [
+    _result(1, "Quarterly_Report.pdf", "here are the numbers"),
+    _result(2, "holiday.png", "quarterly report attached"),
+    _result(3, "report-final.pdf", "final\x00version"),
+    _result(4, "notes.txt", None),
+]
+
+
+def _match(scorer, query):
+    return asyncio.run(scorer.match(query, 85, FILES))
+
+
+def test_batch_match_agrees_with_match_fuzzy():
+    scorer = FuzzyScorer(offload_chars=10**9)
+    for query in (Query(filename="report"), Query(content="quarterly report"), Query(custom_filetype="PDF"),
+                  Query(filename="report", content="final version"), Query()):
+        expected = [f for f in FILES if f.match_fuzzy(query, 85)]
+        assert _match(scorer, query) == expected
+    assert scorer.offloaded_batches == 0
+
+
+def test_rank_sorts_by_ratio_and_is_stable():
+    scorer = FuzzyScorer(offload_chars=10**9)
+    ranked = asyncio.run(scorer.rank("report", FILES, "filename"))
+    assert ranked == sorted(FILES, reverse=True, key=lambda f: fuzz.ratio("report", f.filename))
+
+
+def test_large_batches_go_to_the_pool():
+    scorer = FuzzyScorer(offload_chars=0, max_workers=1)
+    try:
+        assert _match(scorer, Query(filename="report")) == [f for f in FILES if f.match_fuzzy(Query(filename="report"), 85)]
+        assert scorer.offloaded_batches == 1
+    finally:
+        scorer.close()
@@ -0,0 +1,131 @@
+"""Tests for deadline- and budget-bounded searches and their cursors."""
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import python.views.pagination_callbacks as pagination_callbacks
+from benchmarks.clicks import FakeClickClient, FakeClickInteraction, FakeResultsMessage, synthetic_page
+from benchmarks.synthetic import FakeInteraction, GuildSpec, build_guild
+from python.bot_commands import fsearch
+from python.cogs.haystack_cog import Haystackfs
+from python.messages import PARTIAL_RESULTS
+from python.models.query import Query
+from python.persistence.pagination_store import PaginationStore
+from python.search.budget import SearchBudget
+from python.search.discord_searcher import DiscordSearcher
+
+
+def _guild(**kwargs):
+    spec = dict(text_channels=3, forum_channels=1, threads_per_forum=2, messages_per_channel=400,
+                unreadable_ratio=0.0)
+    spec.update(kwargs)
+    return build_guild(GuildSpec(**spec))
+
+
+def _every_file(guild, extension=""):
+    return {
+        a.id for c in guild.searchable_channels for m in c.messages for a in m.attachments
+        if a.filename.endswith(extension)
+    }
+
+
+async def _paginate(searcher, guild, make_budget, make_query=Query, pages=200):
+    seen, partial = [], 0
+    query = make_query()
+    for _ in range(pages):
+        result = await searcher.search(onii_chans=guild.searchable_channels, bot_user=guild.me,
+                                       query=query, budget=make_budget())
+        seen += [f.objectId for f in result.files]
+        partial += result.partial
+        if not result.channel_date_map:
+            return seen, partial
+        query = make_query()
+        query.channel_date_map = result.channel_date_map
+    raise AssertionError("pagination did not finish")
+
+
+def test_pages_cover_every_file_exactly_once():
+    guild = _guild()
+    seen, partial = asyncio.run(_paginate(DiscordSearcher(), guild, lambda: SearchBudget(None, None, None)))
+    assert len(seen) == len(set(seen))
+    assert set(seen) == _every_file(guild)
+    assert partial == 0
+
+
+def test_request_budget_returns_partial_pages_that_resume():
+    guild = _guild()
+    seen, partial = asyncio.run(_paginate(
+        DiscordSearcher(), guild, lambda: SearchBudget(None, None, 2), lambda: Query(custom_filetype="wav"),
+    ))
+    assert len(seen) == len(set(seen))
+    assert set(seen) == _every_file(guild, ".wav")
+    assert partial > 0
+
+
+def test_budget_caps_requests():
+    guild = _guild()
+
+    async def go():
+        result = await DiscordSearcher().search(onii_chans=guild.searchable_channels, bot_user=guild.me,
+                                                query=Query(filename="zzzz-no-match"),
+                                                budget=SearchBudget(None, None, 3))
+        return result, sum(c.requests for c in guild.searchable_channels)
+
+    result, requests = asyncio.run(go())
+    assert requests == 3
+    assert result.partial and not result.files
+    assert set(result.channel_date_map) == {c.id for c in guild.searchable_channels}
+
+
+def test_a_first_search_that_found_nothing_yet_can_be_continued(tmp_path, monkeypatch):
+    async def next_page(interaction, search_client, query, on_progress=None):
+        assert query.channel_date_map
+        return synthetic_page(2)
+
+    monkeypatch.setattr(pagination_callbacks, "fsearch", next_page)
+    guild = _guild()
+    searcher = DiscordSearcher()
+    searcher.max_requests = 3
+
+    async def go():
+        store = PaginationStore(str(tmp_path / "pagination.sqlite3"))
+        await store.init()
+        try:
+            client = FakeClickClient(store, searcher)
+            interaction = FakeInteraction(guild, guild.text_channels[0], SimpleNamespace(id=1, mention="<@1>"))
+            results = await fsearch(interaction, searcher, Query(filename="zzzz-no-match"))
+            assert results.partial and not results.files
+
+            message = FakeResultsMessage(10, {"embed": {}, "components": []})
+            cog = Haystackfs(client, searcher)
+            await cog.send_files_as_message(interaction, None, message, False, results, Query(filename="zzzz-no-match"))
+            assert message.embeds[0].description == PARTIAL_RESULTS
+            [next_button] = [c for r in message.components for c in r.to_dict()["components"]]
+            row_id = next_button["custom_id"].split(":")[-1]
+            row = await store.load(row_id)
+            assert row["last_page"] == -1 and row["message_id"] == 10
+            assert json.loads(row["query_json"])["channel_date_map"] == \
+                {str(k): v for k, v in results.channel_date_map.items()}
+
+            await pagination_callbacks.handle_next_click(FakeClickInteraction(client, message, 1), row_id)
+            row = await store.load(row_id)
+            assert row["current_page"] == 2 and json.loads(row["pages_json"])["2"]["files"]["objectId"]
+        finally:
+            await store.close()
+    asyncio.run(go())
+
+
+def test_deadline_stops_a_slow_search():
+    guild = _guild(latency=5.0)
+
+    async def go():
+        start = time.monotonic()
+        result = await DiscordSearcher().search(onii_chans=guild.searchable_channels, bot_user=guild.me,
+                                                query=Query(), budget=SearchBudget(0.1, None, None))
+        return result, time.monotonic() - start
+
+    result, elapsed = asyncio.run(go())
+    assert elapsed < 3
+    assert result.partial
+    assert len(result.channel_date_map) == len(guild.searchable_channels)
@@ -0,0 +1,101 @@
+"""Tests for the compact SearchResult record and columnar page serialization."""
+import json
+from datetime import datetime
+
+from python.models.query import Query
+from python.search.search_models import SearchResult, SearchResults
+
+
+def _result(i=1, **overrides):
+    fields = dict(
+        objectId=1000 + i,
+        author_id=7,
+        channel_id=200,
+        message_id=300 + i,
+        guild_id=100,
+        filename=f"report_{i}.pdf",
+        content_type="application/pdf",
+        created_at=1775044800000,  # 2026-04-01T12:00:00Z
+        content="quarterly numbers",
+    )
+    fields.update(overrides)
+    return SearchResult(**fields)
+
+
+def test_derived_fields():
+    r = _result()
+    assert r.filetype == "pdf"
+    assert r.url == "https://cdn.discordapp.com/attachments/200/1001/report_1.pdf"
+    assert r.jump_url == "https://discord.com/channels/100/200/301"
+    assert _result(guild_id=None).jump_url == "https://discord.com/channels/@me/200/301"
+    assert _result(filename="README").filetype == "unknown"
+    assert r.created_datetime == datetime(2026, 4, 1, 12, 0, 0)
+
+
+def test_search_result_is_slotted():
+    r = _result()
+    assert not hasattr(r, "__dict__")
+
+
+def test_columnar_roundtrip_drops_content():
+    results = SearchResults(
+        files=[_result(i) for i in range(3)],
+        channel_date_map={200: 1223832286146252801},
+        partial=True,
+    )
+    blob = json.dumps(results.to_dict())
+    restored = SearchResults.from_dict(json.loads(blob))
+    assert [f.objectId for f in restored.files] == [1000, 1001, 1002]
+    assert restored.files[2] == _result(2, content=None)
+    assert restored.channel_date_map == results.channel_date_map
+    assert restored.partial
+
+
+def test_from_dict_reads_legacy_pages():
+    legacy = {
+        "files": [{
+            "objectId": 1001, "author_id": 7, "content": "quarterly numbers",
+            "filename": "report_1.pdf", "content_type": "application/pdf", "filetype": "pdf",
+            "channel_id": 200, "message_id": 301,
+            "url": "https://cdn.discordapp.com/attachments/200/1001/report_1.pdf",
+            "jump_url": "https://discord.com/channels/100/200/301",
+            "created_at": "2026-04-01T12:00:00+00:00",
+        }],
+        "message": "",
+        "channel_date_map": None,
+    }
+    restored = SearchResults.from_dict(legacy)
+    assert restored.files == [_result(1)]
+
+
+def test_columnar_pages_are_smaller_than_legacy():
+    files = [_result(i) for i in range(25)]
+    legacy = json.dumps({"files": [dict(f.to_dict(), url=f.url, jump_url=f.jump_url, filetype=f.filetype)
+                                   for f in files]})
+    compact = json.dumps(SearchResults(files=files).to_dict())
+    assert len(compact) * 2 < len(legacy)
+
+
+def test_match_query_date_bounds():
+    r = _result()
+    assert r.match_query(Query(after="2026-04-01"), thresh=85)
+    assert r.match_query(Query(before="2026-04-01"), thresh=85)
+    assert not r.match_query(Query(after="2026-04-02"), thresh=85)
+    assert not r.match_query(Query(before="2026-03-31"), thresh=85)
+
+
+def test_filetype_filters_use_categories():
+    png = _result(filename="Photo.PNG", content_type=None)
+    zipped = _result(filename="backup.rar", content_type=None)
+    song = _result(filename="song.mp3", content_type="audio/mpeg")
+    assert png.is_image() and not png.is_audio()
+    assert zipped.is_archive()
+    assert song.is_audio()
+    assert png.match_filters(Query(filetype="image/png"))
+    assert png.match_filters(Query(filetype="image"))
+    assert not png.match_filters(Query(filetype="audio"))
+    assert zipped.match_filters(Query(filetype="zip"))
+    assert not zipped.match_filters(Query(filetype="application/zip"))
+    assert _result().match_filters(Query(filetype="application/pdf"))
+    # Values outside CONTENT_TYPE_CHOICES still match by substring.
+    assert _result(filename="model.stl").match_filters(Query(filetype="stl"))